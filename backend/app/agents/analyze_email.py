@@ -5,41 +5,212 @@ This module handles AI-powered email analysis using OpenRouter API.
 """
 
 import os
+import re
 import json
+import copy
+import asyncio
 import time
-import httpx
-from typing import Dict, Any, Optional
+import openai
+import orjson
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import BaseModel, ConfigDict, ValidationError
 
 # Use absolute imports for testing compatibility
 try:
-    from app.lib.error_handler import handle_ai_errors, AIAnalysisError
+    from app.config.ai_models import ai_model_manager
+    from app.lib.error_handler import (
+        handle_ai_errors,
+        ai_error_for_status,
+        response_excerpt,
+        AIAnalysisError,
+    )
+    from app.lib.http_client import http_client
+    from app.lib.llm_cache import llm_cache, similarity_cache
+    from app.lib.token_bucket import (
+        DEFAULT_COMPLETION_TOKENS,
+        estimate_tokens,
+        openrouter_limiter,
+    )
     from app.monitoring.agent_logger import agent_logger
     from app.agents.prompts import (
-        build_email_analysis_prompt,
+        EMAIL_ANALYSIS_RESPONSE_FORMAT,
+        build_conversation_context,
+        build_email_analysis_messages,
+        build_email_batch_analysis_messages,
         build_org_name_prompt,
         build_danish_summary_prompt,
     )
 except ImportError:
     # Fallback for when running as module
-    from ..lib.error_handler import handle_ai_errors, AIAnalysisError
+    from ..config.ai_models import ai_model_manager
+    from ..lib.error_handler import (
+        handle_ai_errors,
+        ai_error_for_status,
+        response_excerpt,
+        AIAnalysisError,
+    )
+    from ..lib.http_client import http_client
+    from ..lib.llm_cache import llm_cache, similarity_cache
+    from ..lib.token_bucket import (
+        DEFAULT_COMPLETION_TOKENS,
+        estimate_tokens,
+        openrouter_limiter,
+    )
     from ..monitoring.agent_logger import agent_logger
     from .prompts import (
-        build_email_analysis_prompt,
+        EMAIL_ANALYSIS_RESPONSE_FORMAT,
+        build_conversation_context,
+        build_email_analysis_messages,
+        build_email_batch_analysis_messages,
         build_org_name_prompt,
         build_danish_summary_prompt,
     )
 
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Response formats to try for single-email analysis, strictest first; models
+# that reject one with a 400 are retried with the next (None sends no format
+# and relies on the JSON salvage parsing)
+ANALYSIS_RESPONSE_FORMATS = (
+    EMAIL_ANALYSIS_RESPONSE_FORMAT,
+    {"type": "json_object"},
+    None,
+)
+# Error text OpenRouter returns when a model does not support a response format
+_FORMAT_REJECTED_RE = re.compile(
+    r"response_format|json_schema|json_object|structured.output", re.IGNORECASE
+)
+# Stands in for the messages in pre-serialized analysis request bodies
+_MESSAGES_PLACEHOLDER = "__MESSAGES__"
+
+# Number of emails analyzed together in one OpenRouter request
+EMAIL_BATCH_SIZE = 10
+
+# OpenRouter requests an analyzer keeps in flight at once
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "16"))
+
+# OpenAI Batch API settings for discounted offline analysis
+BATCH_API_ENDPOINT = "/v1/chat/completions"
+BATCH_API_COMPLETION_WINDOW = "24h"
+BATCH_API_POLL_SECONDS = 30
+# Longest wait_for_batch_job polls by default, matching the completion window
+BATCH_API_MAX_WAIT_SECONDS = 24 * 60 * 60
+# Batch job states after which results will never change
+BATCH_API_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+# A domain's organization name rarely changes, so it is cached for 30 days
+ORGANIZATION_NAME_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Email domains of personal mail providers, which never name an organization
+PERSONAL_EMAIL_DOMAINS = frozenset(
+    {
+        "gmail",
+        "googlemail",
+        "hotmail",
+        "outlook",
+        "live",
+        "msn",
+        "yahoo",
+        "icloud",
+        "me",
+        "aol",
+        "proton",
+        "protonmail",
+    }
+)
+
+# Decodes the first JSON value in a string and reports where it ended, so
+# prose or code fences after the object are ignored
+_JSON_DECODER = json.JSONDecoder()
+
+# OpenAI client for batch jobs, created on first use
+_batch_client: Optional[openai.AsyncOpenAI] = None
+
+# Index into ANALYSIS_RESPONSE_FORMATS of the strictest format each model
+# accepted, so later requests skip the formats it already rejected
+_accepted_format_index: Dict[str, int] = {}
+
+
+def _load_json_object(content: str) -> Any:
+    """Parse a JSON answer, tolerating text around the object."""
+    # JSON output mode makes the content itself the JSON object
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        start = content.find("{")
+        if start == -1:
+            raise ValueError("No JSON found in response")
+        # One pass from the first brace; braces inside strings or in text
+        # after the object do not confuse it
+        result, _ = _JSON_DECODER.raw_decode(content, start)
+        return result
+
+
+class EmailAnalysis(BaseModel):
+    """Validated AI analysis of one email, with defaults for missing fields."""
+
+    # Keep extra fields such as offering_type that downstream agents read
+    model_config = ConfigDict(extra="allow")
+
+    is_sales_opportunity: bool = False
+    confidence: float = 0.0
+    opportunity_type: str = "other"
+    estimated_value: float = 0
+    currency: str = "DKK"
+    urgency: str = "low"
+    next_action: str = "no_action"
+    person_name: str = ""
+    organization_name: str = ""
+    key_points: List[str] = []
+    # Danish summary used for the Pipedrive note
+    conversation_summary_da: str = ""
+    ai_generated: bool = True
+
+
+# Result used when an AI response cannot be parsed at all
+_DEFAULT_ANALYSIS = EmailAnalysis().model_dump()
+
 
 class EmailAnalyzer:
     """AI-powered email analyzer using OpenRouter API."""
 
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        use_similarity_cache: Optional[bool] = None,
+    ):
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.model = model or os.getenv("AI_MODEL", "openai/gpt-4o-mini")
+        if use_cache is None:
+            use_cache = os.getenv("AI_RESPONSE_CACHE", "true").lower() != "false"
+        self.use_cache = use_cache
+        # Reusing answers for near-duplicate emails is opt-in, since the
+        # reused result keeps the names extracted from the original email
+        if use_similarity_cache is None:
+            use_similarity_cache = (
+                os.getenv("AI_SIMILARITY_CACHE", "false").lower() == "true"
+            )
+        self.use_similarity_cache = use_similarity_cache
 
         if not self.api_key:
             raise ValueError("OpenRouter API key not found")
 
+        # Same headers on every OpenRouter request; the shared client pools
+        # the connections
+        self._headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        self._semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+        # Formats to try in order, each with its request body serialized once
+        # around the messages
+        self._request_templates = tuple(
+            (response_format, *self._request_template(response_format))
+            for response_format in ANALYSIS_RESPONSE_FORMATS
+        )
+
     @handle_ai_errors
     async def analyze_email(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze email content using OpenRouter API."""
@@ -47,40 +218,42 @@ class EmailAnalyzer:
 
         start_time = time.time()
 
-        # Build the analysis prompt
-        prompt = build_email_analysis_prompt(email_data)
-
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.1,
-                    },
-                    timeout=30.0,
-                )
+        # Build the analysis messages (static system prompt + conversation)
+        messages = build_email_analysis_messages(email_data)
+        prompt = "\n".join(message["content"] for message in messages)
+
+        # Identical prompts get identical answers at this temperature
+        cache_key = llm_cache.cache_key(self.model, prompt)
+        if self.use_cache:
+            cached_content = await llm_cache.get(cache_key)
+            if cached_content is not None:
+                result = self._parse_ai_response(cached_content)
+                agent_logger.log_ai_analysis_complete(result, time.time() - start_time)
+                return result
 
-                if response.status_code != 200:
-                    raise AIAnalysisError(
-                        f"OpenRouter API error: {response.status_code} - {response.text}"
-                    )
+        # Templated emails that differ only slightly can share an answer
+        conversation = messages[-1]["content"]
+        if self.use_similarity_cache:
+            cached_content = similarity_cache.get(self.model, conversation)
+            if cached_content is not None:
+                result = self._parse_ai_response(cached_content)
+                agent_logger.log_ai_analysis_complete(result, time.time() - start_time)
+                return result
 
-                data = response.json()
-                content = data["choices"][0]["message"]["content"]
+        try:
+            content = await self._request_analysis_content(messages, prompt)
+            if self.use_cache:
+                await llm_cache.set(cache_key, content)
+            if self.use_similarity_cache:
+                similarity_cache.set(self.model, conversation, content)
 
-                # Parse JSON response
-                result = self._parse_ai_response(content)
+            # Parse JSON response
+            result = self._parse_ai_response(content)
 
-                processing_time = time.time() - start_time
-                agent_logger.log_ai_analysis_complete(result, processing_time)
+            processing_time = time.time() - start_time
+            agent_logger.log_ai_analysis_complete(result, processing_time)
 
-                return result
+            return result
 
         except Exception as e:
             agent_logger.error(
@@ -93,49 +266,412 @@ class EmailAnalyzer:
             )
             raise
 
+    async def _request_analysis_content(
+        self, messages: List[Dict[str, str]], prompt: str
+    ) -> str:
+        """Request a single-email analysis in the strictest format the model accepts."""
+        start = _accepted_format_index.get(self.model, 0)
+        for index in range(start, len(self._request_templates)):
+            response_format, body_prefix, body_suffix = self._request_templates[index]
+            body = body_prefix + orjson.dumps(messages) + body_suffix
+
+            # Wait for rate limit capacity instead of risking a 429
+            await openrouter_limiter.acquire(estimate_tokens(prompt))
+
+            if response_format is None:
+                # Without a JSON format the model may keep writing after the
+                # object, so stream and stop as soon as it is complete
+                _accepted_format_index[self.model] = index
+                return await self._stream_json_content(body)
+
+            response = await http_client.post(
+                OPENROUTER_CHAT_URL,
+                headers=self._headers,
+                content=body,
+                timeout=30.0,
+            )
+
+            # Only a rejected format is worth retrying; other 400s (context
+            # length, bad model id) fail the same way with any format
+            if response.status_code == 400 and _FORMAT_REJECTED_RE.search(
+                response_excerpt(response)
+            ):
+                agent_logger.warning(
+                    "Model rejected response format, retrying with a looser one",
+                    {"model": self.model, "response_format": response_format["type"]},
+                )
+                # Remember the rejection for every later request to this model
+                _accepted_format_index[self.model] = index + 1
+                continue
+
+            if response.status_code != 200:
+                raise ai_error_for_status(
+                    response.status_code,
+                    f"OpenRouter API error: {response.status_code} - "
+                    f"{response_excerpt(response)}",
+                )
+
+            data = orjson.loads(response.content)
+            return data["choices"][0]["message"]["content"]
+
+    def _request_template(
+        self, response_format: Optional[Dict[str, Any]]
+    ) -> Tuple[bytes, bytes]:
+        """Serialize the static analysis request fields, split where the messages go."""
+        request = {
+            "model": self.model,
+            "messages": _MESSAGES_PLACEHOLDER,
+            "temperature": 0.1,
+        }
+        if response_format is None:
+            # Free-form answers are streamed, see _stream_json_content
+            request["stream"] = True
+        else:
+            request["response_format"] = response_format
+
+        prefix, suffix = orjson.dumps(request).split(
+            orjson.dumps(_MESSAGES_PLACEHOLDER)
+        )
+        return prefix, suffix
+
+    async def _stream_json_content(self, body: bytes) -> str:
+        """Stream a completion, returning once it contains a whole JSON object."""
+        parts = []
+        async with http_client.stream(
+            "POST",
+            OPENROUTER_CHAT_URL,
+            headers=self._headers,
+            content=body,
+            timeout=30.0,
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise ai_error_for_status(
+                    response.status_code,
+                    f"OpenRouter API error: {response.status_code} - "
+                    f"{response_excerpt(response)}",
+                )
+
+            async for line in response.aiter_lines():
+                # Chunks arrive as SSE data lines; comment lines are keep-alives
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: ") :]
+                if data == "[DONE]":
+                    break
+
+                chunk = orjson.loads(data)
+                if "error" in chunk:
+                    raise AIAnalysisError(f"OpenRouter stream error: {chunk['error']}")
+
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                parts.append(delta)
+
+                # Leaving the stream closes the connection and stops generation
+                if "}" in delta:
+                    try:
+                        _load_json_object("".join(parts))
+                    except ValueError:
+                        continue
+                    break
+
+        return "".join(parts)
+
+    async def analyze_emails_batch(
+        self, emails: List[Dict[str, Any]], batch_size: int = EMAIL_BATCH_SIZE
+    ) -> List[Dict[str, Any]]:
+        """Analyze several emails with one OpenRouter request per batch."""
+        # Identical emails (e.g. repeated webhook deliveries) are analyzed once
+        unique_emails = []
+        unique_index = {}
+        positions = []
+        for email_data in emails:
+            key = self._dedupe_key(email_data)
+            if key not in unique_index:
+                unique_index[key] = len(unique_emails)
+                unique_emails.append(email_data)
+            positions.append(unique_index[key])
+
+        # Batches are independent, so their requests run concurrently
+        batch_results = await asyncio.gather(
+            *(
+                self._analyze_batch_with_fallback(
+                    unique_emails[start : start + batch_size]
+                )
+                for start in range(0, len(unique_emails), batch_size)
+            )
+        )
+        unique_results = [result for batch in batch_results for result in batch]
+
+        # Duplicates get their own copy so callers can update results independently
+        results = []
+        returned = set()
+        for position in positions:
+            result = unique_results[position]
+            results.append(copy.deepcopy(result) if position in returned else result)
+            returned.add(position)
+
+        return results
+
+    async def _analyze_batch_with_fallback(
+        self, batch: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Analyze one batch, falling back to single requests for missing emails."""
+        try:
+            async with self._semaphore:
+                analyses = await self._analyze_email_batch(batch)
+        except Exception as e:
+            agent_logger.error(
+                "Batched AI analysis failed",
+                {"error": str(e), "batch_size": len(batch)},
+            )
+            analyses = {}
+
+        missing = [index for index in range(1, len(batch) + 1) if index not in analyses]
+        fallback_results = await asyncio.gather(
+            *(self._analyze_email_limited(batch[index - 1]) for index in missing)
+        )
+        analyses.update(zip(missing, fallback_results))
+
+        return [analyses[index] for index in range(1, len(batch) + 1)]
+
+    async def _analyze_email_limited(
+        self, email_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Analyze a single email within the analyzer's concurrency limit."""
+        async with self._semaphore:
+            return await self.analyze_email(email_data)
+
+    @staticmethod
+    def _dedupe_key(email_data: Dict[str, Any]) -> str:
+        """Build a key that is equal for emails with the same conversation."""
+        return " ".join(build_conversation_context(email_data).lower().split())
+
+    @handle_ai_errors
+    async def _analyze_email_batch(
+        self, emails: List[Dict[str, Any]]
+    ) -> Dict[int, Dict[str, Any]]:
+        """Send one batched analysis request and return results by email index."""
+        start_time = time.time()
+        messages = build_email_batch_analysis_messages(emails)
+        prompt = "\n".join(message["content"] for message in messages)
+
+        # Wait for rate limit capacity instead of risking a 429
+        await openrouter_limiter.acquire(
+            estimate_tokens(prompt, DEFAULT_COMPLETION_TOKENS * len(emails))
+        )
+        response = await http_client.post(
+            OPENROUTER_CHAT_URL,
+            headers=self._headers,
+            content=orjson.dumps(
+                {
+                    "model": self.model,
+                    "messages": messages,
+                    "response_format": {"type": "json_object"},
+                    "temperature": 0.1,
+                }
+            ),
+            timeout=60.0,
+        )
+
+        if response.status_code != 200:
+            raise ai_error_for_status(
+                response.status_code,
+                f"OpenRouter API error: {response.status_code} - "
+                f"{response_excerpt(response)}",
+            )
+
+        data = orjson.loads(response.content)
+        content = data["choices"][0]["message"]["content"]
+
+        analyses = self._parse_batch_response(content, len(emails))
+
+        agent_logger.info(
+            "Batched AI analysis completed",
+            {
+                "operation": "ai_batch_analysis",
+                "batch_size": len(emails),
+                "analyses_returned": len(analyses),
+                "processing_time_seconds": time.time() - start_time,
+            },
+        )
+
+        return analyses
+
+    def estimate_analysis_cost(self, emails: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Estimate what analyzing these emails costs before sending any request."""
+        input_tokens = 0
+        for email_data in emails:
+            messages = build_email_analysis_messages(email_data)
+            prompt = "\n".join(message["content"] for message in messages)
+            input_tokens += estimate_tokens(prompt, completion_tokens=0)
+
+        return ai_model_manager.calculate_cost_estimate(
+            self.model, input_tokens, DEFAULT_COMPLETION_TOKENS * len(emails)
+        )
+
+    async def submit_batch_job(self, emails: List[Dict[str, Any]]) -> str:
+        """Submit emails to the OpenAI Batch API for discounted offline analysis."""
+        client = self._get_batch_client()
+        model = self._get_batch_model()
+
+        # One chat completion request per email, matched back by custom_id
+        requests = [
+            orjson.dumps(
+                {
+                    "custom_id": str(email_data["id"]),
+                    "method": "POST",
+                    "url": BATCH_API_ENDPOINT,
+                    "body": {
+                        "model": model,
+                        "messages": build_email_analysis_messages(email_data),
+                        "response_format": EMAIL_ANALYSIS_RESPONSE_FORMAT,
+                        "temperature": 0.1,
+                    },
+                }
+            )
+            for email_data in emails
+        ]
+
+        batch_file = await client.files.create(
+            file=("email_analysis_batch.jsonl", b"\n".join(requests)),
+            purpose="batch",
+        )
+        batch = await client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_API_ENDPOINT,
+            completion_window=BATCH_API_COMPLETION_WINDOW,
+        )
+
+        agent_logger.info(
+            "Batch analysis job submitted",
+            {
+                "operation": "ai_batch_job_submit",
+                "batch_id": batch.id,
+                "email_count": len(emails),
+            },
+        )
+        return batch.id
+
+    async def get_batch_job_results(self, batch_id: str) -> Dict[str, Any]:
+        """Return the status of a batch job and, once completed, results by email id."""
+        client = self._get_batch_client()
+        batch = await client.batches.retrieve(batch_id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            return {"status": batch.status, "results": None}
+
+        output = await client.files.content(batch.output_file_id)
+
+        results = {}
+        for line in output.text.splitlines():
+            if not line:
+                continue
+
+            item = orjson.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                agent_logger.error(
+                    "Batch analysis request failed",
+                    {"custom_id": item.get("custom_id"), "error": item.get("error")},
+                )
+                continue
+
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[item["custom_id"]] = self._parse_ai_response(content)
+
+        return {"status": batch.status, "results": results}
+
+    async def wait_for_batch_job(
+        self,
+        batch_id: str,
+        poll_seconds: float = BATCH_API_POLL_SECONDS,
+        max_wait_seconds: float = BATCH_API_MAX_WAIT_SECONDS,
+    ) -> Dict[str, Any]:
+        """Poll a batch job until it finishes and return its results by email id.
+
+        Raises AIAnalysisError if the job is still running after max_wait_seconds.
+        """
+        deadline = time.monotonic() + max_wait_seconds
+        while True:
+            job = await self.get_batch_job_results(batch_id)
+            if job["status"] in BATCH_API_FINAL_STATUSES:
+                return job
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AIAnalysisError(
+                    f"Batch job {batch_id} did not finish within "
+                    f"{max_wait_seconds} seconds (status: {job['status']})"
+                )
+
+            await asyncio.sleep(min(poll_seconds, remaining))
+
+    def _get_batch_client(self) -> openai.AsyncOpenAI:
+        """Get the client for the OpenAI Batch API (not offered by OpenRouter)."""
+        global _batch_client
+
+        if _batch_client is None:
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OpenAI API key not found")
+
+            # Reuse the shared connection pool instead of a client per call
+            _batch_client = openai.AsyncOpenAI(api_key=api_key, http_client=http_client)
+
+        return _batch_client
+
+    def _get_batch_model(self) -> str:
+        """Translate the configured OpenRouter model id into an OpenAI model id."""
+        provider, _, model = self.model.partition("/")
+        if provider != "openai" or not model:
+            raise ValueError(
+                f"Batch analysis requires an OpenAI model, got {self.model}"
+            )
+
+        return model
+
+    def _parse_batch_response(
+        self, content: str, email_count: int
+    ) -> Dict[int, Dict[str, Any]]:
+        """Parse a batched AI response into results keyed by 1-based email index."""
+        try:
+            analyses = _load_json_object(content).get("analyses", [])
+
+        except (ValueError, AttributeError) as e:
+            agent_logger.error(
+                "Failed to parse batched AI response",
+                {
+                    "error": str(e),
+                    "content": content[:200] + "..." if len(content) > 200 else content,
+                },
+            )
+            return {}
+
+        results = {}
+        for position, analysis in enumerate(analyses, 1):
+            if not isinstance(analysis, dict):
+                continue
+
+            index = analysis.pop("email_index", position)
+            if isinstance(index, int) and 1 <= index <= email_count:
+                results[index] = self._ensure_required_fields(analysis)
+
+        return results
+
     def _parse_ai_response(self, content: str) -> Dict[str, Any]:
         """Parse AI response and ensure all required fields are present."""
         try:
-            # Extract JSON from response
-            start = content.find("{")
-            end = content.rfind("}") + 1
-            if start == -1 or end == 0:
-                raise ValueError("No JSON found in response")
-
-            json_str = content[start:end]
-            result = json.loads(json_str)
-
-            # Ensure all required fields are present
-            required_fields = [
-                "is_sales_opportunity",
-                "confidence",
-                "opportunity_type",
-                "estimated_value",
-                "currency",
-                "urgency",
-                "next_action",
-                "person_name",
-                "organization_name",
-                "key_points",
-                "ai_generated",
-            ]
-
-            for field in required_fields:
-                if field not in result:
-                    if field == "ai_generated":
-                        result[field] = True
-                    elif field == "key_points":
-                        result[field] = []
-                    elif field == "estimated_value":
-                        result[field] = 0
-                    elif field == "currency":
-                        result[field] = "DKK"
-                    else:
-                        result[field] = ""
+            result = _load_json_object(content)
+            if not isinstance(result, dict):
+                raise ValueError("AI response is not a JSON object")
 
-            return result
+            return self._ensure_required_fields(result)
 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             agent_logger.error(
                 "Failed to parse AI response",
                 {
@@ -145,61 +681,84 @@ class EmailAnalyzer:
             )
 
             # Return default result on parsing failure
-            return {
-                "is_sales_opportunity": False,
-                "confidence": 0.0,
-                "opportunity_type": "other",
-                "estimated_value": 0,
-                "currency": "DKK",
-                "urgency": "low",
-                "next_action": "no_action",
-                "person_name": "",
-                "organization_name": "",
-                "key_points": [],
-                "ai_generated": True,
-            }
+            return dict(_DEFAULT_ANALYSIS, key_points=[])
+
+    def _ensure_required_fields(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate an AI result, using defaults for missing or malformed fields."""
+        try:
+            analysis = EmailAnalysis.model_validate(result)
+        except ValidationError as e:
+            # Drop only the fields the model got wrong instead of the whole answer
+            invalid_fields = {error["loc"][0] for error in e.errors() if error["loc"]}
+            agent_logger.warning(
+                "AI result failed validation",
+                {"invalid_fields": sorted(str(field) for field in invalid_fields)},
+            )
+            analysis = EmailAnalysis.model_validate(
+                {
+                    field: value
+                    for field, value in result.items()
+                    if field not in invalid_fields
+                }
+            )
+
+        return analysis.model_dump()
 
     @handle_ai_errors
     async def extract_organization_name(
         self, domain: str, email_content: str
     ) -> Optional[str]:
         """Use AI to suggest a proper organization name from email domain and content."""
+        # Personal mail providers never name an organization
+        if domain.lower().split(".")[0] in PERSONAL_EMAIL_DOMAINS:
+            return None
+
+        # A domain maps to the same organization for every email from it
+        cache_key = llm_cache.cache_key(self.model, f"organization:{domain.lower()}")
+        if self.use_cache:
+            cached_name = await llm_cache.get(cache_key)
+            if cached_name is not None:
+                return cached_name or None
+
         prompt = build_org_name_prompt(domain, email_content)
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
+            # Wait for rate limit capacity instead of risking a 429
+            await openrouter_limiter.acquire(
+                estimate_tokens(prompt, completion_tokens=16)
+            )
+            # Reuse the shared connection pool instead of a client per call
+            response = await http_client.post(
+                OPENROUTER_CHAT_URL,
+                headers=self._headers,
+                content=orjson.dumps(
+                    {
                         "model": self.model,
                         "messages": [{"role": "user", "content": prompt}],
                         "max_tokens": 16,
                         "temperature": 0.2,
-                    },
-                    timeout=15.0,
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    name = data["choices"][0]["message"]["content"].strip()
-
-                    # Filter out personal email providers
-                    if name and name.lower() not in [
-                        "gmail",
-                        "hotmail",
-                        "outlook",
-                        "yahoo",
-                        "icloud",
-                        "live",
-                    ]:
-                        return name
+                    }
+                ),
+                timeout=15.0,
+            )
 
+            if response.status_code != 200:
                 return None
 
+            data = orjson.loads(response.content)
+            name = data["choices"][0]["message"]["content"].strip()
+
+            # Filter out personal email providers
+            if name.lower() in PERSONAL_EMAIL_DOMAINS:
+                name = ""
+
+            if self.use_cache:
+                await llm_cache.set(
+                    cache_key, name, ttl_seconds=ORGANIZATION_NAME_CACHE_TTL_SECONDS
+                )
+
+            return name or None
+
         except Exception as e:
             agent_logger.error(
                 "Organization name extraction failed",
@@ -213,29 +772,32 @@ class EmailAnalyzer:
         prompt = build_danish_summary_prompt(conversation)
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
+            # Wait for rate limit capacity instead of risking a 429
+            await openrouter_limiter.acquire(
+                estimate_tokens(prompt, completion_tokens=150)
+            )
+            response = await http_client.post(
+                OPENROUTER_CHAT_URL,
+                headers=self._headers,
+                content=orjson.dumps(
+                    {
                         "model": self.model,
                         "messages": [{"role": "user", "content": prompt}],
                         "max_tokens": 150,
                         "temperature": 0.3,
-                    },
-                    timeout=20.0,
-                )
+                    }
+                ),
+                timeout=20.0,
+            )
 
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["choices"][0]["message"]["content"].strip()
-                else:
-                    raise AIAnalysisError(
-                        f"OpenRouter API error: {response.status_code}"
-                    )
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                return data["choices"][0]["message"]["content"].strip()
+            else:
+                raise ai_error_for_status(
+                    response.status_code,
+                    f"OpenRouter API error: {response.status_code}",
+                )
 
         except Exception as e:
             agent_logger.error("Danish summary generation failed", {"error": str(e)})
@@ -5,8 +5,9 @@ This module handles Microsoft Graph API operations with token refresh logic.
 """
 
 import os
-import httpx
-from typing import Dict, Any, Optional, List
+import asyncio
+import orjson
+from typing import Dict, Any, Optional, List, Sequence
 from datetime import datetime, timedelta
 
 # Use absolute imports for testing compatibility
@@ -16,10 +17,13 @@ try:
         handle_token_refresh_errors,
         MicrosoftError,
         TokenRefreshError,
+        response_excerpt,
     )
     from app.monitoring.agent_logger import agent_logger
     from app.lib.supabase_client import supabase_manager
     from app.lib.encryption import token_encryption
+    from app.lib.http_client import http_client
+    from app.lib.oauth_manager import oauth_manager
 except ImportError:
     # Fallback for when running as module
     from ..lib.error_handler import (
@@ -27,10 +31,63 @@ except ImportError:
         handle_token_refresh_errors,
         MicrosoftError,
         TokenRefreshError,
+        response_excerpt,
     )
     from ..monitoring.agent_logger import agent_logger
     from ..lib.supabase_client import supabase_manager
     from ..lib.encryption import token_encryption
+    from ..lib.http_client import http_client
+    from ..lib.oauth_manager import oauth_manager
+
+
+def _address(recipient: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Get the email address from a Graph recipient object."""
+    return (recipient or {}).get("emailAddress", {}).get("address")
+
+
+def _addresses(recipients: Optional[List[Dict[str, Any]]]) -> List[Optional[str]]:
+    """Get the email addresses from a list of Graph recipient objects."""
+    return [_address(recipient) for recipient in recipients or ()]
+
+
+# Message fields get_email reads; without $select Graph also returns all
+# headers, categories and other properties nothing here uses
+EMAIL_SELECT_FIELDS = (
+    "id,subject,from,toRecipients,ccRecipients,body,"
+    "receivedDateTime,sentDateTime,importance,hasAttachments"
+)
+
+# Graph accepts at most this many requests in one $batch call
+GRAPH_BATCH_LIMIT = 20
+
+
+def _email_from_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a Graph message (fetched with EMAIL_SELECT_FIELDS) into an email."""
+    return {
+        "id": message.get("id"),
+        "subject": message.get("subject"),
+        "from": _address(message.get("from")),
+        "to": _addresses(message.get("toRecipients")),
+        "cc": _addresses(message.get("ccRecipients")),
+        "body": (message.get("body") or {}).get("content"),
+        "body_content_type": (message.get("body") or {}).get("contentType"),
+        "received_at": message.get("receivedDateTime"),
+        "sent_at": message.get("sentDateTime"),
+        "importance": message.get("importance"),
+        "has_attachments": message.get("hasAttachments", False),
+    }
+
+
+# get_recent_emails output keys -> (Graph message field, conversion)
+RECENT_EMAIL_FIELDS = {
+    "id": ("id", None),
+    "subject": ("subject", None),
+    "from": ("from", _address),
+    "to": ("toRecipients", _addresses),
+    "received_at": ("receivedDateTime", None),
+    "importance": ("importance", None),
+    "has_attachments": ("hasAttachments", bool),
+}
 
 
 class MicrosoftManager:
@@ -41,6 +98,7 @@ class MicrosoftManager:
         self.graph_base_url = "https://graph.microsoft.com/v1.0"
         self.tokens = None
         self.microsoft_user_id = None
+        self._background_refresh = None
 
         # Load tokens from Supabase
         self._load_tokens()
@@ -67,6 +125,12 @@ class MicrosoftManager:
                 agent_logger.info("Microsoft tokens loaded from environment")
                 return
 
+            # Reuse tokens decrypted by an earlier manager while they are valid
+            cached_tokens = oauth_manager.get_cached_tokens(self.user_id, "microsoft")
+            if cached_tokens:
+                self._use_cached_tokens(cached_tokens)
+                return
+
             # Production mode: Load tokens from Supabase
             agent_logger.info(
                 f"Loading Microsoft tokens from Supabase for user: {self.user_id}"
@@ -96,14 +160,32 @@ class MicrosoftManager:
                     else None
                 )
 
+                expires_at = integration.get("token_expires_at")
                 self.tokens = {
                     "access_token": access_token,
                     "refresh_token": refresh_token,
+                    "expires_at": expires_at,
                 }
 
                 # Store Microsoft user ID for API calls
                 self.microsoft_user_id = integration.get("microsoft_user_id")
 
+                # Same shape the Microsoft OAuth routes cache, so both share it
+                scopes = integration.get("scopes") or [""]
+                metadata = integration.get("metadata") or {}
+                oauth_manager.cache_tokens(
+                    self.user_id,
+                    "microsoft",
+                    {
+                        **self.tokens,
+                        "user_id": integration.get("user_id"),
+                        "microsoft_user_id": self.microsoft_user_id,
+                        "scope": scopes[0],
+                        "token_type": metadata.get("token_type", "Bearer"),
+                    },
+                    expires_at,
+                )
+
                 agent_logger.info("Microsoft tokens loaded from Supabase successfully")
 
             except Exception as e:
@@ -118,6 +200,15 @@ class MicrosoftManager:
             agent_logger.error("Failed to load Microsoft tokens", {"error": str(e)})
             raise MicrosoftError(f"Failed to load tokens: {str(e)}")
 
+    def _use_cached_tokens(self, cached_tokens: Dict[str, Any]):
+        """Take tokens from the process-wide cache without sharing its dict."""
+        self.tokens = {
+            "access_token": cached_tokens["access_token"],
+            "refresh_token": cached_tokens.get("refresh_token"),
+            "expires_at": cached_tokens.get("expires_at"),
+        }
+        self.microsoft_user_id = cached_tokens.get("microsoft_user_id")
+
     def _get_headers(self) -> Dict[str, str]:
         """Get headers with current access token."""
         if not self.tokens or not self.tokens.get("access_token"):
@@ -134,76 +225,146 @@ class MicrosoftManager:
         if not self.tokens or not self.tokens.get("refresh_token"):
             raise TokenRefreshError("No refresh token available")
 
+        # Taken before refresh_once drops the cached entry
+        cached_tokens = oauth_manager.get_cached_tokens(self.user_id, "microsoft")
+
+        # Concurrent refreshes for this user share a single token request
+        tokens = await oauth_manager.refresh_once(
+            self.user_id, "microsoft", self._request_token_refresh
+        )
+        self.tokens.update(tokens)
+
+        # Later managers for this user pick up the new tokens from memory
+        if cached_tokens:
+            oauth_manager.cache_tokens(
+                self.user_id,
+                "microsoft",
+                {**cached_tokens, **tokens},
+                tokens["expires_at"],
+            )
+
+    async def _request_token_refresh(self) -> Dict[str, str]:
+        """Request new tokens from Microsoft and persist them."""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://login.microsoftonline.com/common/oauth2/v2.0/token",
-                    data={
-                        "grant_type": "refresh_token",
-                        "refresh_token": self.tokens["refresh_token"],
-                        "client_id": os.getenv("MICROSOFT_CLIENT_ID"),
-                        "client_secret": os.getenv("MICROSOFT_CLIENT_SECRET"),
-                    },
-                    timeout=10.0,
-                )
+            response = await http_client.post(
+                "https://login.microsoftonline.com/common/oauth2/v2.0/token",
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": self.tokens["refresh_token"],
+                    "client_id": os.getenv("MICROSOFT_CLIENT_ID"),
+                    "client_secret": os.getenv("MICROSOFT_CLIENT_SECRET"),
+                },
+                timeout=10.0,
+            )
 
-                if response.status_code != 200:
-                    raise TokenRefreshError(
-                        f"Token refresh failed: {response.status_code}"
-                    )
+            if response.status_code != 200:
+                raise TokenRefreshError(f"Token refresh failed: {response.status_code}")
 
-                data = response.json()
+            data = orjson.loads(response.content)
 
-                # Update tokens
-                self.tokens["access_token"] = data["access_token"]
-                if "refresh_token" in data:
-                    self.tokens["refresh_token"] = data["refresh_token"]
+            tokens = {
+                "access_token": data["access_token"],
+                "refresh_token": data.get(
+                    "refresh_token", self.tokens["refresh_token"]
+                ),
+                "expires_at": (
+                    datetime.utcnow() + timedelta(seconds=data.get("expires_in", 3600))
+                ).isoformat(),
+            }
 
-                # Update tokens in Supabase
-                supabase_manager.client.table("integrations").update(
-                    {
-                        "access_token": token_encryption.encrypt_token(
-                            self.tokens["access_token"]
-                        ),
-                        "refresh_token": token_encryption.encrypt_token(
-                            self.tokens["refresh_token"]
-                        ),
-                        "token_expires_at": datetime.utcnow()
-                        + timedelta(seconds=data.get("expires_in", 3600)),
-                    }
-                ).eq("user_id", self.user_id).eq("provider", "microsoft").execute()
+            # Encrypting and storing both block, so neither runs on the event loop
+            await asyncio.to_thread(self._store_refreshed_tokens, tokens)
 
-                agent_logger.info("Microsoft tokens refreshed successfully")
+            agent_logger.info("Microsoft tokens refreshed successfully")
+            return tokens
 
         except Exception as e:
             agent_logger.error("Token refresh failed", {"error": str(e)})
             raise TokenRefreshError(f"Token refresh failed: {str(e)}")
 
+    def _store_refreshed_tokens(self, tokens: Dict[str, str]):
+        """Encrypt refreshed tokens and update them in Supabase."""
+        (
+            supabase_manager.client.table("integrations")
+            .update(
+                {
+                    "access_token": token_encryption.encrypt_token(
+                        tokens["access_token"]
+                    ),
+                    "refresh_token": token_encryption.encrypt_token(
+                        tokens["refresh_token"]
+                    ),
+                    "token_expires_at": tokens["expires_at"],
+                }
+            )
+            .eq("user_id", self.user_id)
+            .eq("provider", "microsoft")
+            .execute()
+        )
+
+    async def _ensure_fresh_token(self):
+        """Refresh the access token before it expires instead of waiting for a 401."""
+        expires_at = self.tokens.get("expires_at") if self.tokens else None
+        if not expires_at or not self.tokens.get("refresh_token"):
+            return
+
+        now = datetime.utcnow()
+        if oauth_manager.is_token_expired(expires_at, now=now):
+            # The current token is unusable, this request has to wait
+            await self._refresh_access_token()
+        elif (
+            oauth_manager.needs_refresh("microsoft", expires_at, now)
+            and self._background_refresh is None
+        ):
+            # Still valid: keep using it while a new one is fetched
+            self._background_refresh = asyncio.create_task(
+                self._refresh_in_background()
+            )
+
+    async def _refresh_in_background(self):
+        """Refresh the access token without blocking the caller."""
+        try:
+            await self._refresh_access_token()
+        except Exception as e:
+            agent_logger.error("Background token refresh failed", {"error": str(e)})
+        finally:
+            self._background_refresh = None
+
     async def _make_api_call(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
         """Make API call with automatic token refresh."""
         try:
+            await self._ensure_fresh_token()
+
             headers = self._get_headers()
             kwargs["headers"] = headers
 
-            async with httpx.AsyncClient() as client:
-                response = await client.request(method, url, **kwargs)
+            response = await http_client.request(method, url, **kwargs)
+
+            if response.status_code == 401:
+                # Token expired, refresh and retry
+                agent_logger.info("Access token expired, refreshing...")
+                await self._refresh_access_token()
+
+                # Retry with new token
+                headers = self._get_headers()
+                kwargs["headers"] = headers
+                response = await http_client.request(method, url, **kwargs)
 
                 if response.status_code == 401:
-                    # Token expired, refresh and retry
-                    agent_logger.info("Access token expired, refreshing...")
-                    await self._refresh_access_token()
-
-                    # Retry with new token
-                    headers = self._get_headers()
-                    kwargs["headers"] = headers
-                    response = await client.request(method, url, **kwargs)
-
-                if response.status_code not in (200, 201):
-                    raise MicrosoftError(
-                        f"Microsoft Graph API error: {response.status_code} - {response.text}"
-                    )
+                    # Even fresh tokens are rejected, so stop serving them
+                    oauth_manager.invalidate_cached_tokens(self.user_id, "microsoft")
+
+            if response.status_code not in (200, 201, 202, 204):
+                raise MicrosoftError(
+                    f"Microsoft Graph API error: {response.status_code} - "
+                    f"{response_excerpt(response)}"
+                )
 
-                return response.json()
+            # DELETE and some PATCH calls answer 204 with no body
+            if not response.content:
+                return {}
+
+            return orjson.loads(response.content)
 
         except Exception as e:
             agent_logger.error(f"API call failed: {method} {url}", {"error": str(e)})
@@ -237,26 +398,11 @@ class MicrosoftManager:
             else:
                 url = f"{self.graph_base_url}/me/messages/{message_id}"
 
-            result = await self._make_api_call("GET", url)
+            result = await self._make_api_call(
+                "GET", url, params={"$select": EMAIL_SELECT_FIELDS}
+            )
 
-            return {
-                "id": result.get("id"),
-                "subject": result.get("subject"),
-                "from": result.get("from", {}).get("emailAddress", {}).get("address"),
-                "to": [
-                    recipient.get("emailAddress", {}).get("address")
-                    for recipient in result.get("toRecipients", [])
-                ],
-                "cc": [
-                    recipient.get("emailAddress", {}).get("address")
-                    for recipient in result.get("ccRecipients", [])
-                ],
-                "body": result.get("body", {}).get("content"),
-                "received_at": result.get("receivedDateTime"),
-                "sent_at": result.get("sentDateTime"),
-                "importance": result.get("importance"),
-                "has_attachments": result.get("hasAttachments", False),
-            }
+            return _email_from_message(result)
 
         except Exception as e:
             agent_logger.error(
@@ -265,8 +411,87 @@ class MicrosoftManager:
             return None
 
     @handle_microsoft_errors
-    async def get_recent_emails(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get recent emails from the user's inbox."""
+    async def get_emails_batch(
+        self, message_ids: List[str]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Get several emails by message ID using Graph $batch requests.
+
+        Results follow the order of message_ids; emails that could not be
+        fetched are None.
+        """
+        # Batched request URLs are relative to the Graph version root
+        if self.microsoft_user_id:
+            messages_path = f"/users/{self.microsoft_user_id}/messages"
+        else:
+            messages_path = "/me/messages"
+
+        try:
+            chunks = await asyncio.gather(
+                *(
+                    self._get_email_chunk(
+                        messages_path, message_ids[start : start + GRAPH_BATCH_LIMIT]
+                    )
+                    for start in range(0, len(message_ids), GRAPH_BATCH_LIMIT)
+                )
+            )
+            return [email for chunk in chunks for email in chunk]
+
+        except Exception as e:
+            agent_logger.error(
+                "Failed to get emails",
+                {"error": str(e), "message_count": len(message_ids)},
+            )
+            return [None] * len(message_ids)
+
+    async def _get_email_chunk(
+        self, messages_path: str, message_ids: List[str]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Fetch up to GRAPH_BATCH_LIMIT emails with one $batch request."""
+        result = await self._make_api_call(
+            "POST",
+            f"{self.graph_base_url}/$batch",
+            json={
+                "requests": [
+                    {
+                        "id": str(index),
+                        "method": "GET",
+                        "url": f"{messages_path}/{message_id}"
+                        f"?$select={EMAIL_SELECT_FIELDS}",
+                    }
+                    for index, message_id in enumerate(message_ids)
+                ]
+            },
+        )
+
+        # Responses can arrive in any order; match them up by request id
+        emails = [None] * len(message_ids)
+        for response in result.get("responses", []):
+            index = int(response["id"])
+            if response.get("status") == 200:
+                emails[index] = _email_from_message(response.get("body") or {})
+            else:
+                agent_logger.warning(
+                    "Failed to get email in batch",
+                    {
+                        "status": response.get("status"),
+                        "message_id": message_ids[index],
+                    },
+                )
+
+        return emails
+
+    @handle_microsoft_errors
+    async def get_recent_emails(
+        self, limit: int = 10, fields: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get recent emails from the user's inbox.
+
+        Pass fields (keys of RECENT_EMAIL_FIELDS) to fetch and return only those.
+        """
+        projection = [
+            (key, *RECENT_EMAIL_FIELDS[key]) for key in fields or RECENT_EMAIL_FIELDS
+        ]
+
         try:
             # Use Microsoft user ID if available, otherwise use /me
             if self.microsoft_user_id:
@@ -280,7 +505,7 @@ class MicrosoftManager:
                 params={
                     "$top": limit,
                     "$orderby": "receivedDateTime desc",
-                    "$select": "id,subject,from,toRecipients,receivedDateTime,importance,hasAttachments",
+                    "$select": ",".join(field for _, field, _ in projection),
                 },
             )
 
@@ -288,18 +513,8 @@ class MicrosoftManager:
 
             return [
                 {
-                    "id": email.get("id"),
-                    "subject": email.get("subject"),
-                    "from": email.get("from", {})
-                    .get("emailAddress", {})
-                    .get("address"),
-                    "to": [
-                        recipient.get("emailAddress", {}).get("address")
-                        for recipient in email.get("toRecipients", [])
-                    ],
-                    "received_at": email.get("receivedDateTime"),
-                    "importance": email.get("importance"),
-                    "has_attachments": email.get("hasAttachments", False),
+                    key: convert(email.get(field)) if convert else email.get(field)
+                    for key, field, convert in projection
                 }
                 for email in emails
             ]
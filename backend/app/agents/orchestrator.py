@@ -4,6 +4,10 @@ Agent Orchestrator
 This module coordinates the email processing flow between AI analysis and Pipedrive operations.
 """
 
+import os
+import re
+import asyncio
+import functools
 import time
 from typing import Dict, Any, Optional
 from app.lib.error_handler import (
@@ -12,9 +16,61 @@ from app.lib.error_handler import (
     create_correlation_id,
 )
 from app.monitoring.agent_logger import agent_logger
-from app.agents.analyze_email import EmailAnalyzer
+from app.agents.analyze_email import EmailAnalyzer, PERSONAL_EMAIL_DOMAINS
 from app.agents.pipedrive_manager import PipedriveManager
 
+# Pipedrive note logged with every new deal
+_NOTE_TEMPLATE = """Samtale Opsummering:
+
+{summary}
+
+E-mail Detaljer:
+Fra: {sender}
+Til: {recipient}
+Emne: {subject}
+Modtaget: {sent_at}
+Antal e-mails: {email_count}
+
+---
+AI-genereret opsummering af e-mail analyse system."""
+
+# Single emails shorter than this go into the note as-is instead of being
+# summarized by a separate AI call
+NOTE_SUMMARY_MIN_CHARS = int(os.getenv("NOTE_SUMMARY_MIN_CHARS", "400"))
+
+# Reason recorded when a deal is skipped because the person has an open one
+OPEN_DEAL_REASON = "Open deal already exists for this person."
+
+# Webhook outcome when analysis or Pipedrive handling did not complete
+OUTCOME_FAILED = "Error: Failed to process"
+
+# Outcome of a created deal by (contact existed before, company existed before)
+_CREATED_OUTCOMES = {
+    (True, True): "Created: Contact & company already exists",
+    (True, False): "Created: Contact already exists",
+    (False, True): "Created: Company already exists",
+    (False, False): "Created: New contact, company & deal created",
+}
+
+# Summary used when the AI summary could not be generated
+_FALLBACK_NOTE_SUMMARY = "E-mail samtale blev analyseret af AI system."
+
+# First label of the domain of an email address
+_DOMAIN_RE = re.compile(r"@([^.@]+)[^@]*\Z")
+
+
+@functools.lru_cache(maxsize=4096)
+def _organization_from_email(email: str) -> Optional[str]:
+    """Derive an organization name from an email domain, skipping personal ones."""
+    match = _DOMAIN_RE.search(email)
+    if match is None:
+        return None
+
+    domain = match.group(1)
+    if domain.lower() in PERSONAL_EMAIL_DOMAINS:
+        return None
+    return domain.capitalize()
+
 
 class AgentOrchestrator:
     """Coordinates AI analysis and Pipedrive operations for email processing."""
@@ -28,8 +84,14 @@ class AgentOrchestrator:
         # Set correlation ID for logging
         agent_logger.set_correlation_id(self.correlation_id)
 
-    async def process_email(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process email through the complete AI analysis and Pipedrive integration flow."""
+    async def process_email(
+        self, email_data: Dict[str, Any], ai_result: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Process email through the complete AI analysis and Pipedrive integration flow.
+
+        Pass ai_result when the email was already analyzed (e.g. in a batch)
+        to skip the AI step.
+        """
         start_time = time.time()
 
         agent_logger.info(
@@ -43,7 +105,8 @@ class AgentOrchestrator:
 
         try:
             # Step 1: AI Analysis
-            ai_result = await self._analyze_email(email_data)
+            if ai_result is None:
+                ai_result = await self._analyze_email(email_data)
 
             if not ai_result:
                 return self._create_error_result("AI analysis failed")
@@ -153,45 +216,30 @@ class AgentOrchestrator:
                     "error": "Pipedrive not available",
                 }
 
-            # Step 1: Check existing contact and deals
-            deal_check = await self.pipedrive_manager.contact_has_deals(
-                email_data["to"]
-            )
-            contact = deal_check.get("contact")
-            contact_existed = bool(contact)
+            # Determine organization from email domain, skipping organization
+            # creation for personal email domains
+            organization_name = _organization_from_email(email_data["to"])
 
-            # Check if contact has open deals
-            has_open_deal = False
-            if contact:
-                has_open_deal = await self.pipedrive_manager.has_open_deal(
-                    contact["id"]
+            # Step 1: Check existing contact and deals, and whether the
+            # organization exists (only if we have an organization name).
+            # The lookups are independent, so run them concurrently.
+            lookups = [self.pipedrive_manager.contact_has_deals(email_data["to"])]
+            if organization_name:
+                lookups.append(
+                    self.pipedrive_manager.search_organization_by_name(
+                        organization_name
+                    )
                 )
+            deal_check, *existing_org = await asyncio.gather(*lookups)
+            org_exists = bool(existing_org and existing_org[0])
 
-            # Determine organization from email domain
-            domain = email_data["to"].split("@")[-1].split(".")[0]
-
-            # Skip organization creation for personal email domains
-            personal_domains = [
-                "gmail",
-                "hotmail",
-                "outlook",
-                "yahoo",
-                "icloud",
-                "live",
-                "aol",
-                "protonmail",
-            ]
-            organization_name = None
-            if domain.lower() not in personal_domains:
-                organization_name = domain.capitalize()
+            contact = deal_check.get("contact")
+            contact_existed = bool(contact)
 
-            # Check if organization exists (only if we have an organization name)
-            org_exists = False
-            if organization_name:
-                existing_org = await self.pipedrive_manager.search_organization_by_name(
-                    organization_name
-                )
-                org_exists = bool(existing_org)
+            # The contact's deals came with the lookup, so check them locally
+            has_open_deal = any(
+                deal.get("status") == "open" for deal in deal_check.get("deals", [])
+            )
 
             # Step 2: Create contact if it doesn't exist
             if not contact_existed:
@@ -213,12 +261,12 @@ class AgentOrchestrator:
             # Step 3: Create deal if no open deal exists
             if not has_open_deal:
                 deal_result = await self._create_deal_if_needed(
-                    email_data, ai_result, deal_check
+                    email_data, ai_result, deal_check, has_open_deal=False
                 )
                 deal_check.update(deal_result)
             else:
                 deal_check["deal_created"] = False
-                deal_check["reason"] = "Open deal already exists for this person."
+                deal_check["reason"] = OPEN_DEAL_REASON
 
             # Add decision information
             deal_check["contact_existed_before"] = contact_existed
@@ -242,8 +290,12 @@ class AgentOrchestrator:
         email_data: Dict[str, Any],
         ai_result: Dict[str, Any],
         deal_check: Dict[str, Any],
+        has_open_deal: Optional[bool] = None,
     ) -> Dict[str, Any]:
-        """Create a new deal if it's a sales opportunity."""
+        """Create a new deal if it's a sales opportunity.
+
+        Pass has_open_deal when the caller already checked the person's deals.
+        """
         try:
             existing_deals = deal_check.get("deals", [])
             contact = deal_check["contact"]
@@ -251,13 +303,16 @@ class AgentOrchestrator:
             if not contact:
                 return {"deal_created": False, "deal": None}
 
-            # Check for any open deal for this person
-            has_open = await self.pipedrive_manager.has_open_deal(contact["id"])
-            if has_open:
+            # Check for any open deal for this person, unless already known
+            if has_open_deal is None:
+                has_open_deal = await self.pipedrive_manager.has_open_deal(
+                    contact["id"]
+                )
+            if has_open_deal:
                 return {
                     "deal_created": False,
                     "deal": None,
-                    "reason": "Open deal already exists for this person.",
+                    "reason": OPEN_DEAL_REASON,
                 }
 
             person_name = ai_result.get("person_name", contact.get("name", "Unknown"))
@@ -268,19 +323,7 @@ class AgentOrchestrator:
                 organization_name = ai_result.get("organization_name")
             if not organization_name:
                 # Fallback to domain-based organization name (only for non-personal domains)
-                domain = email_data["to"].split("@")[-1].split(".")[0]
-                personal_domains = [
-                    "gmail",
-                    "hotmail",
-                    "outlook",
-                    "yahoo",
-                    "icloud",
-                    "live",
-                    "aol",
-                    "protonmail",
-                ]
-                if domain.lower() not in personal_domains:
-                    organization_name = domain.capitalize()
+                organization_name = _organization_from_email(email_data["to"])
 
             # Create deal title based on whether we have an organization
             if organization_name:
@@ -300,7 +343,11 @@ class AgentOrchestrator:
 
             if deal:
                 # Log email note
-                await self._log_email_note(email_data, deal["id"])
+                await self._log_email_note(
+                    email_data,
+                    deal["id"],
+                    ai_result.get("conversation_summary_da"),
+                )
 
                 return {
                     "deal_created": True,
@@ -315,64 +362,76 @@ class AgentOrchestrator:
             agent_logger.error("Deal creation failed", {"error": str(e)})
             return {"deal_created": False, "deal": None}
 
-    async def _log_email_note(self, email_data: Dict[str, Any], deal_id: int):
+    async def _log_email_note(
+        self, email_data: Dict[str, Any], deal_id: int, summary: Optional[str] = None
+    ):
         """Log the email conversation as a summary note in Pipedrive."""
         try:
-            agent_logger.info(f"Creating note for deal {deal_id}")
-
-            # Build conversation text
-            conversation = f"Latest email:\nFrom: {email_data['from']}\nTo: {email_data['to']}\nSubject: {email_data['subject']}\nContent: {email_data['content']}\n\n"
-
-            if email_data.get("email_thread"):
-                for i, thread_email in enumerate(
-                    reversed(email_data["email_thread"]), 1
-                ):
-                    conversation += f"Previous email {i}:\nFrom: {thread_email['from']}\nTo: {thread_email['to']}\nSubject: {thread_email['subject']}\nContent: {thread_email['content']}\n\n"
-
-            # Generate AI summary
-            try:
-                summary = await self.email_analyzer.generate_danish_summary(
-                    conversation
-                )
-                agent_logger.info(f"AI summary generated for deal {deal_id}")
-            except Exception as summary_error:
-                agent_logger.error(
-                    f"AI summary generation failed: {str(summary_error)}"
+            thread = email_data.get("email_thread") or []
+            if (
+                not summary
+                and not thread
+                and len(email_data["content"]) < NOTE_SUMMARY_MIN_CHARS
+            ):
+                summary = email_data["content"].strip()
+
+            # The analysis normally includes the summary; only fall back to a
+            # separate AI call when it does not
+            if not summary:
+                # Build conversation text
+                parts = [
+                    f"Latest email:\nFrom: {email_data['from']}\nTo: {email_data['to']}\nSubject: {email_data['subject']}\nContent: {email_data['content']}\n\n"
+                ]
+                parts.extend(
+                    f"Previous email {i}:\nFrom: {thread_email['from']}\nTo: {thread_email['to']}\nSubject: {thread_email['subject']}\nContent: {thread_email['content']}\n\n"
+                    for i, thread_email in enumerate(reversed(thread), 1)
                 )
-                summary = "E-mail samtale blev analyseret af AI system."
-
-            note_content = f"""Samtale Opsummering:
-
-{summary}
-
-E-mail Detaljer:
-Fra: {email_data['from']}
-Til: {email_data['to']}
-Emne: {email_data['subject']}
-Modtaget: {email_data.get('sent_at', 'N/A')}
-Antal e-mails: {len(email_data.get('email_thread', [])) + 1}
-
----
-AI-genereret opsummering af e-mail analyse system."""
+                conversation = "".join(parts)
+
+                # Generate AI summary
+                try:
+                    summary = await self.email_analyzer.generate_danish_summary(
+                        conversation
+                    )
+                    agent_logger.debug("AI summary generated", {"deal_id": deal_id})
+                except Exception as summary_error:
+                    agent_logger.error(
+                        f"AI summary generation failed: {str(summary_error)}"
+                    )
+                    summary = _FALLBACK_NOTE_SUMMARY
+
+            note_content = _NOTE_TEMPLATE.format(
+                summary=summary,
+                sender=email_data["from"],
+                recipient=email_data["to"],
+                subject=email_data["subject"],
+                sent_at=email_data.get("sent_at", "N/A"),
+                email_count=len(thread) + 1,
+            )
 
             note_data = {
                 "content": note_content,
                 "deal_id": deal_id,
             }
 
-            agent_logger.info(f"Sending note to Pipedrive for deal {deal_id}")
             note_result = await self.pipedrive_manager.log_note(note_data)
 
             if note_result:
-                agent_logger.info(f"Note successfully created for deal {deal_id}")
+                agent_logger.info("Note created", {"deal_id": deal_id})
             else:
-                agent_logger.error(f"Note creation failed for deal {deal_id}")
+                agent_logger.error("Note creation failed", {"deal_id": deal_id})
 
         except Exception as e:
-            agent_logger.error(f"Note logging failed for deal {deal_id}: {str(e)}")
             import traceback
 
-            agent_logger.error(f"Note error traceback: {traceback.format_exc()}")
+            agent_logger.error(
+                "Note logging failed",
+                {
+                    "error": str(e),
+                    "deal_id": deal_id,
+                    "traceback": traceback.format_exc(),
+                },
+            )
 
     def _categorize_webhook_outcome(
         self, ai_result: Dict[str, Any], pipedrive_result: Dict[str, Any]
@@ -380,7 +439,7 @@ AI-genereret opsummering af e-mail analyse system."""
         """Categorize the webhook outcome based on AI analysis and Pipedrive results."""
         # Check if AI analysis failed
         if not ai_result:
-            return "Error: Failed to process"
+            return OUTCOME_FAILED
 
         # Check for low confidence
         confidence = ai_result.get("confidence", 0)
@@ -393,36 +452,24 @@ AI-genereret opsummering af e-mail analyse system."""
 
         # Check if Pipedrive integration failed
         if not pipedrive_result:
-            return "Error: Failed to process"
+            return OUTCOME_FAILED
 
         # Check if deal creation was skipped due to existing open deal
-        if (
-            pipedrive_result.get("deal_created") == False
-            and pipedrive_result.get("reason")
-            == "Open deal already exists for this person."
-        ):
+        deal_created = pipedrive_result.get("deal_created", False)
+        if not deal_created and pipedrive_result.get("reason") == OPEN_DEAL_REASON:
             return "Not created: Deal already exists"
 
         # Check if deal was created
-        if pipedrive_result.get("deal_created", False):
-            contact_existed = pipedrive_result.get("contact_existed_before", False)
-            org_existed = pipedrive_result.get("org_existed_before", False)
-
-            if contact_existed:
-                if org_existed:
-                    return "Created: Contact & company already exists"
-                else:
-                    return "Created: Contact already exists"
-            else:
-                if org_existed:
-                    return "Created: Company already exists"
-                else:
-                    return "Created: New contact, company & deal created"
+        if deal_created:
+            return _CREATED_OUTCOMES[
+                (
+                    bool(pipedrive_result.get("contact_existed_before")),
+                    bool(pipedrive_result.get("org_existed_before")),
+                )
+            ]
 
         # Check if contact exists but no deal was created
-        if pipedrive_result.get("contact_exists") and not pipedrive_result.get(
-            "deal_created"
-        ):
+        if pipedrive_result.get("contact_exists"):
             contact = pipedrive_result.get("contact", {})
             if contact and contact.get("created_at") == contact.get("updated_at"):
                 return "Created: New contact created (no company)"
@@ -430,7 +477,7 @@ AI-genereret opsummering af e-mail analyse system."""
                 return "Not created: Deal already exists"
 
         # If we get here, something went wrong
-        return "Error: Failed to process"
+        return OUTCOME_FAILED
 
     async def _log_activity(
         self,
@@ -5,8 +5,11 @@ This module handles Pipedrive API operations with token refresh logic.
 """
 
 import os
-import httpx
+import re
+import asyncio
+import orjson
 from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta
 
 # Use absolute imports for testing compatibility
 try:
@@ -15,11 +18,16 @@ try:
         handle_token_refresh_errors,
         PipedriveError,
         TokenRefreshError,
+        response_excerpt,
     )
     from app.monitoring.agent_logger import agent_logger
     from app.lib.supabase_client import supabase_manager
     from app.agents.analyze_email import EmailAnalyzer
     from app.lib.encryption import token_encryption
+    from app.lib.http_client import http_client
+    from app.lib.lookup_cache import lookup_cache
+    from app.lib.oauth_manager import oauth_manager
+    from app.lib.token_bucket import pipedrive_limiter
 except ImportError:
     # Fallback for when running as module
     from ..lib.error_handler import (
@@ -27,10 +35,22 @@ except ImportError:
         handle_token_refresh_errors,
         PipedriveError,
         TokenRefreshError,
+        response_excerpt,
     )
     from ..monitoring.agent_logger import agent_logger
     from ..lib.supabase_client import supabase_manager
     from .analyze_email import EmailAnalyzer
+    from ..lib.encryption import token_encryption
+    from ..lib.http_client import http_client
+    from ..lib.lookup_cache import lookup_cache
+    from ..lib.oauth_manager import oauth_manager
+    from ..lib.token_bucket import pipedrive_limiter
+
+# Tokens encrypted by token_encryption are URL-safe base64
+_ENCRYPTED_TOKEN_RE = re.compile(r"\A[A-Za-z0-9_\-]+=*\Z")
+
+# Largest page size accepted by the v2 list endpoints
+PAGE_LIMIT = 500
 
 
 class PipedriveManager:
@@ -43,6 +63,11 @@ class PipedriveManager:
         self.v1_base_url = f"https://{company_domain}.pipedrive.com/api/v1"
         self.tokens = None
         self.email_analyzer = EmailAnalyzer()
+        self._background_refresh = None
+        # Request headers, rebuilt only when the access token changes
+        self._headers_token = None
+        self._read_headers = None
+        self._write_headers = None
 
         # Load tokens from Supabase
         self._load_tokens()
@@ -63,6 +88,7 @@ class PipedriveManager:
                     refresh_token
                     and len(refresh_token) > 60
                     and not refresh_token.startswith("v1u:")
+                    and _ENCRYPTED_TOKEN_RE.match(refresh_token) is not None
                 ):
                     try:
                         agent_logger.info("Attempting to decrypt refresh token...")
@@ -92,13 +118,10 @@ class PipedriveManager:
                 f"Loading Pipedrive tokens from Supabase for user: {self.user_id}"
             )
 
-            result = (
-                supabase_manager.client.table("integrations")
-                .select("*")
-                .eq("provider", "pipedrive")
-                .eq("user_id", self.user_id)
-                .execute()
-            )
+            result = supabase_manager.client.rpc(
+                "get_or_refresh_integration",
+                {"p_user_id": self.user_id, "p_provider": "pipedrive"},
+            ).execute()
 
             if not result.data:
                 raise PipedriveError("No Pipedrive integration found for user")
@@ -119,6 +142,7 @@ class PipedriveManager:
                 self.tokens = {
                     "access_token": access_token,
                     "refresh_token": refresh_token,
+                    "expires_at": integration.get("token_expires_at"),
                 }
 
                 agent_logger.info("Pipedrive tokens loaded from Supabase successfully")
@@ -135,15 +159,21 @@ class PipedriveManager:
             agent_logger.error("Failed to load Pipedrive tokens", {"error": str(e)})
             raise PipedriveError(f"Failed to load tokens: {str(e)}")
 
-    def _get_headers(self) -> Dict[str, str]:
-        """Get headers with current access token."""
+    def _get_headers(self, has_body: bool = False) -> Dict[str, str]:
+        """Get headers with current access token (Content-Type only with a body)."""
         if not self.tokens or not self.tokens.get("access_token"):
             raise PipedriveError("No access token available")
 
-        return {
-            "Authorization": f"Bearer {self.tokens['access_token']}",
-            "Content-Type": "application/json",
-        }
+        access_token = self.tokens["access_token"]
+        if access_token != self._headers_token:
+            self._headers_token = access_token
+            self._read_headers = {"Authorization": f"Bearer {access_token}"}
+            self._write_headers = {
+                **self._read_headers,
+                "Content-Type": "application/json",
+            }
+
+        return self._write_headers if has_body else self._read_headers
 
     @handle_token_refresh_errors
     async def _refresh_access_token(self):
@@ -151,118 +181,192 @@ class PipedriveManager:
         if not self.tokens or not self.tokens.get("refresh_token"):
             raise TokenRefreshError("No refresh token available")
 
+        # Concurrent refreshes for this user share a single token request
+        tokens = await oauth_manager.refresh_once(
+            self.user_id, "pipedrive", self._request_token_refresh
+        )
+        self.tokens.update(tokens)
+
+    async def _request_token_refresh(self) -> Dict[str, str]:
+        """Request new tokens from Pipedrive and persist them."""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://oauth.pipedrive.com/oauth/token",
-                    data={
-                        "grant_type": "refresh_token",
-                        "refresh_token": self.tokens["refresh_token"],
-                        "client_id": os.getenv("PIPEDRIVE_CLIENT_ID"),
-                        "client_secret": os.getenv("PIPEDRIVE_CLIENT_SECRET"),
-                    },
-                    timeout=10.0,
-                )
+            # Reuse the shared connection pool instead of a client per call
+            response = await http_client.post(
+                "https://oauth.pipedrive.com/oauth/token",
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": self.tokens["refresh_token"],
+                    "client_id": os.getenv("PIPEDRIVE_CLIENT_ID"),
+                    "client_secret": os.getenv("PIPEDRIVE_CLIENT_SECRET"),
+                },
+                timeout=10.0,
+            )
 
-                if response.status_code != 200:
-                    raise TokenRefreshError(
-                        f"Token refresh failed: {response.status_code}"
-                    )
+            if response.status_code != 200:
+                raise TokenRefreshError(f"Token refresh failed: {response.status_code}")
 
-                data = response.json()
+            data = orjson.loads(response.content)
 
-                # Update tokens
-                self.tokens["access_token"] = data["access_token"]
-                if "refresh_token" in data:
-                    self.tokens["refresh_token"] = data["refresh_token"]
+            tokens = {
+                "access_token": data["access_token"],
+                "refresh_token": data.get(
+                    "refresh_token", self.tokens["refresh_token"]
+                ),
+                "expires_at": (
+                    datetime.utcnow() + timedelta(seconds=data.get("expires_in", 3600))
+                ).isoformat(),
+            }
 
-                # Update tokens in Supabase
-                supabase_manager.client.table("integrations").update(
+            # Store the refreshed tokens and read back the row in one call
+            result = await asyncio.to_thread(
+                supabase_manager.client.rpc(
+                    "get_or_refresh_integration",
                     {
-                        "access_token": self.tokens["access_token"],
-                        "refresh_token": self.tokens["refresh_token"],
-                    }
-                ).eq("user_id", self.user_id).eq("provider", "pipedrive").execute()
+                        "p_user_id": self.user_id,
+                        "p_provider": "pipedrive",
+                        "p_new_access": token_encryption.encrypt_token(
+                            tokens["access_token"]
+                        ),
+                        "p_new_refresh": token_encryption.encrypt_token(
+                            tokens["refresh_token"]
+                        ),
+                        "p_new_expires": tokens["expires_at"],
+                    },
+                ).execute
+            )
 
-                agent_logger.info("Pipedrive tokens refreshed successfully")
+            if not result.data:
+                raise TokenRefreshError("No Pipedrive integration found to update")
+
+            agent_logger.info("Pipedrive tokens refreshed successfully")
+            return tokens
 
         except Exception as e:
             agent_logger.error("Token refresh failed", {"error": str(e)})
             raise TokenRefreshError(f"Token refresh failed: {str(e)}")
 
+    async def _ensure_fresh_token(self):
+        """Refresh the access token before it expires instead of waiting for a 401."""
+        expires_at = self.tokens.get("expires_at") if self.tokens else None
+        if not expires_at or not self.tokens.get("refresh_token"):
+            return
+
+        now = datetime.utcnow()
+        if oauth_manager.is_token_expired(expires_at, now=now):
+            # The current token is unusable, this request has to wait
+            await self._refresh_access_token()
+        elif (
+            oauth_manager.needs_refresh("pipedrive", expires_at, now)
+            and self._background_refresh is None
+        ):
+            # Still valid: keep using it while a new one is fetched
+            self._background_refresh = asyncio.create_task(
+                self._refresh_in_background()
+            )
+
+    async def _refresh_in_background(self):
+        """Refresh the access token without blocking the caller."""
+        try:
+            await self._refresh_access_token()
+        except Exception as e:
+            agent_logger.error("Background token refresh failed", {"error": str(e)})
+        finally:
+            self._background_refresh = None
+
     async def _make_api_call(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
         """Make API call with automatic token refresh."""
         try:
-            headers = self._get_headers()
-            kwargs["headers"] = headers
-
-            async with httpx.AsyncClient() as client:
-                response = await client.request(method, url, **kwargs)
-
-                if response.status_code == 401:
-                    # Token expired, refresh and retry
-                    agent_logger.info("Access token expired, refreshing...")
-                    await self._refresh_access_token()
-
-                    # Retry with new token
-                    headers = self._get_headers()
-                    kwargs["headers"] = headers
-                    response = await client.request(method, url, **kwargs)
-
-                if response.status_code not in (200, 201):
-                    raise PipedriveError(
-                        f"Pipedrive API error: {response.status_code} - {response.text}"
-                    )
+            await self._ensure_fresh_token()
+
+            # Serialize JSON bodies with orjson (the headers set the type)
+            has_body = "json" in kwargs
+            if has_body:
+                kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+            kwargs["headers"] = self._get_headers(has_body)
+
+            # Pace requests so concurrent emails stay under the API rate limit
+            await pipedrive_limiter.acquire()
+            # Reuse the shared connection pool instead of a client per call
+            response = await http_client.request(method, url, **kwargs)
+
+            if response.status_code == 401:
+                # Token expired, refresh and retry
+                agent_logger.info("Access token expired, refreshing...")
+                await self._refresh_access_token()
+
+                # Retry with new token
+                kwargs["headers"] = self._get_headers(has_body)
+                await pipedrive_limiter.acquire()
+                response = await http_client.request(method, url, **kwargs)
+
+            if response.status_code not in (200, 201):
+                raise PipedriveError(
+                    f"Pipedrive API error: {response.status_code} - "
+                    f"{response_excerpt(response)}"
+                )
 
-                return response.json()
+            return orjson.loads(response.content)
 
         except Exception as e:
             agent_logger.error(f"API call failed: {method} {url}", {"error": str(e)})
             raise
 
+    def _lookup_key(self, url: str, params: Dict[str, Any]) -> str:
+        """Build the lookup cache key for a GET request of this user."""
+        query = "&".join(f"{k}={str(v).casefold()}" for k, v in sorted(params.items()))
+        return f"{self.user_id}:{url}?{query}"
+
+    async def _cached_get(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET an idempotent lookup, reusing a recent or in-flight response."""
+        # Failed calls raise before anything is cached
+        return await lookup_cache.get_or_fetch(
+            self._lookup_key(url, params),
+            lambda: self._make_api_call("GET", url, params=params),
+        )
+
     @handle_pipedrive_errors
     async def search_contact_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Search for a contact by email address."""
         try:
-            agent_logger.info(f"Searching for contact with email: {email}")
+            agent_logger.debug("Searching for contact", {"email": email})
 
-            result = await self._make_api_call(
-                "GET",
+            result = await self._cached_get(
                 f"{self.base_url}/persons/search",
-                params={"term": email, "fields": "email"},
+                {"term": email, "fields": "email"},
             )
 
             items = result.get("data", {}).get("items", [])
-            agent_logger.info(f"Found {len(items)} search results for email: {email}")
+            agent_logger.debug(
+                "Contact search results", {"email": email, "result_count": len(items)}
+            )
 
             # Check if any contact has this exact email
+            target = email.lower()
             for item in items:
-                person = item.get("item", {})
-                if isinstance(person, dict):
-                    person_emails = person.get("emails", [])
-                    agent_logger.info(
-                        f"Contact {person.get('name')} has emails: {person_emails}"
-                    )
-                    for person_email in person_emails:
-                        if (
-                            isinstance(person_email, str)
-                            and person_email.lower() == email.lower()
-                        ):
-                            agent_logger.info(f"Found exact match for email: {email}")
-                            return {
-                                "id": person.get("id"),
-                                "name": person.get("name"),
-                                "email": email,
-                                "company_id": person.get("organization", {}).get("id"),
-                                "company_name": person.get("organization", {}).get(
-                                    "name"
-                                ),
-                                "phone": person.get("phones", []),
-                                "created_at": person.get("add_time"),
-                                "updated_at": person.get("update_time"),
-                            }
-
-            agent_logger.info(f"No exact match found for email: {email}")
+                person = item.get("item") or {}
+                if not isinstance(person, dict):
+                    continue
+
+                person_emails = {
+                    person_email.lower()
+                    for person_email in person.get("emails") or ()
+                    if isinstance(person_email, str)
+                }
+                if target in person_emails:
+                    agent_logger.debug("Found exact contact match", {"email": email})
+                    organization = person.get("organization") or {}
+                    return {
+                        "id": person.get("id"),
+                        "name": person.get("name"),
+                        "email": email,
+                        "company_id": organization.get("id"),
+                        "company_name": organization.get("name"),
+                        "phone": person.get("phones", []),
+                        "created_at": person.get("add_time"),
+                        "updated_at": person.get("update_time"),
+                    }
+
+            agent_logger.debug("No exact contact match", {"email": email})
             return None
 
         except Exception as e:
@@ -271,15 +375,34 @@ class PipedriveManager:
             )
             return None
 
+    async def fetch_person_deals(self, contact_id: int) -> List[Dict[str, Any]]:
+        """Fetch all deals of a person with one lookup shared by the deal checks."""
+        url = f"{self.base_url}/deals"
+        params = {"person_id": contact_id}
+        # Every page is cached under one key, so create_deal can invalidate it
+        result = await lookup_cache.get_or_fetch(
+            self._lookup_key(url, params), lambda: self._get_all_pages(url, params)
+        )
+        return result["data"]
+
+    async def _get_all_pages(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET every page of a v2 list endpoint by following its cursor."""
+        items = []
+        params = {**params, "limit": PAGE_LIMIT}
+        while True:
+            result = await self._make_api_call("GET", url, params=params)
+            items.extend(result.get("data") or [])
+
+            next_cursor = (result.get("additional_data") or {}).get("next_cursor")
+            if not next_cursor:
+                return {"data": items}
+            params = {**params, "cursor": next_cursor}
+
     @handle_pipedrive_errors
     async def get_contact_deals(self, contact_id: int) -> List[Dict[str, Any]]:
         """Get all deals associated with a contact."""
         try:
-            result = await self._make_api_call(
-                "GET", f"{self.base_url}/deals", params={"person_id": contact_id}
-            )
-
-            deals = result.get("data", [])
+            deals = await self.fetch_person_deals(contact_id)
 
             return [
                 {
@@ -345,9 +468,6 @@ class PipedriveManager:
     ) -> Optional[Dict[str, Any]]:
         """Create a new contact in Pipedrive."""
         try:
-            # Use organization name from contact_data if provided
-            org_name = contact_data.get("org_name")
-
             # Prepare contact payload
             contact_payload = {
                 "name": contact_data.get("name", "Unknown"),
@@ -360,21 +480,25 @@ class PipedriveManager:
                     {"value": contact_data["phone"], "primary": True}
                 ]
 
-            # If we have an organization name, try to find or create it
+            # Use organization name from contact_data if provided
+            org_name = contact_data.get("org_name")
             if org_name:
-                org = await self.search_organization_by_name(org_name)
-                if org:
-                    contact_payload["org_id"] = org["id"]
-                else:
-                    # Create new organization
-                    new_org = await self.create_organization({"name": org_name})
-                    if new_org:
-                        contact_payload["org_id"] = new_org["id"]
+                org_id = await self._resolve_or_create_org(org_name)
+                if org_id:
+                    contact_payload["org_id"] = org_id
 
             result = await self._make_api_call(
                 "POST", f"{self.base_url}/persons", json=contact_payload
             )
 
+            # A cached "not found" for this email is now stale
+            lookup_cache.invalidate(
+                self._lookup_key(
+                    f"{self.base_url}/persons/search",
+                    {"term": contact_data.get("email"), "fields": "email"},
+                )
+            )
+
             contact = result.get("data", {})
 
             return {
@@ -392,25 +516,62 @@ class PipedriveManager:
             agent_logger.error("Contact creation failed", {"error": str(e)})
             return None
 
+    async def _resolve_or_create_org(self, org_name: str) -> Optional[int]:
+        """Return the id of the named organization, creating it if needed."""
+
+        async def find_or_create() -> Dict[str, Any]:
+            org = await self.search_organization_by_name(org_name)
+            if not org:
+                org = await self.create_organization({"name": org_name})
+            if not org or not org.get("id"):
+                # Raise so the failure is not cached
+                raise PipedriveError(f"Could not resolve organization: {org_name}")
+            return org
+
+        # Emails to the same organization share one search and creation
+        try:
+            org = await lookup_cache.get_or_fetch(
+                self._organization_key(org_name), find_or_create
+            )
+        except PipedriveError as e:
+            agent_logger.warning(
+                "Organization resolution failed", {"error": str(e), "name": org_name}
+            )
+            return None
+
+        return org["id"]
+
+    def _organization_key(self, name: str) -> str:
+        """Build the lookup cache key for an organization known by name."""
+        return f"{self.user_id}:organization:{name.casefold()}"
+
     @handle_pipedrive_errors
     async def search_organization_by_name(self, name: str) -> Optional[Dict[str, Any]]:
         """Search for an organization by name."""
         try:
-            result = await self._make_api_call(
-                "GET", f"{self.base_url}/organizations/search", params={"term": name}
+            # Organizations found or created earlier in the batch need no search
+            known_org = lookup_cache.get(self._organization_key(name))
+            if known_org is not None:
+                return known_org
+
+            result = await self._cached_get(
+                f"{self.base_url}/organizations/search", {"term": name}
             )
 
             items = result.get("data", {}).get("items", [])
 
+            target_name = name.casefold()
             for item in items:
-                org = item.get("item", {})
-                if org.get("name", "").lower() == name.lower():
-                    return {
+                org = item.get("item") or {}
+                if (org.get("name") or "").casefold() == target_name:
+                    found_org = {
                         "id": org.get("id"),
                         "name": org.get("name"),
                         "created_at": org.get("add_time"),
                         "updated_at": org.get("update_time"),
                     }
+                    lookup_cache.set(self._organization_key(name), found_org)
+                    return found_org
 
             return None
 
@@ -432,6 +593,13 @@ class PipedriveManager:
                 "POST", f"{self.base_url}/organizations", json=payload
             )
 
+            # A cached "not found" for this name is now stale
+            lookup_cache.invalidate(
+                self._lookup_key(
+                    f"{self.base_url}/organizations/search", {"term": payload["name"]}
+                )
+            )
+
             org = result.get("data", {})
 
             return {
@@ -465,6 +633,11 @@ class PipedriveManager:
                 "POST", f"{self.base_url}/deals", json=payload
             )
 
+            # The person's cached deal list no longer includes every deal
+            lookup_cache.invalidate(
+                self._lookup_key(f"{self.base_url}/deals", {"person_id": contact_id})
+            )
+
             deal = result.get("data", {})
 
             if not deal:
@@ -489,14 +662,8 @@ class PipedriveManager:
     async def has_open_deal(self, contact_id: int) -> bool:
         """Return True if the person has any open deal, else False."""
         try:
-            result = await self._make_api_call(
-                "GET",
-                f"{self.base_url}/deals",
-                params={"person_id": contact_id, "status": "open"},
-            )
-
-            deals = result.get("data", [])
-            return len(deals) > 0
+            deals = await self.fetch_person_deals(contact_id)
+            return any(deal.get("status") == "open" for deal in deals)
 
         except Exception as e:
             agent_logger.error(
@@ -508,21 +675,21 @@ class PipedriveManager:
     async def log_note(self, note_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Log a note using the Pipedrive API v2."""
         try:
-            agent_logger.info(f"Creating note for deal {note_data.get('deal_id')}")
-
             payload = {
                 "content": note_data.get("content", ""),
                 "deal_id": note_data.get("deal_id"),
             }
 
-            agent_logger.info(f"Note payload: {payload}")
-
             result = await self._make_api_call(
                 "POST", f"{self.base_url}/notes", json=payload
             )
 
-            agent_logger.info(f"Note creation response: {result}")
-            return result.get("data", {})
+            note = result.get("data", {})
+            agent_logger.debug(
+                "Note created",
+                {"deal_id": payload["deal_id"], "note_id": note.get("id")},
+            )
+            return note
 
         except Exception as e:
             agent_logger.error(f"Note logging failed: {str(e)}")
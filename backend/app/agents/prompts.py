@@ -4,13 +4,25 @@ AI Prompt Templates
 This module contains all AI prompt templates used for email analysis.
 """
 
-# Email Analysis Prompt
-EMAIL_ANALYSIS_PROMPT = """Analyze this email conversation and extract sales opportunity information:
+import re
+
+# Email bodies longer than this are cut to their opening and closing parts
+EMAIL_CONTENT_MAX_CHARS = 1500
+EMAIL_CONTENT_HEAD_CHARS = 1000
+EMAIL_CONTENT_TAIL_CHARS = 500
+
+# Where a reply starts quoting the previous message
+_QUOTED_REPLY_RE = re.compile(
+    r"^(?:On .* wrote:|-{2,} ?Original Message ?-{2,})\s*$", re.MULTILINE
+)
 
-{full_conversation}
+# Email Analysis Prompt
+# Sent as a static system message so providers can cache the shared prefix;
+# the conversation itself goes in the user message.
+EMAIL_ANALYSIS_SYSTEM_PROMPT = """Analyze the email conversation provided by the user and extract sales opportunity information.
 
 Please provide a JSON response with the following structure:
-{{
+{
     "is_sales_opportunity": true/false,
     "confidence": 0.0-1.0,
     "opportunity_type": "new_business|upsell|follow_up|inquiry|other",
@@ -22,14 +34,114 @@ Please provide a JSON response with the following structure:
     "organization_name": "recipient_organization_from_signature_or_domain",
     "offering_type": "security_solution|software|crm|consulting|web_design|other",
     "key_points": ["point1", "point2"],
+    "conversation_summary_da": "2-3 sentence summary in Danish",
     "ai_generated": true
-}}
+}
 
 Instructions:
 1. Extract the recipient's full name from email addresses, signatures, or email content.
 2. Extract the recipient's organization from the thread, signature, or the domain of the recipient's email address (e.g., lars.pedersen@grundfos.com -> Grundfos). Never use the sender's organization.
 3. Determine the offering type from the conversation context.
-4. Only respond with valid JSON. Use DKK as the default currency."""
+4. Summarize the conversation in Danish in 2-3 sentences, focusing on important business points, requirements and next steps.
+5. Only respond with valid JSON. Use DKK as the default currency."""
+
+# Structured output schema for a single email analysis, so the model can only
+# return a well-formed result
+EMAIL_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "email_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "is_sales_opportunity": {"type": "boolean"},
+                "confidence": {"type": "number"},
+                "opportunity_type": {
+                    "type": "string",
+                    "enum": ["new_business", "upsell", "follow_up", "inquiry", "other"],
+                },
+                "estimated_value": {"type": "number"},
+                "currency": {"type": "string"},
+                "urgency": {"type": "string", "enum": ["high", "medium", "low"]},
+                "next_action": {
+                    "type": "string",
+                    "enum": [
+                        "schedule_meeting",
+                        "send_proposal",
+                        "follow_up",
+                        "no_action",
+                    ],
+                },
+                "person_name": {"type": "string"},
+                "organization_name": {"type": "string"},
+                "offering_type": {
+                    "type": "string",
+                    "enum": [
+                        "security_solution",
+                        "software",
+                        "crm",
+                        "consulting",
+                        "web_design",
+                        "other",
+                    ],
+                },
+                "key_points": {"type": "array", "items": {"type": "string"}},
+                "conversation_summary_da": {"type": "string"},
+                "ai_generated": {"type": "boolean"},
+            },
+            "required": [
+                "is_sales_opportunity",
+                "confidence",
+                "opportunity_type",
+                "estimated_value",
+                "currency",
+                "urgency",
+                "next_action",
+                "person_name",
+                "organization_name",
+                "offering_type",
+                "key_points",
+                "conversation_summary_da",
+                "ai_generated",
+            ],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Batched Email Analysis Prompt
+EMAIL_BATCH_ANALYSIS_SYSTEM_PROMPT = """Analyze each of the email conversations provided by the user separately and extract sales opportunity information.
+
+Please provide a JSON response with the following structure, with one entry per email in the same order:
+{
+    "analyses": [
+        {
+            "email_index": 1,
+            "is_sales_opportunity": true/false,
+            "confidence": 0.0-1.0,
+            "opportunity_type": "new_business|upsell|follow_up|inquiry|other",
+            "estimated_value": 0,
+            "currency": "DKK",
+            "urgency": "high|medium|low",
+            "next_action": "schedule_meeting|send_proposal|follow_up|no_action",
+            "person_name": "extracted_full_name_from_emails",
+            "organization_name": "recipient_organization_from_signature_or_domain",
+            "offering_type": "security_solution|software|crm|consulting|web_design|other",
+            "key_points": ["point1", "point2"],
+            "conversation_summary_da": "2-3 sentence summary in Danish",
+            "ai_generated": true
+        }
+    ]
+}
+
+Instructions:
+1. Analyze every email on its own; never mix information between emails.
+2. Extract the recipient's full name from email addresses, signatures, or email content.
+3. Extract the recipient's organization from the thread, signature, or the domain of the recipient's email address (e.g., lars.pedersen@grundfos.com -> Grundfos). Never use the sender's organization.
+4. Determine the offering type from the conversation context.
+5. Summarize each conversation in Danish in 2-3 sentences, focusing on important business points, requirements and next steps.
+6. Only respond with valid JSON. Use DKK as the default currency."""
 
 # Organization Name Extraction Prompt
 ORG_NAME_PROMPT = """Extract the most likely real company name from this email domain and content. If it's a personal email, return an empty string.
@@ -45,17 +157,64 @@ DANISH_SUMMARY_PROMPT = """Opsummer denne e-mail samtale på dansk i 2-3 sætnin
 Opsummering:"""
 
 
-def build_email_analysis_prompt(email_data: dict) -> str:
-    """Build the full email analysis prompt with conversation context."""
-    # Build full conversation context including current email and thread
-    full_conversation = f"Current Email:\nFrom: {email_data['from']}\nTo: {email_data['to']}\nSubject: {email_data['subject']}\nContent: {email_data['content']}\n"
+def _trim_email(
+    content: str, strip_quoted: bool = True, max_chars: int = EMAIL_CONTENT_MAX_CHARS
+) -> str:
+    """Drop quoted replies and the signature block, then cap the length."""
+    if strip_quoted:
+        content = _QUOTED_REPLY_RE.split(content, maxsplit=1)[0]
+    content = content.split("\n-- \n", 1)[0].strip()
+
+    if len(content) > max_chars:
+        content = (
+            content[:EMAIL_CONTENT_HEAD_CHARS]
+            + "\n[...]\n"
+            + content[-EMAIL_CONTENT_TAIL_CHARS:]
+        )
+
+    return content
 
-    if email_data.get("email_thread"):
-        full_conversation += "\nPrevious emails in thread:\n"
-        for i, thread_email in enumerate(email_data["email_thread"], 1):
-            full_conversation += f"\nEmail {i}:\nFrom: {thread_email['from']}\nTo: {thread_email['to']}\nSubject: {thread_email['subject']}\nContent: {thread_email['content']}\n"
 
-    return EMAIL_ANALYSIS_PROMPT.format(full_conversation=full_conversation)
+def build_conversation_context(email_data: dict) -> str:
+    """Build the conversation context for an email and its thread."""
+    thread = email_data.get("email_thread")
+
+    # Quoted replies only repeat the thread when the thread is sent as well
+    content = _trim_email(email_data["content"], strip_quoted=bool(thread))
+
+    # Build full conversation context including current email and thread
+    parts = [
+        f"Current Email:\nFrom: {email_data['from']}\nTo: {email_data['to']}\nSubject: {email_data['subject']}\nContent: {content}\n"
+    ]
+
+    if thread:
+        parts.append("\nPrevious emails in thread:\n")
+        parts.extend(
+            f"\nEmail {i}:\nFrom: {thread_email['from']}\nTo: {thread_email['to']}\nSubject: {thread_email['subject']}\nContent: {_trim_email(thread_email['content'])}\n"
+            for i, thread_email in enumerate(thread, 1)
+        )
+
+    return "".join(parts)
+
+
+def build_email_analysis_messages(email_data: dict) -> list:
+    """Build the chat messages for analyzing one email conversation."""
+    return [
+        {"role": "system", "content": EMAIL_ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": build_conversation_context(email_data)},
+    ]
+
+
+def build_email_batch_analysis_messages(emails: list) -> list:
+    """Build the chat messages for analyzing several email conversations at once."""
+    conversations = "\n".join(
+        f"=== Email conversation {i} ===\n{build_conversation_context(email_data)}"
+        for i, email_data in enumerate(emails, 1)
+    )
+    return [
+        {"role": "system", "content": EMAIL_BATCH_ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": conversations},
+    ]
 
 
 def build_org_name_prompt(domain: str, email_content: str) -> str:
@@ -2,7 +2,7 @@ import os
 import openai
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import asyncio
 import sys
 
@@ -10,14 +10,21 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from agents.orchestrator import AgentOrchestrator
+from agents.analyze_email import EmailAnalyzer
+from app.lib.http_client import http_client
 
 router = APIRouter()
 
-# Configure OpenRouter client
-client = openai.OpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY"), base_url="https://openrouter.ai/api/v1"
+# Configure OpenRouter client on the shared connection pool
+client = openai.AsyncOpenAI(
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+    base_url="https://openrouter.ai/api/v1",
+    http_client=http_client,
 )
 
+# Sample emails processed at the same time by the production agent test
+MAX_CONCURRENT_EMAILS = 5
+
 
 class TestRequest(BaseModel):
     message: str
@@ -31,6 +38,11 @@ class TestResponse(BaseModel):
     error: Optional[str] = None
 
 
+class BatchAnalysisRequest(BaseModel):
+    emails: List[Dict[str, Any]]
+    max_cost: Optional[float] = None
+
+
 class ProductionTestResponse(BaseModel):
     success: bool
     results: list
@@ -46,7 +58,7 @@ async def test_openrouter(request: TestRequest):
         raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
 
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=request.model,
             messages=[{"role": "user", "content": request.message}],
             max_tokens=100,
@@ -75,6 +87,57 @@ async def ai_health_check():
     }
 
 
+@router.post("/batch-analysis")
+async def submit_batch_analysis(request: BatchAnalysisRequest):
+    """Queue emails for discounted offline analysis with the OpenAI Batch API."""
+
+    if not os.getenv("OPENAI_API_KEY"):
+        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+
+    analyzer = EmailAnalyzer()
+
+    # Refuse jobs projected to cost more than the caller allows (USD)
+    cost_estimate = analyzer.estimate_analysis_cost(request.emails)
+    if request.max_cost is not None:
+        if "error" in cost_estimate:
+            raise HTTPException(status_code=400, detail=cost_estimate["error"])
+        if cost_estimate["total_cost"] > request.max_cost:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Estimated cost ${cost_estimate['total_cost']:.4f} exceeds max_cost ${request.max_cost:.4f}",
+            )
+
+    try:
+        batch_id = await analyzer.submit_batch_job(request.emails)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to submit batch analysis: {str(e)}"
+        )
+
+    return {
+        "batch_id": batch_id,
+        "email_count": len(request.emails),
+        "cost_estimate": cost_estimate,
+    }
+
+
+@router.get("/batch-analysis/{batch_id}")
+async def get_batch_analysis(batch_id: str):
+    """Poll a batch analysis job; results are keyed by email id once completed."""
+
+    if not os.getenv("OPENAI_API_KEY"):
+        raise HTTPException(status_code=500, detail="OpenAI API key not configured")
+
+    try:
+        job = await EmailAnalyzer().get_batch_job_results(batch_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to get batch analysis: {str(e)}"
+        )
+
+    return {"batch_id": batch_id, **job}
+
+
 @router.post("/test-production-agents", response_model=ProductionTestResponse)
 async def test_production_agents():
     """Test production AI agents with sample emails in production environment."""
@@ -167,69 +230,25 @@ Mathias""",
     # Test user ID (you can change this to test with different users)
     test_user_id = "0babb68e-4bd5-4b2d-ac57-49826369178d"
 
-    results = []
-
     try:
-        for i, email_data in enumerate(sample_emails, 1):
-            try:
-                # Create orchestrator
-                orchestrator = AgentOrchestrator(test_user_id)
-
-                # Process email
-                result = await orchestrator.process_email(email_data)
-
-                # Add email info to result
-                result["email_info"] = {
-                    "id": email_data["id"],
-                    "to": email_data["to"],
-                    "subject": email_data["subject"],
-                }
-
-                results.append(result)
-
-            except Exception as e:
-                results.append(
-                    {
-                        "success": False,
-                        "error": str(e),
-                        "email_info": {
-                            "id": email_data["id"],
-                            "to": email_data["to"],
-                            "subject": email_data["subject"],
-                        },
-                    }
-                )
-
-        # Calculate summary
-        total_emails = len(results)
-        successful_processing = sum(1 for r in results if r.get("success"))
-        sales_opportunities = sum(
-            1
-            for r in results
-            if r.get("success")
-            and r.get("ai_result", {}).get("is_sales_opportunity", False)
-        )
-        deals_created = sum(
-            1
-            for r in results
-            if r.get("success")
-            and r.get("pipedrive_result", {}).get("deal_created", False)
+        # Analyze all sample emails with a single batched AI request
+        try:
+            ai_results = await EmailAnalyzer().analyze_emails_batch(sample_emails)
+        except Exception:
+            # Let each email be analyzed on its own instead
+            ai_results = [None] * len(sample_emails)
+
+        # Process the emails concurrently, capped to stay within API rate limits
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_EMAILS)
+        results = await asyncio.gather(
+            *(
+                _process_sample_email(test_user_id, email_data, semaphore, ai_result)
+                for email_data, ai_result in zip(sample_emails, ai_results)
+            )
         )
 
-        # Count outcomes
-        outcome_counts = {}
-        for result in results:
-            if result.get("success"):
-                outcome = result.get("outcome", "Unknown")
-                outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
-
-        summary = {
-            "total_emails": total_emails,
-            "successful_processing": successful_processing,
-            "sales_opportunities": sales_opportunities,
-            "deals_created": deals_created,
-            "outcome_counts": outcome_counts,
-        }
+        # Calculate summary
+        summary = _summarize_results(results)
 
         return ProductionTestResponse(success=True, results=results, summary=summary)
 
@@ -242,6 +261,64 @@ Mathias""",
         )
 
 
+async def _process_sample_email(
+    user_id: str,
+    email_data: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    ai_result: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Run one sample email through the agents, capturing failures as results."""
+    email_info = {
+        "id": email_data["id"],
+        "to": email_data["to"],
+        "subject": email_data["subject"],
+    }
+
+    async with semaphore:
+        try:
+            # Create orchestrator
+            orchestrator = await asyncio.to_thread(AgentOrchestrator, user_id)
+
+            # Process email
+            result = await orchestrator.process_email(email_data, ai_result)
+
+            # Add email info to result
+            result["email_info"] = email_info
+            return result
+
+        except Exception as e:
+            return {"success": False, "error": str(e), "email_info": email_info}
+
+
+def _summarize_results(results: list) -> Dict[str, Any]:
+    """Summarize agent results in a single pass."""
+    successful_processing = 0
+    sales_opportunities = 0
+    deals_created = 0
+    outcome_counts = {}
+
+    for result in results:
+        if not result.get("success"):
+            continue
+
+        successful_processing += 1
+        if (result.get("ai_result") or {}).get("is_sales_opportunity", False):
+            sales_opportunities += 1
+        if (result.get("pipedrive_result") or {}).get("deal_created", False):
+            deals_created += 1
+
+        outcome = result.get("outcome", "Unknown")
+        outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
+
+    return {
+        "total_emails": len(results),
+        "successful_processing": successful_processing,
+        "sales_opportunities": sales_opportunities,
+        "deals_created": deals_created,
+        "outcome_counts": outcome_counts,
+    }
+
+
 @router.post("/test-with-user-tokens/{user_id}", response_model=ProductionTestResponse)
 async def test_with_user_tokens(user_id: str):
     """Test production AI agents with a specific user's stored tokens."""
@@ -294,7 +371,7 @@ Email: mathias@besafe.dk""",
 
     try:
         # Create orchestrator with specific user ID
-        orchestrator = AgentOrchestrator(user_id)
+        orchestrator = await asyncio.to_thread(AgentOrchestrator, user_id)
 
         # Process email
         result = await orchestrator.process_email(sample_email)
@@ -309,36 +386,8 @@ Email: mathias@besafe.dk""",
         results.append(result)
 
         # Calculate summary
-        total_emails = len(results)
-        successful_processing = sum(1 for r in results if r.get("success"))
-        sales_opportunities = sum(
-            1
-            for r in results
-            if r.get("success")
-            and r.get("ai_result", {}).get("is_sales_opportunity", False)
-        )
-        deals_created = sum(
-            1
-            for r in results
-            if r.get("success")
-            and r.get("pipedrive_result", {}).get("deal_created", False)
-        )
-
-        # Count outcomes
-        outcome_counts = {}
-        for result in results:
-            if result.get("success"):
-                outcome = result.get("outcome", "Unknown")
-                outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
-
-        summary = {
-            "total_emails": total_emails,
-            "successful_processing": successful_processing,
-            "sales_opportunities": sales_opportunities,
-            "deals_created": deals_created,
-            "outcome_counts": outcome_counts,
-            "user_id": user_id,
-        }
+        summary = _summarize_results(results)
+        summary["user_id"] = user_id
 
         return ProductionTestResponse(success=True, results=results, summary=summary)
 
@@ -385,7 +434,7 @@ async def test_token_refresh(user_id: str):
         try:
             from app.agents.pipedrive_manager import PipedriveManager
 
-            pipedrive_manager = PipedriveManager(user_id)
+            pipedrive_manager = await asyncio.to_thread(PipedriveManager, user_id)
 
             # Test a simple API call that will trigger token refresh if needed
             # Use a more reliable endpoint that we know works
@@ -422,7 +471,7 @@ async def test_token_refresh(user_id: str):
         try:
             from app.agents.microsoft_manager import MicrosoftManager
 
-            microsoft_manager = MicrosoftManager(user_id)
+            microsoft_manager = await asyncio.to_thread(MicrosoftManager, user_id)
 
             # Test a simple API call that will trigger token refresh if needed
             user_info = await microsoft_manager.get_user_info()
@@ -19,15 +19,18 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/monitoring", tags=["monitoring"])
 
+# Static response bodies
+MONITORING_TEST_BODY = {
+    "success": True,
+    "message": "Monitoring API is working",
+    "timestamp": "2024-01-01T00:00:00Z",
+}
+
 
 @router.get("/test")
 async def test_monitoring():
     """Test endpoint that doesn't require authentication"""
-    return {
-        "success": True,
-        "message": "Monitoring API is working",
-        "timestamp": "2024-01-01T00:00:00Z",
-    }
+    return MONITORING_TEST_BODY
 
 
 @router.get("/costs/summary")
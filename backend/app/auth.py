@@ -1,33 +1,81 @@
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
 import os
-from typing import Optional
+import time
+import functools
+import jwt
+from typing import Optional, Tuple
 
-# Initialize Supabase client
-supabase_url = os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
-supabase_service_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+from app.lib.supabase_client import supabase_manager
 
-if not supabase_url or not supabase_service_key:
-    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables are required")
+# Secret used by Supabase to sign user JWTs (enables local verification)
+supabase_jwt_secret = os.environ.get('SUPABASE_JWT_SECRET')
 
-supabase: Client = create_client(supabase_url, supabase_service_key)
+# Local verification results are reused for the same token within this many seconds
+TOKEN_CACHE_WINDOW_SECONDS = 60
 
 security = HTTPBearer()
 
 def verify_supabase_token(token: str) -> Optional[dict]:
     """Verify Supabase JWT token and return user data"""
+    # Local verification cannot detect revoked sessions; only the remote
+    # fallback can, and it runs only when local verification fails. A revoked
+    # token with a valid signature is accepted until its exp
+    window = int(time.time() // TOKEN_CACHE_WINDOW_SECONDS)
+    verified = _verify_token_locally(token, window) or _verify_token_remotely(token)
+    
+    if not verified:
+        return None
+    
+    user, expires_at = verified
+    if expires_at is not None and expires_at <= time.time():
+        return None
+    
+    return dict(user)
+
+@functools.lru_cache(maxsize=4096)
+def _verify_token_locally(token: str, window: int) -> Optional[Tuple[dict, Optional[float]]]:
+    """Verify the JWT signature once per token and cache window (callers check expiry)"""
+    if not supabase_jwt_secret:
+        return None
+    
+    try:
+        payload = jwt.decode(
+            token,
+            supabase_jwt_secret,
+            algorithms=['HS256'],
+            audience='authenticated'
+        )
+    except jwt.InvalidTokenError:
+        return None
+    
+    # A signed token without a subject does not identify a user
+    user_id = payload.get('sub')
+    if not user_id:
+        return None
+    
+    user = {
+        'id': user_id,
+        'email': payload.get('email'),
+        'aud': payload.get('aud'),
+        'role': payload.get('role')
+    }
+    return user, payload.get('exp')
+
+def _verify_token_remotely(token: str) -> Optional[Tuple[dict, Optional[float]]]:
+    """Verify the token with Supabase Auth"""
     try:
         # Verify token with Supabase
-        result = supabase.auth.get_user(token)
+        result = supabase_manager.client.auth.get_user(token)
         
         if result.user:
-            return {
+            user = {
                 'id': result.user.id,
                 'email': result.user.email,
                 'aud': result.user.aud,
                 'role': result.user.role
             }
+            return user, None
         
         return None
     except Exception as e:
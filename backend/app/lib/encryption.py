@@ -2,11 +2,15 @@ import os
 import base64
 import hashlib
 import secrets
+import functools
 from typing import Dict
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Number of per-salt derived keys kept in memory
+DERIVED_KEY_CACHE_SIZE = 1024
+
 class TokenEncryption:
     def __init__(self):
         encryption_key = os.getenv("ENCRYPTION_KEY")
@@ -33,18 +37,33 @@ class TokenEncryption:
         # Ensure the key is exactly 32 bytes (256 bits)
         if len(self.encryption_key) != 32:
             raise ValueError("ENCRYPTION_KEY must be exactly 32 bytes")
+        
+        # Hash state after absorbing the master key; each derivation only
+        # has to copy it and feed in the salt
+        self._key_hash = hashlib.sha256(self.encryption_key)
+        
+        # Stored tokens are decrypted repeatedly with the same salt, so
+        # remember their derived keys. Encryption uses a fresh random salt
+        # every time and derives uncached, keeping those keys out of the cache
+        self._derive_decryption_key = functools.lru_cache(
+            maxsize=DERIVED_KEY_CACHE_SIZE
+        )(self._derive_key)
     
     def _derive_key(self, salt: bytes) -> bytes:
         """Derive a key from the master key using PBKDF2-like approach"""
         # Use SHA256 for key derivation (simplified PBKDF2)
-        key = hashlib.sha256(self.encryption_key + salt).digest()
-        return key
+        key_hash = self._key_hash.copy()
+        key_hash.update(salt)
+        return key_hash.digest()
     
     def _xor_encrypt(self, data: bytes, key: bytes) -> bytes:
         """Simple XOR encryption (for basic token protection)"""
         # Repeat key to match data length
         repeated_key = (key * (len(data) // len(key) + 1))[:len(data)]
-        return bytes(a ^ b for a, b in zip(data, repeated_key))
+        # XOR as big integers so the work happens in C instead of per byte
+        return (
+            int.from_bytes(data, "big") ^ int.from_bytes(repeated_key, "big")
+        ).to_bytes(len(data), "big")
     
     def encrypt_token(self, token: str) -> str:
         """Encrypt a token string using built-in libraries"""
@@ -64,7 +83,7 @@ class TokenEncryption:
             return base64.urlsafe_b64encode(combined).decode()
             
         except Exception as e:
-            logger.error(f"Error encrypting token: {str(e)}")
+            logger.error("Error encrypting token: %s", e)
             raise Exception(f"Failed to encrypt token: {str(e)}")
     
     def decrypt_token(self, encrypted_token: str) -> str:
@@ -78,7 +97,7 @@ class TokenEncryption:
             encrypted_data = combined[16:]
             
             # Derive the same key
-            derived_key = self._derive_key(salt)
+            derived_key = self._derive_decryption_key(salt)
             
             # Decrypt the data
             decrypted_data = self._xor_encrypt(encrypted_data, derived_key)
@@ -86,7 +105,7 @@ class TokenEncryption:
             return decrypted_data.decode('utf-8')
             
         except Exception as e:
-            logger.error(f"Error decrypting token: {str(e)}")
+            logger.error("Error decrypting token: %s", e)
             raise Exception(f"Failed to decrypt token: {str(e)}")
     
     def encrypt_dict(self, data: dict) -> dict:
@@ -114,7 +133,7 @@ class TokenEncryption:
                 try:
                     decrypted_data[field] = self.decrypt_token(decrypted_data[field])
                 except Exception as e:
-                    logger.warning(f"Could not decrypt {field}: {str(e)}")
+                    logger.warning("Could not decrypt %s: %s", field, e)
                     # Keep encrypted value if decryption fails
                     pass
         
@@ -4,10 +4,16 @@ Error Handler Utilities
 This module provides error handling decorators and utilities for the application.
 """
 
+import asyncio
 import functools
+import inspect
+import random
 import time
 from typing import Callable, Any, Dict, Optional
 
+import httpx
+import openai
+
 # Use absolute imports for testing compatibility
 try:
     from app.lib.supabase_client import supabase_manager
@@ -24,6 +30,12 @@ class AIAnalysisError(Exception):
     pass
 
 
+class TransientAIError(AIAnalysisError):
+    """AI provider error worth retrying (rate limit, timeout, server error)."""
+
+    pass
+
+
 class PipedriveError(Exception):
     """Custom exception for Pipedrive API errors."""
 
@@ -42,15 +54,52 @@ class MicrosoftError(Exception):
     pass
 
 
+# AI provider status codes that usually succeed when retried
+RETRYABLE_AI_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# Error messages quote at most this many bytes of a failed response's body
+ERROR_BODY_EXCERPT_BYTES = 512
+
+# Retry policy for transient AI provider errors
+AI_MAX_ATTEMPTS = 5
+AI_RETRY_BASE_DELAY = 1  # seconds
+AI_RETRY_MAX_DELAY = 30  # seconds
+
+_TRANSIENT_AI_EXCEPTIONS = (
+    TransientAIError,
+    httpx.TransportError,
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def response_excerpt(response: httpx.Response) -> str:
+    """Decode the start of a response body for an error message."""
+    return response.content[:ERROR_BODY_EXCERPT_BYTES].decode("utf-8", "replace")
+
+
+def ai_error_for_status(status_code: int, message: str) -> AIAnalysisError:
+    """Build the error for a failed AI API response, marking transient failures."""
+    if status_code in RETRYABLE_AI_STATUS_CODES:
+        return TransientAIError(message)
+    return AIAnalysisError(message)
+
+
+def _require_coroutine_function(func: Callable, decorator: str):
+    """Reject sync functions at decoration time instead of returning unawaited coroutines."""
+    if not inspect.iscoroutinefunction(func):
+        raise TypeError(f"@{decorator} can only wrap async functions, got {func!r}")
+
+
 def handle_ai_errors(func: Callable) -> Callable:
     """Decorator to handle AI analysis errors with logging and retry logic."""
+    _require_coroutine_function(func, "handle_ai_errors")
 
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        max_retries = 3
-        retry_delay = 1  # seconds
-
-        for attempt in range(max_retries):
+        for attempt in range(AI_MAX_ATTEMPTS):
             try:
                 start_time = time.time()
                 result = await func(*args, **kwargs)
@@ -70,30 +119,41 @@ def handle_ai_errors(func: Callable) -> Callable:
                 return result
 
             except Exception as e:
+                transient = isinstance(e, _TRANSIENT_AI_EXCEPTIONS)
                 agent_logger.error(
                     f"AI operation {func.__name__} failed",
                     {
                         "operation": func.__name__,
                         "error": str(e),
                         "attempt": attempt + 1,
-                        "max_retries": max_retries,
+                        "max_retries": AI_MAX_ATTEMPTS,
+                        "transient": transient,
                     },
                 )
 
-                if attempt == max_retries - 1:
+                # Bad requests, auth and parsing errors fail the same way again
+                if not transient:
+                    raise AIAnalysisError(f"AI operation failed: {str(e)}") from e
+
+                if attempt == AI_MAX_ATTEMPTS - 1:
                     # Last attempt failed, raise the error
                     raise AIAnalysisError(
-                        f"AI operation failed after {max_retries} attempts: {str(e)}"
-                    )
+                        f"AI operation failed after {AI_MAX_ATTEMPTS} attempts: {str(e)}"
+                    ) from e
 
-                # Wait before retrying
-                time.sleep(retry_delay * (attempt + 1))
+                # Exponential backoff with full jitter so callers don't retry in step
+                await asyncio.sleep(
+                    random.uniform(
+                        0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * 2**attempt)
+                    )
+                )
 
     return wrapper
 
 
 def handle_pipedrive_errors(func: Callable) -> Callable:
     """Decorator to handle Pipedrive API errors with logging and retry logic."""
+    _require_coroutine_function(func, "handle_pipedrive_errors")
 
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
@@ -130,13 +190,14 @@ def handle_pipedrive_errors(func: Callable) -> Callable:
                     )
 
                 # Wait before retrying
-                time.sleep(retry_delay * (attempt + 1))
+                await asyncio.sleep(retry_delay * (attempt + 1))
 
     return wrapper
 
 
 def handle_token_refresh_errors(func: Callable) -> Callable:
     """Decorator to handle token refresh errors."""
+    _require_coroutine_function(func, "handle_token_refresh_errors")
 
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
@@ -154,6 +215,7 @@ def handle_token_refresh_errors(func: Callable) -> Callable:
 
 def handle_microsoft_errors(func: Callable) -> Callable:
     """Decorator to handle Microsoft Graph API errors with logging and retry logic."""
+    _require_coroutine_function(func, "handle_microsoft_errors")
 
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
@@ -190,7 +252,7 @@ def handle_microsoft_errors(func: Callable) -> Callable:
                     )
 
                 # Wait before retrying
-                time.sleep(retry_delay * (attempt + 1))
+                await asyncio.sleep(retry_delay * (attempt + 1))
 
     return wrapper
 
@@ -210,7 +272,6 @@ async def log_activity_to_supabase(
 
     except Exception as e:
         # Log the error but don't fail the main operation
-        print(f"Error logging activity: {e}")
         agent_logger.error(
             "Failed to log activity to Supabase",
             {"error": str(e), "activity_type": activity_type, "user_id": user_id},
@@ -231,7 +292,6 @@ async def log_opportunity_to_supabase(
 
     except Exception as e:
         # Log the error but don't fail the main operation
-        print(f"Error logging opportunity: {e}")
         agent_logger.error(
             "Failed to log opportunity to Supabase",
             {"error": str(e), "user_id": user_id, "email_to": email_data.get("to")},
@@ -0,0 +1,32 @@
+"""
+Shared HTTP Client
+
+This module provides a pooled httpx.AsyncClient so outbound API calls reuse
+keep-alive connections instead of paying a TCP+TLS handshake per request.
+"""
+
+import os
+import httpx
+
+# Default timeout for outbound calls (individual requests may override it)
+HTTP_TIMEOUT = 10.0
+
+# Concurrent email processing and webhook bursts (parallel Graph, Pipedrive and
+# OpenRouter calls) share this pool, so keep it well above the number of
+# requests expected in flight at once; otherwise callers queue on the local
+# pool before the remote rate limits are ever reached
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "500"))
+
+# Idle connections kept open for reuse; size this to the expected number of
+# concurrent email analyses so bursts skip the TCP+TLS handshake
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "200"))
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=min(HTTP_MAX_KEEPALIVE, HTTP_MAX_CONNECTIONS),
+    keepalive_expiry=30.0,
+)
+
+
+# Create global instance
+http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
@@ -0,0 +1,230 @@
+"""
+LLM Response Cache
+
+This module caches AI completions keyed by a hash of the model and prompt,
+so identical requests are answered without another API round-trip. A second
+cache matches near-duplicate emails (templated outreach, marketing blasts)
+by word shingle similarity.
+
+Set LLM_CACHE_DIR to also keep exact-match completions on disk, so repeated
+runs over the same emails (e.g. during development) skip the API entirely.
+The disk cache is a shelve file and is single-process only: do not point
+several workers at the same LLM_CACHE_DIR.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Optional, Tuple
+
+# Cached completions are reused for this many seconds (default one week);
+# emails are analyzed at a fixed low temperature, so answers do not go stale
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+# Maximum number of completions kept in memory
+LLM_CACHE_MAX_ENTRIES = 1024
+# Minimum Jaccard similarity for two emails to share a completion
+SIMILARITY_THRESHOLD = 0.95
+# Number of consecutive words per shingle
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class LLMCache:
+    """Bounded in-memory cache of AI completions with a time-to-live."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        cache_dir: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Completions keyed by cache key -> (expires_at, content)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Optional persistent copy keyed by cache key -> (expires_at_epoch, content).
+        # It is only touched from worker threads, serialized by its own lock
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk = shelve.open(os.path.join(cache_dir, "llm_cache"))
+
+    @staticmethod
+    def cache_key(model: str, prompt: str) -> str:
+        """Build the cache key for a model and prompt."""
+        payload = json.dumps({"model": model, "prompt": prompt}, sort_keys=True)
+        return hashlib.blake2b(payload.encode(), digest_size=32).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached completion if it has not expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, content = entry
+                if time.monotonic() >= expires_at:
+                    del self._entries[key]
+                    return None
+
+                self._entries.move_to_end(key)
+                return content
+
+        if self._disk is None:
+            return None
+
+        # Disk reads block, so keep them off the event loop
+        return await asyncio.to_thread(self._get_from_disk, key)
+
+    def _get_from_disk(self, key: str) -> Optional[str]:
+        """Load a completion stored by an earlier process into memory."""
+        with self._disk_lock:
+            entry = self._disk.get(key)
+            if entry is None:
+                return None
+
+            expires_at, content = entry
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                del self._disk[key]
+                return None
+
+        with self._lock:
+            self._store(key, content, time.monotonic() + remaining)
+        return content
+
+    async def set(self, key: str, content: str, ttl_seconds: Optional[int] = None):
+        """Store a completion, evicting the least recently used entries.
+
+        ttl_seconds overrides the cache's default time-to-live for this entry.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+
+        with self._lock:
+            self._store(key, content, time.monotonic() + ttl_seconds)
+
+        if self._disk is not None:
+            await asyncio.to_thread(
+                self._set_on_disk, key, (time.time() + ttl_seconds, content)
+            )
+
+    def _set_on_disk(self, key: str, entry: Tuple[float, str]):
+        """Persist a completion for later processes."""
+        with self._disk_lock:
+            self._disk[key] = entry
+            self._disk.sync()
+
+    def _store(self, key: str, content: str, expires_at: float):
+        """Keep a completion in memory; the caller holds the lock."""
+        self._entries[key] = (expires_at, content)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def clear(self):
+        """Drop all cached completions."""
+        with self._lock:
+            self._entries.clear()
+
+        if self._disk is not None:
+            await asyncio.to_thread(self._clear_disk)
+
+    def _clear_disk(self):
+        """Drop all persisted completions."""
+        with self._disk_lock:
+            self._disk.clear()
+            self._disk.sync()
+
+
+class SimilarityCache:
+    """Bounded in-memory cache matching near-duplicate texts by word shingles."""
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Completions keyed by cache key -> (stored_at, model, shingles, content)
+        self._entries: "OrderedDict[str, Tuple[float, str, FrozenSet[int], str]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def shingles(text: str) -> FrozenSet[int]:
+        """Hash the overlapping word n-grams of a text, ignoring case and spacing."""
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < SHINGLE_SIZE:
+            return frozenset([hash(tuple(words))])
+
+        return frozenset(
+            hash(tuple(words[i : i + SHINGLE_SIZE]))
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        )
+
+    def get(self, model: str, text: str) -> Optional[str]:
+        """Return the completion of the most similar cached text above the threshold."""
+        shingles = self.shingles(text)
+        now = time.monotonic()
+
+        with self._lock:
+            best_key = None
+            best_score = self.threshold
+            for key, (stored_at, entry_model, entry_shingles, _) in list(
+                self._entries.items()
+            ):
+                if now - stored_at >= self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if entry_model != model:
+                    continue
+
+                # Jaccard similarity can never exceed the ratio of the set sizes
+                smaller, larger = sorted((len(shingles), len(entry_shingles)))
+                if smaller < best_score * larger:
+                    continue
+
+                overlap = len(shingles & entry_shingles)
+                score = overlap / (len(shingles) + len(entry_shingles) - overlap)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                return None
+
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][3]
+
+    def set(self, model: str, text: str, content: str):
+        """Store a completion, evicting the least recently used entries."""
+        key = LLMCache.cache_key(model, text)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), model, self.shingles(text), content)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached completions."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Create global instances
+llm_cache = LLMCache(cache_dir=os.getenv("LLM_CACHE_DIR"))
+similarity_cache = SimilarityCache()
@@ -0,0 +1,104 @@
+"""
+Lookup Cache
+
+This module caches responses of idempotent third-party API lookups (such as
+Pipedrive contact and organization searches) for a short time, so the same
+query repeated across a batch of emails costs one round-trip. Concurrent
+misses for the same key share a single in-flight request.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Cached lookups are reused for this many seconds
+LOOKUP_CACHE_TTL_SECONDS = 300
+# Maximum number of lookups kept in memory
+LOOKUP_CACHE_MAX_ENTRIES = 1024
+
+
+class LookupCache:
+    """Bounded in-memory cache of API lookup responses with a time-to-live."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = LOOKUP_CACHE_TTL_SECONDS,
+        max_entries: int = LOOKUP_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Responses keyed by cache key -> (stored_at, response)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Lookups currently being fetched, keyed by cache key
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached response if it has not expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, response = entry
+        if time.monotonic() - stored_at >= self.ttl_seconds:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return response
+
+    def set(self, key: str, response: Dict[str, Any]):
+        """Store a response, evicting the least recently used entries."""
+        self._entries[key] = (time.monotonic(), response)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Return a cached response, or fetch it once for all concurrent callers."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        # Another caller is already fetching this lookup, wait for it
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            response = await fetch()
+            # Skip caching if the key was invalidated while fetching
+            if self._inflight.get(key) is future:
+                self.set(key, response)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            # Release waiters if the fetch was cancelled
+            if not future.done():
+                future.cancel()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def invalidate(self, key: str):
+        """Forget a cached response after the underlying data changed."""
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self):
+        """Drop all cached responses."""
+        self._entries.clear()
+
+
+# Create global instance
+lookup_cache = LookupCache()
@@ -1,105 +1,297 @@
 import os
+import asyncio
+import hashlib
 import secrets
-import requests
-from typing import Dict, Optional
-from urllib.parse import urlencode
+import threading
+import time
+import httpx
+import orjson
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import quote, urlencode
 import logging
 
+from app.lib.http_client import http_client
+
 logger = logging.getLogger(__name__)
 
+# Tokens this close to expiry are not served from the cache
+TOKEN_CACHE_EXPIRY_MARGIN = timedelta(seconds=60)
+# Cache lifetime for tokens stored without an expiry timestamp
+TOKEN_CACHE_DEFAULT_TTL = timedelta(minutes=5)
+# Refresh tokens this many seconds before they expire, per provider
+TOKEN_REFRESH_SKEW_SECONDS = {"pipedrive": 600, "microsoft": 300}
+# Replayed OAuth callbacks within this many seconds get the original response
+CALLBACK_REPLAY_TTL_SECONDS = 60
+# Maximum number of completed callbacks remembered for replay detection
+CALLBACK_REPLAY_CACHE_SIZE = 1024
+
+class ProviderSpec(NamedTuple):
+    """Static OAuth settings for a provider, read from the environment once"""
+    auth_url: str
+    token_url: str
+    api_base: str
+    scopes: Tuple[str, ...]
+    client_id: Optional[str]
+    client_secret: Optional[str]
+    redirect_uri: str
+
+
+_BASE_URL = os.getenv("RAILWAY_STATIC_URL", "http://localhost:8000")
+
+PROVIDERS: Dict[str, ProviderSpec] = {
+    "pipedrive": ProviderSpec(
+        auth_url="https://oauth.pipedrive.com/oauth/authorize",
+        token_url="https://oauth.pipedrive.com/oauth/token",
+        api_base="https://api.pipedrive.com/v1",
+        scopes=("deals:read", "deals:write", "persons:read", "persons:write"),
+        client_id=os.getenv("PIPEDRIVE_CLIENT_ID"),
+        client_secret=os.getenv("PIPEDRIVE_CLIENT_SECRET"),
+        redirect_uri=f"{_BASE_URL}/oauth/pipedrive/callback"
+    ),
+    "microsoft": ProviderSpec(
+        auth_url="https://login.microsoftonline.com/common/oauth2/v2.0/authorize",
+        token_url="https://login.microsoftonline.com/common/oauth2/v2.0/token",
+        api_base="https://graph.microsoft.com/v1.0",
+        scopes=(
+            "https://graph.microsoft.com/Mail.Read",
+            "https://graph.microsoft.com/Mail.ReadWrite",
+            "https://graph.microsoft.com/User.Read"
+        ),
+        client_id=os.getenv("MICROSOFT_CLIENT_ID"),
+        client_secret=os.getenv("MICROSOFT_CLIENT_SECRET"),
+        redirect_uri=f"{_BASE_URL}/oauth/microsoft/callback"
+    ),
+}
+
+
+def get_provider_spec(provider: str) -> ProviderSpec:
+    """Look up the OAuth settings for a provider"""
+    try:
+        return PROVIDERS[provider]
+    except KeyError:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+
 class OAuthManager:
     def __init__(self):
-        self.pipedrive_config = {
-            "auth_url": "https://oauth.pipedrive.com/oauth/authorize",
-            "token_url": "https://oauth.pipedrive.com/oauth/token",
-            "api_base": "https://api.pipedrive.com/v1",
-            "scopes": ["deals:read", "deals:write", "persons:read", "persons:write"],
-            "client_id": os.getenv("PIPEDRIVE_CLIENT_ID"),
-            "client_secret": os.getenv("PIPEDRIVE_CLIENT_SECRET"),
-            "redirect_uri": f"{os.getenv('RAILWAY_STATIC_URL', 'http://localhost:8000')}/oauth/pipedrive/callback"
+        # Decrypted tokens keyed by (user_id, provider) -> (tokens, expires_at)
+        self._token_cache: Dict[Tuple[str, str], Tuple[Dict, datetime]] = {}
+        self._token_cache_lock = threading.Lock()
+
+        # Refreshes in progress keyed by (user_id, provider)
+        self._refresh_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        # Responses of completed callbacks keyed by hashed authorization code
+        self._completed_callbacks: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._completed_callbacks_lock = threading.Lock()
+
+        # Authorization URLs up to the per-request state parameter
+        self._auth_url_prefixes = {
+            provider: self._build_auth_url_prefix(spec)
+            for provider, spec in PROVIDERS.items()
         }
-        
-        self.microsoft_config = {
-            "auth_url": "https://login.microsoftonline.com/common/oauth2/v2.0/authorize",
-            "token_url": "https://login.microsoftonline.com/common/oauth2/v2.0/token",
-            "api_base": "https://graph.microsoft.com/v1.0",
-            "scopes": [
-                "https://graph.microsoft.com/Mail.Read",
-                "https://graph.microsoft.com/Mail.ReadWrite",
-                "https://graph.microsoft.com/User.Read"
-            ],
-            "client_id": os.getenv("MICROSOFT_CLIENT_ID"),
-            "client_secret": os.getenv("MICROSOFT_CLIENT_SECRET"),
-            "redirect_uri": f"{os.getenv('RAILWAY_STATIC_URL', 'http://localhost:8000')}/oauth/microsoft/callback"
+
+    @staticmethod
+    def _build_auth_url_prefix(spec: ProviderSpec) -> str:
+        """Encode the static authorization parameters once"""
+        params = {
+            "client_id": spec.client_id or "",
+            "redirect_uri": spec.redirect_uri,
+            "response_type": "code",
+            "scope": " ".join(spec.scopes)
         }
+        return f"{spec.auth_url}?{urlencode(params, quote_via=quote)}&state="
     
     def generate_auth_url(self, provider: str, state: str) -> str:
         """Generate OAuth authorization URL for the specified provider"""
-        if provider == "pipedrive":
-            config = self.pipedrive_config
-        elif provider == "microsoft":
-            config = self.microsoft_config
-        else:
+        prefix = self._auth_url_prefixes.get(provider)
+        if prefix is None:
             raise ValueError(f"Unsupported provider: {provider}")
         
-        params = {
-            "client_id": config["client_id"],
-            "redirect_uri": config["redirect_uri"],
-            "response_type": "code",
-            "state": state,
-            "scope": " ".join(config["scopes"])
-        }
-        
-        auth_url = f"{config['auth_url']}?{urlencode(params)}"
-        logger.info(f"Generated OAuth URL for {provider}: {auth_url}")
+        auth_url = prefix + quote(state)
+        logger.info("Generated OAuth URL for %s: %s", provider, auth_url)
         return auth_url
     
     async def exchange_code_for_token(self, provider: str, code: str) -> Dict:
         """Exchange authorization code for access token"""
-        if provider == "pipedrive":
-            config = self.pipedrive_config
-        elif provider == "microsoft":
-            config = self.microsoft_config
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+        spec = get_provider_spec(provider)
         
         data = {
-            "client_id": config["client_id"],
-            "client_secret": config["client_secret"],
+            "client_id": spec.client_id,
+            "client_secret": spec.client_secret,
             "code": code,
             "grant_type": "authorization_code",
-            "redirect_uri": config["redirect_uri"]
+            "redirect_uri": spec.redirect_uri
         }
         
         try:
-            response = requests.post(config["token_url"], data=data)
+            response = await http_client.post(spec.token_url, data=data)
             response.raise_for_status()
-            token_data = response.json()
+            token_data = orjson.loads(response.content)
             
-            logger.info(f"Successfully exchanged code for token for {provider}")
+            logger.info("Successfully exchanged code for token for %s", provider)
             return token_data
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error exchanging code for token for {provider}: {str(e)}")
+        except httpx.HTTPError as e:
+            logger.error("Error exchanging code for token for %s: %s", provider, e)
             raise Exception(f"Failed to exchange code for token: {str(e)}")
     
     def validate_config(self) -> Dict[str, bool]:
         """Validate OAuth configuration"""
         validation = {
-            "pipedrive": {
-                "client_id": bool(self.pipedrive_config["client_id"]),
-                "client_secret": bool(self.pipedrive_config["client_secret"]),
-                "redirect_uri": bool(self.pipedrive_config["redirect_uri"])
-            },
-            "microsoft": {
-                "client_id": bool(self.microsoft_config["client_id"]),
-                "client_secret": bool(self.microsoft_config["client_secret"]),
-                "redirect_uri": bool(self.microsoft_config["redirect_uri"])
+            provider: {
+                "client_id": bool(spec.client_id),
+                "client_secret": bool(spec.client_secret),
+                "redirect_uri": bool(spec.redirect_uri)
             }
+            for provider, spec in PROVIDERS.items()
         }
         
         return validation
     
+    def get_cached_tokens(self, user_id: str, provider: str) -> Optional[Dict]:
+        """Return cached decrypted tokens if they are not about to expire"""
+        entry = self._token_cache.get((user_id, provider))
+        if not entry:
+            return None
+
+        tokens, expires_at = entry
+        if expires_at - datetime.utcnow() <= TOKEN_CACHE_EXPIRY_MARGIN:
+            self.invalidate_cached_tokens(user_id, provider)
+            return None
+
+        return tokens
+
+    def cache_tokens(
+        self, user_id: str, provider: str, tokens: Dict, expires_at: Optional[str] = None
+    ):
+        """Cache decrypted tokens until their expiry (or a default TTL)"""
+        expiry = self._parse_expires_at(expires_at)
+        if expiry is None:
+            expiry = datetime.utcnow() + TOKEN_CACHE_DEFAULT_TTL
+
+        with self._token_cache_lock:
+            self._token_cache[(user_id, provider)] = (tokens, expiry)
+
+    def invalidate_cached_tokens(self, user_id: str, provider: str):
+        """Drop cached tokens for a user and provider"""
+        with self._token_cache_lock:
+            self._token_cache.pop((user_id, provider), None)
+
+    def is_token_expired(
+        self,
+        expires_at: Optional[str],
+        skew_seconds: int = 60,
+        now: Optional[datetime] = None
+    ) -> bool:
+        """Check if a token expires within skew_seconds (unknown expiry never expires)"""
+        expiry = self._parse_expires_at(expires_at)
+        if expiry is None:
+            return False
+
+        return (now or datetime.utcnow()) + timedelta(seconds=skew_seconds) >= expiry
+
+    def needs_refresh(
+        self, provider: str, expires_at: Optional[str], now: Optional[datetime] = None
+    ) -> bool:
+        """Check if a still-valid token is close enough to expiry to refresh early"""
+        return self.is_token_expired(
+            expires_at, TOKEN_REFRESH_SKEW_SECONDS.get(provider, 60), now
+        )
+
+    async def refresh_once(
+        self, user_id: str, provider: str, refresh: Callable[[], Awaitable[Dict]]
+    ) -> Dict:
+        """Run a token refresh, sharing its result with concurrent callers"""
+        key = (user_id, provider)
+
+        # Another request is already refreshing these tokens, wait for it
+        inflight = self._refresh_inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._refresh_inflight[key] = future
+        self.invalidate_cached_tokens(user_id, provider)
+
+        try:
+            tokens = await refresh()
+            future.set_result(tokens)
+            return tokens
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            # Release waiters if the refresh was cancelled
+            if not future.done():
+                future.cancel()
+            del self._refresh_inflight[key]
+
+    @staticmethod
+    def _callback_key(provider: str, user_id: str, code: str) -> str:
+        """Hash an authorization code so raw codes are never kept in memory"""
+        return hashlib.blake2b(
+            f"{provider}:{user_id}:{code}".encode(), digest_size=16
+        ).hexdigest()
+
+    def get_completed_callback(self, provider: str, user_id: str, code: str) -> Optional[Dict]:
+        """Return the response of a recently completed callback for the same code"""
+        key = self._callback_key(provider, user_id, code)
+        with self._completed_callbacks_lock:
+            entry = self._completed_callbacks.get(key)
+            if entry is None:
+                return None
+
+            completed_at, response = entry
+            if time.monotonic() - completed_at >= CALLBACK_REPLAY_TTL_SECONDS:
+                del self._completed_callbacks[key]
+                return None
+
+            return response
+
+    def remember_completed_callback(
+        self, provider: str, user_id: str, code: str, response: Dict
+    ):
+        """Remember a callback response so replays of its code skip the token exchange"""
+        key = self._callback_key(provider, user_id, code)
+        now = time.monotonic()
+        with self._completed_callbacks_lock:
+            self._completed_callbacks[key] = (now, response)
+            self._completed_callbacks.move_to_end(key)
+
+            # Entries are in completion order, so expired ones are at the front
+            while self._completed_callbacks:
+                completed_at, _ = next(iter(self._completed_callbacks.values()))
+                if (
+                    len(self._completed_callbacks) <= CALLBACK_REPLAY_CACHE_SIZE
+                    and now - completed_at < CALLBACK_REPLAY_TTL_SECONDS
+                ):
+                    break
+                self._completed_callbacks.popitem(last=False)
+
+    @staticmethod
+    def _parse_expires_at(expires_at: Optional[str]) -> Optional[datetime]:
+        """Parse a stored expiry timestamp into a naive UTC datetime"""
+        if not expires_at:
+            return None
+
+        try:
+            # Timestamps written by this app are naive isoformat; only
+            # externally produced ones carry a trailing Z
+            if expires_at.endswith("Z"):
+                expires_at = expires_at[:-1] + "+00:00"
+            expiry = datetime.fromisoformat(expires_at)
+        except ValueError:
+            return None
+
+        if expiry.tzinfo is not None:
+            expiry = (expiry - expiry.utcoffset()).replace(tzinfo=None)
+        return expiry
+
     def generate_state(self) -> str:
         """Generate a secure random state parameter for OAuth"""
         return secrets.token_urlsafe(32)
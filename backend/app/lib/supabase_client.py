@@ -1,16 +1,24 @@
 import os
+import asyncio
 from supabase import create_client, Client
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Tuple
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Log rows are written in batches of up to LOG_BATCH_SIZE rows, collected
+# for LOG_FLUSH_INTERVAL seconds after the first row arrives
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.2
+
 
 class SupabaseManager:
     def __init__(self):
         self._client = None
         self._initialized = False
+        self._log_queue: Optional[asyncio.Queue] = None
+        self._flush_task: Optional[asyncio.Task] = None
 
     def _initialize_client(self):
         """Lazy initialization of Supabase client"""
@@ -42,6 +50,8 @@ class SupabaseManager:
             from app.lib.encryption import token_encryption
 
             encrypted_tokens = token_encryption.encrypt_dict(token_data)
+            now = datetime.utcnow()
+            now_iso = now.isoformat()
 
             integration_data = {
                 "user_id": user_id,
@@ -50,44 +60,50 @@ class SupabaseManager:
                 "refresh_token": encrypted_tokens.get("refresh_token"),
                 "token_type": token_data.get("token_type"),
                 "expires_in": token_data.get("expires_in"),
-                "expires_at": self._calculate_expires_at(token_data.get("expires_in")),
+                "expires_at": self._calculate_expires_at(
+                    token_data.get("expires_in"), now
+                ),
                 "provider_user_id": user_info.get("id"),
                 "provider_user_email": user_info.get("email"),
                 "provider_user_name": user_info.get("name"),
                 "is_active": True,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat(),
+                "created_at": now_iso,
+                "updated_at": now_iso,
             }
 
-            result = (
-                self.client.table("integrations").upsert(integration_data).execute()
+            # Upsert on the (user_id, provider) unique key so reconnecting
+            # replaces the existing row in a single round-trip
+            result = await asyncio.to_thread(
+                self.client.table("integrations")
+                .upsert(integration_data, on_conflict="user_id,provider")
+                .execute
             )
 
             if result.data:
                 logger.info(
-                    f"Successfully saved {provider} integration for user {user_id}"
+                    "Successfully saved %s integration for user %s", provider, user_id
                 )
                 return True
             else:
                 logger.error(
-                    f"Failed to save {provider} integration for user {user_id}"
+                    "Failed to save %s integration for user %s", provider, user_id
                 )
                 return False
 
         except Exception as e:
-            logger.error(f"Error saving {provider} integration: {str(e)}")
+            logger.error("Error saving %s integration: %s", provider, e)
             return False
 
     async def get_integration(self, user_id: str, provider: str) -> Optional[Dict]:
         """Get OAuth integration from database"""
         try:
-            result = (
+            result = await asyncio.to_thread(
                 self.client.table("integrations")
                 .select("*")
                 .eq("user_id", user_id)
                 .eq("provider", provider)
                 .eq("is_active", True)
-                .execute()
+                .execute
             )
 
             if result.data:
@@ -101,18 +117,18 @@ class SupabaseManager:
                 return None
 
         except Exception as e:
-            logger.error(f"Error getting {provider} integration: {str(e)}")
+            logger.error("Error getting %s integration: %s", provider, e)
             return None
 
     async def get_user_integrations(self, user_id: str) -> List[Dict]:
         """Get all active integrations for a user"""
         try:
-            result = (
+            result = await asyncio.to_thread(
                 self.client.table("integrations")
                 .select("*")
                 .eq("user_id", user_id)
                 .eq("is_active", True)
-                .execute()
+                .execute
             )
 
             integrations = []
@@ -126,35 +142,37 @@ class SupabaseManager:
             return integrations
 
         except Exception as e:
-            logger.error(f"Error getting user integrations: {str(e)}")
+            logger.error("Error getting user integrations: %s", e)
             return []
 
     async def deactivate_integration(self, user_id: str, provider: str) -> bool:
         """Deactivate an OAuth integration"""
         try:
-            result = (
+            result = await asyncio.to_thread(
                 self.client.table("integrations")
                 .update(
                     {"is_active": False, "updated_at": datetime.utcnow().isoformat()}
                 )
                 .eq("user_id", user_id)
                 .eq("provider", provider)
-                .execute()
+                .execute
             )
 
             if result.data:
                 logger.info(
-                    f"Successfully deactivated {provider} integration for user {user_id}"
+                    "Successfully deactivated %s integration for user %s",
+                    provider,
+                    user_id,
                 )
                 return True
             else:
                 logger.error(
-                    f"Failed to deactivate {provider} integration for user {user_id}"
+                    "Failed to deactivate %s integration for user %s", provider, user_id
                 )
                 return False
 
         except Exception as e:
-            logger.error(f"Error deactivating {provider} integration: {str(e)}")
+            logger.error("Error deactivating %s integration: %s", provider, e)
             return False
 
     async def log_activity(
@@ -176,21 +194,11 @@ class SupabaseManager:
                 "created_at": datetime.utcnow().isoformat(),
             }
 
-            result = self.client.table("activity_logs").insert(activity_data).execute()
-
-            if result.data:
-                logger.info(
-                    f"Successfully logged activity: {activity_type} for user {user_id}"
-                )
-                return True
-            else:
-                logger.error(
-                    f"Failed to log activity: {activity_type} for user {user_id}"
-                )
-                return False
+            self._enqueue_log("activity_logs", activity_data)
+            return True
 
         except Exception as e:
-            logger.error(f"Error logging activity: {str(e)}")
+            logger.error("Error logging activity: %s", e)
             return False
 
     async def log_opportunity(
@@ -226,30 +234,93 @@ class SupabaseManager:
                 "created_at": datetime.utcnow().isoformat(),
             }
 
-            result = (
-                self.client.table("opportunity_logs").insert(opportunity_data).execute()
-            )
-
-            if result.data:
-                logger.info(
-                    f"Successfully logged opportunity analysis for user {user_id}"
-                )
-                return True
-            else:
-                logger.error(f"Failed to log opportunity analysis for user {user_id}")
-                return False
+            self._enqueue_log("opportunity_logs", opportunity_data)
+            return True
 
         except Exception as e:
-            logger.error(f"Error logging opportunity: {str(e)}")
+            logger.error("Error logging opportunity: %s", e)
             return False
 
-    def _calculate_expires_at(self, expires_in: Optional[int]) -> Optional[str]:
+    def _enqueue_log(self, table: str, row: Dict[str, Any]):
+        """Queue a log row for the background flusher"""
+        if self._flush_task is None or self._flush_task.done():
+            # Start a flusher (and a queue) on the currently running loop,
+            # carrying over anything a previous flusher left behind
+            pending = self._drain_log_queue()
+            self._log_queue = asyncio.Queue()
+            for item in pending:
+                self._log_queue.put_nowait(item)
+            self._flush_task = asyncio.create_task(self._flush_logs_periodically())
+
+        self._log_queue.put_nowait((table, row))
+
+    def _drain_log_queue(self, limit: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        """Take queued log rows without waiting"""
+        items = []
+        while (
+            self._log_queue is not None
+            and not self._log_queue.empty()
+            and (limit is None or len(items) < limit)
+        ):
+            items.append(self._log_queue.get_nowait())
+        return items
+
+    async def _flush_logs_periodically(self):
+        """Insert queued log rows in batches until cancelled"""
+        while True:
+            items = [await self._log_queue.get()]
+
+            try:
+                # Give concurrent requests a moment to add to the same batch
+                await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            finally:
+                items.extend(self._drain_log_queue(LOG_BATCH_SIZE - 1))
+                await self._insert_log_batch(items)
+
+    async def _insert_log_batch(self, items: List[Tuple[str, Dict[str, Any]]]):
+        """Insert log rows with one request per table"""
+        rows_by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for table, row in items:
+            rows_by_table.setdefault(table, []).append(row)
+
+        for table, rows in rows_by_table.items():
+            try:
+                result = await asyncio.to_thread(
+                    self.client.table(table).insert(rows).execute
+                )
+
+                if result.data:
+                    logger.info("Successfully logged %d rows to %s", len(rows), table)
+                else:
+                    logger.error("Failed to log %d rows to %s", len(rows), table)
+
+            except Exception as e:
+                logger.error(
+                    "Error logging %d rows to %s: %s", len(rows), table, e
+                )
+
+    async def flush_logs(self):
+        """Stop the background flusher and write any queued log rows"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        items = self._drain_log_queue()
+        if items:
+            await self._insert_log_batch(items)
+
+    def _calculate_expires_at(
+        self, expires_in: Optional[int], now: Optional[datetime] = None
+    ) -> Optional[str]:
         """Calculate expiration timestamp"""
         if not expires_in:
             return None
 
-        expires_at = datetime.utcnow().timestamp() + expires_in
-        return datetime.fromtimestamp(expires_at).isoformat()
+        return ((now or datetime.utcnow()) + timedelta(seconds=expires_in)).isoformat()
 
 
 # Create global instance
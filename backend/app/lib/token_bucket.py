@@ -0,0 +1,101 @@
+"""
+Token Bucket Rate Limiter
+
+This module paces outbound API calls against requests-per-minute and (for AI
+APIs) tokens-per-minute budgets, waiting for capacity instead of running into
+429s.
+"""
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+# Completion tokens budgeted per request on top of the prompt estimate
+DEFAULT_COMPLETION_TOKENS = 500
+
+
+class TokenBucketLimiter:
+    """Proactive RPM + TPM limiter shared by concurrent callers.
+
+    Leave max_tokens_per_minute unset to limit requests only.
+    """
+
+    def __init__(
+        self,
+        max_requests_per_minute: float,
+        max_tokens_per_minute: Optional[float] = None,
+    ):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.available_request_capacity = max_requests_per_minute
+        self.available_token_capacity = max_tokens_per_minute or 0
+        self._last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add capacity for the time elapsed since the last update."""
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+
+        self.available_request_capacity = min(
+            self.max_requests_per_minute,
+            self.available_request_capacity
+            + elapsed * self.max_requests_per_minute / 60,
+        )
+        if self.max_tokens_per_minute:
+            self.available_token_capacity = min(
+                self.max_tokens_per_minute,
+                self.available_token_capacity
+                + elapsed * self.max_tokens_per_minute / 60,
+            )
+
+    async def acquire(self, num_tokens: int = 0):
+        """Wait until one request and num_tokens tokens are available, then debit them."""
+        # A single oversized request may use the whole bucket but never more
+        num_tokens = min(num_tokens, self.max_tokens_per_minute or 0)
+
+        # Callers are served in arrival order while waiting for capacity
+        async with self._lock:
+            while True:
+                self._refill()
+
+                if (
+                    self.available_request_capacity >= 1
+                    and self.available_token_capacity >= num_tokens
+                ):
+                    self.available_request_capacity -= 1
+                    self.available_token_capacity -= num_tokens
+                    return
+
+                wait_seconds = (
+                    (1 - self.available_request_capacity)
+                    * 60
+                    / self.max_requests_per_minute
+                )
+                if self.max_tokens_per_minute:
+                    wait_seconds = max(
+                        wait_seconds,
+                        (num_tokens - self.available_token_capacity)
+                        * 60
+                        / self.max_tokens_per_minute,
+                    )
+                await asyncio.sleep(max(wait_seconds, 0.0))
+
+
+def estimate_tokens(
+    prompt: str, completion_tokens: int = DEFAULT_COMPLETION_TOKENS
+) -> int:
+    """Roughly estimate the tokens a request will use (about 4 characters per token)."""
+    return len(prompt) // 4 + completion_tokens
+
+
+# Create global instances
+openrouter_limiter = TokenBucketLimiter(
+    max_requests_per_minute=float(os.getenv("OPENROUTER_MAX_RPM", "60")),
+    max_tokens_per_minute=float(os.getenv("OPENROUTER_MAX_TPM", "200000")),
+)
+pipedrive_limiter = TokenBucketLimiter(
+    max_requests_per_minute=float(os.getenv("PIPEDRIVE_MAX_RPM", "600")),
+)
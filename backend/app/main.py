@@ -1,10 +1,11 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import os
 import logging
 from app.lib.oauth_manager import oauth_manager
 from app.lib.encryption import token_encryption
+from app.lib.http_client import http_client
 from app.lib.supabase_client import supabase_manager
 from app.oauth.pipedrive import router as pipedrive_router
 from app.oauth.microsoft import router as microsoft_router
@@ -15,7 +16,11 @@ import httpx
 from fastapi import Depends
 from app.auth import get_current_user
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Static response bodies
+ROOT_BODY = {"message": "Supa-Vercel-Infra Backend API"}
+HEALTH_BODY = {"status": "healthy", "message": "Backend is running"}
 
 # Configure CORS
 app.add_middleware(
@@ -34,14 +39,26 @@ app.include_router(ai_test_router, prefix="/api/ai", tags=["ai"])
 app.include_router(monitoring_router)
 
 
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close pooled outbound HTTP connections"""
+    await http_client.aclose()
+
+
+@app.on_event("shutdown")
+async def flush_supabase_logs():
+    """Write activity and opportunity logs still waiting in the queue"""
+    await supabase_manager.flush_logs()
+
+
 @app.get("/")
 async def root():
-    return {"message": "Supa-Vercel-Infra Backend API"}
+    return ROOT_BODY
 
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "message": "Backend is running"}
+    return HEALTH_BODY
 
 
 @app.get("/api/ngrok/url")
@@ -10,6 +10,14 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 import uuid
 
+# Log level names used by the helpers below
+_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
 
 class AgentLogger:
     """Structured logger for AI agent operations."""
@@ -24,6 +32,12 @@ class AgentLogger:
 
     def _log(self, level: str, message: str, extra: Optional[Dict[str, Any]] = None):
         """Internal logging method with structured data."""
+        levelno = _LEVELS[level]
+
+        # Skip building and serializing the record when nothing would emit it
+        if not self.logger.isEnabledFor(levelno):
+            return
+
         log_data = {
             "timestamp": datetime.utcnow().isoformat(),
             "correlation_id": self.correlation_id,
@@ -34,16 +48,7 @@ class AgentLogger:
         if extra:
             log_data.update(extra)
 
-        log_message = json.dumps(log_data)
-
-        if level == "INFO":
-            self.logger.info(log_message)
-        elif level == "ERROR":
-            self.logger.error(log_message)
-        elif level == "WARNING":
-            self.logger.warning(log_message)
-        elif level == "DEBUG":
-            self.logger.debug(log_message)
+        self.logger.log(levelno, json.dumps(log_data))
 
     def info(self, message: str, extra: Optional[Dict[str, Any]] = None):
         """Log info message with structured data."""
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import RedirectResponse
 import os
+import asyncio
+import orjson
 from typing import Dict, Any
-import httpx
+from urllib.parse import quote, urlencode
+from app.lib.http_client import http_client
+from app.lib.error_handler import response_excerpt
 from app.lib.oauth_manager import oauth_manager
 from app.lib.encryption import token_encryption
 from app.lib.supabase_client import supabase_manager
@@ -20,6 +24,17 @@ MICROSOFT_AUTH_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/autho
 MICROSOFT_TOKEN_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
 MICROSOFT_API_BASE = "https://graph.microsoft.com/v1.0"
 
+# Authorization URL with every parameter except the per-request state
+MICROSOFT_AUTH_URL_PREFIX = MICROSOFT_AUTH_URL + "?" + urlencode(
+    {
+        "client_id": MICROSOFT_CLIENT_ID or "",
+        "redirect_uri": MICROSOFT_REDIRECT_URI,
+        "response_type": "code",
+        "scope": "https://graph.microsoft.com/Mail.Read https://graph.microsoft.com/Mail.ReadWrite https://graph.microsoft.com/User.Read",
+    },
+    quote_via=quote,
+) + "&state="
+
 @router.get("/connect")
 async def connect_microsoft():
     """Generate Microsoft OAuth authorization URL"""
@@ -31,15 +46,7 @@ async def connect_microsoft():
         state = oauth_manager.generate_state()
         
         # Build authorization URL with required scopes
-        auth_params = {
-            "client_id": MICROSOFT_CLIENT_ID,
-            "redirect_uri": MICROSOFT_REDIRECT_URI,
-            "response_type": "code",
-            "state": state,
-            "scope": "https://graph.microsoft.com/Mail.Read https://graph.microsoft.com/Mail.ReadWrite https://graph.microsoft.com/User.Read"
-        }
-        
-        auth_url = f"{MICROSOFT_AUTH_URL}?{'&'.join([f'{k}={v}' for k, v in auth_params.items()])}"
+        auth_url = MICROSOFT_AUTH_URL_PREFIX + quote(state)
         
         return {
             "auth_url": auth_url,
@@ -71,17 +78,25 @@ async def microsoft_callback(request: Request, current_user: dict = Depends(get_
         if not code:
             raise HTTPException(status_code=400, detail="Authorization code not provided")
         
+        # A replayed callback would only fail at the provider, answer it from memory
+        completed = oauth_manager.get_completed_callback("microsoft", current_user["id"], code)
+        if completed:
+            return completed
+        
         # Exchange code for access token
         token_data = await exchange_code_for_token(code)
         
         # Store tokens securely
         await store_microsoft_tokens(token_data, current_user)
         
-        return {
+        response = {
             "status": "success",
             "message": "Microsoft connected successfully",
             "user_id": token_data.get("user_id")
         }
+        oauth_manager.remember_completed_callback("microsoft", current_user["id"], code, response)
+        
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OAuth callback failed: {str(e)}")
 
@@ -123,29 +138,28 @@ async def test_microsoft_connection(current_user: dict = Depends(get_current_use
             raise HTTPException(status_code=404, detail="Microsoft not connected")
         
         # Test API call to Microsoft Graph
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{MICROSOFT_API_BASE}/me",
-                headers={
-                    "Authorization": f"Bearer {tokens['access_token']}",
-                    "Content-Type": "application/json"
+        response = await http_client.get(
+            f"{MICROSOFT_API_BASE}/me",
+            headers={
+                "Authorization": f"Bearer {tokens['access_token']}",
+                "Content-Type": "application/json"
+            }
+        )
+        
+        if response.status_code == 200:
+            user_data = orjson.loads(response.content)
+            return {
+                "status": "success",
+                "message": "Microsoft Graph API connection successful",
+                "user_info": {
+                    "name": user_data.get("displayName"),
+                    "email": user_data.get("mail") or user_data.get("userPrincipalName"),
+                    "id": user_data.get("id")
                 }
-            )
+            }
+        else:
+            raise HTTPException(status_code=response.status_code, detail=f"Microsoft Graph API error: {response_excerpt(response)}")
             
-            if response.status_code == 200:
-                user_data = response.json()
-                return {
-                    "status": "success",
-                    "message": "Microsoft Graph API connection successful",
-                    "user_info": {
-                        "name": user_data.get("displayName"),
-                        "email": user_data.get("mail") or user_data.get("userPrincipalName"),
-                        "id": user_data.get("id")
-                    }
-                }
-            else:
-                raise HTTPException(status_code=response.status_code, detail=f"Microsoft Graph API error: {response.text}")
-                
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Test failed: {str(e)}")
 
@@ -165,22 +179,21 @@ async def disconnect_microsoft(current_user: dict = Depends(get_current_user)):
 
 async def exchange_code_for_token(code: str) -> Dict[str, Any]:
     """Exchange authorization code for access token"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            MICROSOFT_TOKEN_URL,
-            data={
-                "client_id": MICROSOFT_CLIENT_ID,
-                "client_secret": MICROSOFT_CLIENT_SECRET,
-                "code": code,
-                "grant_type": "authorization_code",
-                "redirect_uri": MICROSOFT_REDIRECT_URI
-            }
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Token exchange failed: {response.text}")
-        
-        return response.json()
+    response = await http_client.post(
+        MICROSOFT_TOKEN_URL,
+        data={
+            "client_id": MICROSOFT_CLIENT_ID,
+            "client_secret": MICROSOFT_CLIENT_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+            "redirect_uri": MICROSOFT_REDIRECT_URI
+        }
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Token exchange failed: {response_excerpt(response)}")
+    
+    return orjson.loads(response.content)
 
 async def store_microsoft_tokens(token_data: Dict[str, Any], current_user: dict):
     """Store Microsoft tokens securely in database"""
@@ -207,10 +220,13 @@ async def store_microsoft_tokens(token_data: Dict[str, Any], current_user: dict)
         }
         
         # Insert or update integration record
-        result = supabase_manager.client.table("integrations").upsert(
-            data,
-            on_conflict="user_id,provider"
-        ).execute()
+        result = await asyncio.to_thread(
+            supabase_manager.client.table("integrations").upsert(
+                data,
+                on_conflict="user_id,provider"
+            ).execute
+        )
+        oauth_manager.invalidate_cached_tokens(current_user["id"], "microsoft")
         
         return result
     except Exception as e:
@@ -219,31 +235,35 @@ async def store_microsoft_tokens(token_data: Dict[str, Any], current_user: dict)
 async def get_microsoft_user_id(access_token: str) -> str:
     """Get Microsoft user ID from /me endpoint"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{MICROSOFT_API_BASE}/me",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                }
-            )
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                microsoft_user_id = user_data.get("id")
-                if not microsoft_user_id:
-                    raise Exception("Microsoft user ID not found in /me response")
-                return microsoft_user_id
-            else:
-                raise Exception(f"Failed to get Microsoft user info: {response.status_code} - {response.text}")
+        response = await http_client.get(
+            f"{MICROSOFT_API_BASE}/me",
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json"
+            }
+        )
+        
+        if response.status_code == 200:
+            user_data = orjson.loads(response.content)
+            microsoft_user_id = user_data.get("id")
+            if not microsoft_user_id:
+                raise Exception("Microsoft user ID not found in /me response")
+            return microsoft_user_id
+        else:
+            raise Exception(f"Failed to get Microsoft user info: {response.status_code} - {response_excerpt(response)}")
     except Exception as e:
         raise Exception(f"Failed to get Microsoft user ID: {str(e)}")
 
 async def get_microsoft_tokens(current_user: dict) -> Dict[str, Any]:
     """Retrieve and decrypt Microsoft tokens"""
     try:
+        # Serve still-valid tokens without a database round-trip or decryption
+        cached_tokens = oauth_manager.get_cached_tokens(current_user["id"], "microsoft")
+        if cached_tokens:
+            return cached_tokens
+
         # Get from Supabase
-        result = supabase_manager.client.table("integrations").select("*").eq("provider", "microsoft").eq("user_id", current_user["id"]).execute()
+        result = await asyncio.to_thread(supabase_manager.client.table("integrations").select("*").eq("provider", "microsoft").eq("user_id", current_user["id"]).execute)
         
         if not result.data:
             return None
@@ -254,36 +274,42 @@ async def get_microsoft_tokens(current_user: dict) -> Dict[str, Any]:
         access_token = token_encryption.decrypt_token(integration["access_token"])
         refresh_token = token_encryption.decrypt_token(integration["refresh_token"]) if integration["refresh_token"] else None
         
-        return {
+        tokens = {
             "access_token": access_token,
             "refresh_token": refresh_token,
             "expires_at": integration["token_expires_at"],
             "user_id": integration["user_id"],
+            "microsoft_user_id": integration.get("microsoft_user_id"),
             "scope": integration["scopes"][0] if integration["scopes"] else "",
             "token_type": integration["metadata"].get("token_type", "Bearer")
         }
+        oauth_manager.cache_tokens(
+            current_user["id"], "microsoft", tokens, integration["token_expires_at"]
+        )
+
+        return tokens
     except Exception as e:
         raise Exception(f"Failed to retrieve tokens: {str(e)}")
 
 async def test_microsoft_connection(tokens: Dict[str, Any]) -> bool:
     """Test Microsoft Graph API connectivity"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{MICROSOFT_API_BASE}/me",
-                headers={
-                    "Authorization": f"{tokens['token_type']} {tokens['access_token']}"
-                }
-            )
-            
-            return response.status_code == 200
+        response = await http_client.get(
+            f"{MICROSOFT_API_BASE}/me",
+            headers={
+                "Authorization": f"{tokens['token_type']} {tokens['access_token']}"
+            }
+        )
+        
+        return response.status_code == 200
     except Exception:
         return False
 
 async def remove_microsoft_tokens(current_user: dict):
     """Remove Microsoft tokens for the current user"""
     try:
-        result = supabase_manager.client.table("integrations").delete().eq("provider", "microsoft").eq("user_id", current_user["id"]).execute()
+        result = await asyncio.to_thread(supabase_manager.client.table("integrations").delete().eq("provider", "microsoft").eq("user_id", current_user["id"]).execute)
+        oauth_manager.invalidate_cached_tokens(current_user["id"], "microsoft")
         return result
     except Exception as e:
         raise Exception(f"Failed to remove tokens: {str(e)}") 
\ No newline at end of file
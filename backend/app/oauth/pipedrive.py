@@ -1,8 +1,12 @@
 from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import RedirectResponse
 import os
+import asyncio
+import orjson
 from typing import Dict, Any
-import httpx
+from urllib.parse import quote, urlencode
+from app.lib.http_client import http_client
+from app.lib.error_handler import response_excerpt
 from app.lib.oauth_manager import oauth_manager
 from app.lib.encryption import token_encryption
 from app.lib.supabase_client import supabase_manager
@@ -20,6 +24,16 @@ PIPEDRIVE_AUTH_URL = "https://oauth.pipedrive.com/oauth/authorize"
 PIPEDRIVE_TOKEN_URL = "https://oauth.pipedrive.com/oauth/token"
 PIPEDRIVE_API_BASE = "https://api.pipedrive.com/v1"
 
+# Authorization URL with every parameter except the per-request state
+PIPEDRIVE_AUTH_URL_PREFIX = PIPEDRIVE_AUTH_URL + "?" + urlencode(
+    {
+        "client_id": PIPEDRIVE_CLIENT_ID or "",
+        "redirect_uri": PIPEDRIVE_REDIRECT_URI,
+        "response_type": "code",
+    },
+    quote_via=quote,
+) + "&state="
+
 @router.get("/connect")
 async def connect_pipedrive():
     """Generate Pipedrive OAuth authorization URL"""
@@ -31,14 +45,7 @@ async def connect_pipedrive():
         state = oauth_manager.generate_state()
         
         # Build authorization URL
-        auth_params = {
-            "client_id": PIPEDRIVE_CLIENT_ID,
-            "redirect_uri": PIPEDRIVE_REDIRECT_URI,
-            "response_type": "code",
-            "state": state
-        }
-        
-        auth_url = f"{PIPEDRIVE_AUTH_URL}?{'&'.join([f'{k}={v}' for k, v in auth_params.items()])}"
+        auth_url = PIPEDRIVE_AUTH_URL_PREFIX + quote(state)
         
         return {
             "auth_url": auth_url,
@@ -70,17 +77,25 @@ async def pipedrive_callback(request: Request, current_user: dict = Depends(get_
         if not code:
             raise HTTPException(status_code=400, detail="Authorization code not provided")
         
+        # A replayed callback would only fail at the provider, answer it from memory
+        completed = oauth_manager.get_completed_callback("pipedrive", current_user["id"], code)
+        if completed:
+            return completed
+        
         # Exchange code for access token
         token_data = await exchange_code_for_token(code)
         
         # Store tokens securely
         await store_pipedrive_tokens(token_data, current_user)
         
-        return {
+        response = {
             "status": "success",
             "message": "Pipedrive connected successfully",
             "user_id": token_data.get("user_id")
         }
+        oauth_manager.remember_completed_callback("pipedrive", current_user["id"], code, response)
+        
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OAuth callback failed: {str(e)}")
 
@@ -122,29 +137,28 @@ async def test_pipedrive_connection(current_user: dict = Depends(get_current_use
             raise HTTPException(status_code=404, detail="Pipedrive not connected")
         
         # Test API call to Pipedrive
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{PIPEDRIVE_API_BASE}/users/me",
-                headers={
-                    "Authorization": f"Bearer {tokens['access_token']}",
-                    "Content-Type": "application/json"
+        response = await http_client.get(
+            f"{PIPEDRIVE_API_BASE}/users/me",
+            headers={
+                "Authorization": f"Bearer {tokens['access_token']}",
+                "Content-Type": "application/json"
+            }
+        )
+        
+        if response.status_code == 200:
+            user_data = orjson.loads(response.content)
+            return {
+                "status": "success",
+                "message": "Pipedrive API connection successful",
+                "user_info": {
+                    "name": user_data.get("data", {}).get("name"),
+                    "email": user_data.get("data", {}).get("email"),
+                    "company": user_data.get("data", {}).get("company_name")
                 }
-            )
+            }
+        else:
+            raise HTTPException(status_code=response.status_code, detail=f"Pipedrive API error: {response_excerpt(response)}")
             
-            if response.status_code == 200:
-                user_data = response.json()
-                return {
-                    "status": "success",
-                    "message": "Pipedrive API connection successful",
-                    "user_info": {
-                        "name": user_data.get("data", {}).get("name"),
-                        "email": user_data.get("data", {}).get("email"),
-                        "company": user_data.get("data", {}).get("company_name")
-                    }
-                }
-            else:
-                raise HTTPException(status_code=response.status_code, detail=f"Pipedrive API error: {response.text}")
-                
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Test failed: {str(e)}")
 
@@ -164,22 +178,21 @@ async def disconnect_pipedrive(current_user: dict = Depends(get_current_user)):
 
 async def exchange_code_for_token(code: str) -> Dict[str, Any]:
     """Exchange authorization code for access token"""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            PIPEDRIVE_TOKEN_URL,
-            data={
-                "client_id": PIPEDRIVE_CLIENT_ID,
-                "client_secret": PIPEDRIVE_CLIENT_SECRET,
-                "code": code,
-                "grant_type": "authorization_code",
-                "redirect_uri": PIPEDRIVE_REDIRECT_URI
-            }
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Token exchange failed: {response.text}")
-        
-        return response.json()
+    response = await http_client.post(
+        PIPEDRIVE_TOKEN_URL,
+        data={
+            "client_id": PIPEDRIVE_CLIENT_ID,
+            "client_secret": PIPEDRIVE_CLIENT_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+            "redirect_uri": PIPEDRIVE_REDIRECT_URI
+        }
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Token exchange failed: {response_excerpt(response)}")
+    
+    return orjson.loads(response.content)
 
 async def store_pipedrive_tokens(token_data: Dict[str, Any], current_user: dict):
     """Store Pipedrive tokens securely in database"""
@@ -202,10 +215,13 @@ async def store_pipedrive_tokens(token_data: Dict[str, Any], current_user: dict)
         }
         
         # Insert or update integration record
-        result = supabase_manager.client.table("integrations").upsert(
-            data,
-            on_conflict="user_id,provider"
-        ).execute()
+        result = await asyncio.to_thread(
+            supabase_manager.client.table("integrations").upsert(
+                data,
+                on_conflict="user_id,provider"
+            ).execute
+        )
+        oauth_manager.invalidate_cached_tokens(current_user["id"], "pipedrive")
         
         return result
     except Exception as e:
@@ -214,8 +230,13 @@ async def store_pipedrive_tokens(token_data: Dict[str, Any], current_user: dict)
 async def get_pipedrive_tokens(current_user: dict) -> Dict[str, Any]:
     """Retrieve and decrypt Pipedrive tokens"""
     try:
+        # Serve still-valid tokens without a database round-trip or decryption
+        cached_tokens = oauth_manager.get_cached_tokens(current_user["id"], "pipedrive")
+        if cached_tokens:
+            return cached_tokens
+
         # Get from Supabase
-        result = supabase_manager.client.table("integrations").select("*").eq("provider", "pipedrive").eq("user_id", current_user["id"]).execute()
+        result = await asyncio.to_thread(supabase_manager.client.table("integrations").select("*").eq("provider", "pipedrive").eq("user_id", current_user["id"]).execute)
         
         if not result.data:
             return None
@@ -226,7 +247,7 @@ async def get_pipedrive_tokens(current_user: dict) -> Dict[str, Any]:
         access_token = token_encryption.decrypt_token(integration["access_token"])
         refresh_token = token_encryption.decrypt_token(integration["refresh_token"]) if integration["refresh_token"] else None
         
-        return {
+        tokens = {
             "access_token": access_token,
             "refresh_token": refresh_token,
             "expires_at": integration["token_expires_at"],
@@ -234,28 +255,33 @@ async def get_pipedrive_tokens(current_user: dict) -> Dict[str, Any]:
             "scope": integration["scopes"][0] if integration["scopes"] else "",
             "token_type": integration["metadata"].get("token_type", "Bearer")
         }
+        oauth_manager.cache_tokens(
+            current_user["id"], "pipedrive", tokens, integration["token_expires_at"]
+        )
+
+        return tokens
     except Exception as e:
         raise Exception(f"Failed to retrieve tokens: {str(e)}")
 
 async def test_pipedrive_connection(tokens: Dict[str, Any]) -> bool:
     """Test Pipedrive API connectivity"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{PIPEDRIVE_API_BASE}/users/me",
-                headers={
-                    "Authorization": f"{tokens['token_type']} {tokens['access_token']}"
-                }
-            )
-            
-            return response.status_code == 200
+        response = await http_client.get(
+            f"{PIPEDRIVE_API_BASE}/users/me",
+            headers={
+                "Authorization": f"{tokens['token_type']} {tokens['access_token']}"
+            }
+        )
+        
+        return response.status_code == 200
     except Exception:
         return False
 
 async def remove_pipedrive_tokens(current_user: dict):
     """Remove Pipedrive tokens for the current user"""
     try:
-        result = supabase_manager.client.table("integrations").delete().eq("provider", "pipedrive").eq("user_id", current_user["id"]).execute()
+        result = await asyncio.to_thread(supabase_manager.client.table("integrations").delete().eq("provider", "pipedrive").eq("user_id", current_user["id"]).execute)
+        oauth_manager.invalidate_cached_tokens(current_user["id"], "pipedrive")
         return result
     except Exception as e:
         raise Exception(f"Failed to remove tokens: {str(e)}") 
\ No newline at end of file
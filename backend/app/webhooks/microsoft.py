@@ -1,13 +1,15 @@
 from fastapi import APIRouter, HTTPException, Request, Depends, Response
 from fastapi.responses import JSONResponse
 import os
-import json
+import asyncio
+import orjson
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional
-import httpx
+from typing import Dict, Any, List, Optional
 from app.lib.supabase_client import supabase_manager
 from app.lib.oauth_manager import oauth_manager
+from app.lib.http_client import http_client
+from app.lib.error_handler import response_excerpt
 from app.lib.webhook_validation import webhook_validator
 
 # Set up logging
@@ -22,6 +24,33 @@ WEBHOOK_VERIFICATION_TOKEN = os.getenv(
     "MICROSOFT_WEBHOOK_VERIFICATION_TOKEN", "default_token"
 )
 
+# Static response bodies
+OK_BODY = "OK"
+MISSING_VALIDATION_TOKEN_BODY = {
+    "status": "bad_request",
+    "message": "Missing validation token",
+}
+INVALID_SIGNATURE_BODY = {
+    "status": "unauthorized",
+    "message": "Invalid webhook signature",
+}
+INVALID_PAYLOAD_BODY = {"status": "bad_request", "message": "Invalid webhook payload"}
+INVALID_CLIENT_STATE_BODY = {"status": "bad_request", "message": "Invalid client state"}
+SUBSCRIPTION_NOT_FOUND_BODY = {
+    "status": "not_found",
+    "message": "Subscription not found",
+}
+WEBHOOK_TEST_BODY = {
+    "status": "success",
+    "message": "Microsoft webhook infrastructure is working",
+    "endpoints": {
+        "email_webhook": "/api/webhooks/microsoft/email",
+        "create_subscription": "/api/webhooks/microsoft/subscribe",
+        "list_subscriptions": "/api/webhooks/microsoft/subscriptions/{user_id}",
+        "delete_subscription": "/api/webhooks/microsoft/subscriptions/{user_id}/{subscription_id}",
+    },
+}
+
 
 class MicrosoftWebhookManager:
     """Manages Microsoft Graph webhook subscriptions and email processing"""
@@ -37,7 +66,8 @@ class MicrosoftWebhookManager:
             # Use the Microsoft manager for token handling with automatic refresh
             from app.agents.microsoft_manager import MicrosoftManager
 
-            microsoft_manager = MicrosoftManager(user_id)
+            # Loading the stored tokens queries Supabase synchronously
+            microsoft_manager = await asyncio.to_thread(MicrosoftManager, user_id)
 
             # The manager will handle token loading, decryption, and refresh automatically
             if microsoft_manager.tokens and microsoft_manager.tokens.get(
@@ -106,52 +136,51 @@ class MicrosoftWebhookManager:
                 f"Headers: {{'Authorization': 'Bearer {access_token[:20]}...', 'Content-Type': 'application/json'}}"
             )
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.graph_base_url}/subscriptions",
-                    json=subscription_data,
-                    headers=headers,
-                )
-
-                logger.info(f"=== Microsoft Graph API response ===")
-                logger.info(f"Status code: {response.status_code}")
-                logger.info(f"Response headers: {dict(response.headers)}")
-                logger.info(f"Response text: {response.text}")
+            response = await http_client.post(
+                f"{self.graph_base_url}/subscriptions",
+                json=subscription_data,
+                headers=headers,
+            )
 
-                if response.status_code != 201:
-                    logger.error(
-                        f"Failed to create webhook subscription: {response.text}"
-                    )
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail="Failed to create webhook subscription",
-                    )
+            logger.info(f"=== Microsoft Graph API response ===")
+            logger.info(f"Status code: {response.status_code}")
+            logger.info(f"Response headers: {dict(response.headers)}")
 
-                subscription = response.json()
-                logger.info(f"=== Subscription created: {subscription} ===")
-
-                # Store subscription in database
-                db_subscription = {
-                    "user_id": user_id,
-                    "subscription_id": subscription["id"],
-                    "provider": "microsoft",  # Add provider field
-                    "resource": subscription["resource"],
-                    "change_type": subscription["changeType"],
-                    "notification_url": subscription["notificationUrl"],
-                    "expiration_date": subscription["expirationDateTime"],
-                    "is_active": True,
-                }
-
-                result = (
-                    supabase_manager.client.table("webhook_subscriptions")
-                    .insert(db_subscription)
-                    .execute()
+            if response.status_code != 201:
+                logger.error(
+                    "Failed to create webhook subscription: "
+                    f"{response_excerpt(response)}"
                 )
-
-                logger.info(
-                    f"Created webhook subscription {subscription['id']} for user {user_id}"
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail="Failed to create webhook subscription",
                 )
-                return subscription
+
+            subscription = orjson.loads(response.content)
+            logger.info(f"=== Subscription created: {subscription} ===")
+
+            # Store subscription in database
+            db_subscription = {
+                "user_id": user_id,
+                "subscription_id": subscription["id"],
+                "provider": "microsoft",  # Add provider field
+                "resource": subscription["resource"],
+                "change_type": subscription["changeType"],
+                "notification_url": subscription["notificationUrl"],
+                "expiration_date": subscription["expirationDateTime"],
+                "is_active": True,
+            }
+
+            result = await asyncio.to_thread(
+                supabase_manager.client.table("webhook_subscriptions")
+                .insert(db_subscription)
+                .execute
+            )
+
+            logger.info(
+                f"Created webhook subscription {subscription['id']} for user {user_id}"
+            )
+            return subscription
 
         except Exception as e:
             logger.error(
@@ -171,11 +200,11 @@ class MicrosoftWebhookManager:
     async def list_webhook_subscriptions(self, user_id: str) -> list:
         """List webhook subscriptions for a user"""
         try:
-            result = (
+            result = await asyncio.to_thread(
                 supabase_manager.client.table("webhook_subscriptions")
                 .select("*")
                 .eq("user_id", user_id)
-                .execute()
+                .execute
             )
             return result.data
         except Exception as e:
@@ -200,28 +229,27 @@ class MicrosoftWebhookManager:
                 "Content-Type": "application/json",
             }
 
-            async with httpx.AsyncClient() as client:
-                response = await client.delete(
-                    f"{self.graph_base_url}/subscriptions/{subscription_id}",
-                    headers=headers,
-                )
+            response = await http_client.delete(
+                f"{self.graph_base_url}/subscriptions/{subscription_id}",
+                headers=headers,
+            )
 
-                if response.status_code == 204:
-                    logger.info(
-                        f"Deleted subscription {subscription_id} from Microsoft Graph"
-                    )
-                else:
-                    logger.warning(
-                        f"Failed to delete subscription from Microsoft Graph: {response.status_code}"
-                    )
+            if response.status_code == 204:
+                logger.info(
+                    f"Deleted subscription {subscription_id} from Microsoft Graph"
+                )
+            else:
+                logger.warning(
+                    f"Failed to delete subscription from Microsoft Graph: {response.status_code}"
+                )
 
             # Delete from database
-            result = (
+            result = await asyncio.to_thread(
                 supabase_manager.client.table("webhook_subscriptions")
                 .delete()
                 .eq("subscription_id", subscription_id)
                 .eq("user_id", user_id)
-                .execute()
+                .execute
             )
 
             if result.data:
@@ -240,12 +268,12 @@ class MicrosoftWebhookManager:
     ) -> bool:
         """Check if an email already exists in the database"""
         try:
-            result = (
+            result = await asyncio.to_thread(
                 supabase_manager.client.table("emails")
                 .select("id")
                 .eq("user_id", user_id)
                 .eq("microsoft_email_id", microsoft_email_id)
-                .execute()
+                .execute
             )
             return len(result.data) > 0
         except Exception as e:
@@ -257,13 +285,13 @@ class MicrosoftWebhookManager:
     ) -> bool:
         """Verify that the Microsoft user ID matches the stored mapping for the Supabase user"""
         try:
-            result = (
+            result = await asyncio.to_thread(
                 supabase_manager.client.table("integrations")
                 .select("microsoft_user_id")
                 .eq("user_id", supabase_user_id)
                 .eq("provider", "microsoft")
                 .eq("is_active", True)
-                .execute()
+                .execute
             )
 
             if not result.data:
@@ -294,46 +322,6 @@ class MicrosoftWebhookManager:
             logger.error(f"Error verifying Microsoft user mapping: {str(e)}")
             return False
 
-    async def fetch_email_content(
-        self, supabase_user_id: str, message_id: str, microsoft_user_id: str
-    ) -> Optional[Dict[str, Any]]:
-        """Fetch full email content from Microsoft Graph"""
-        try:
-            access_token = await self.get_access_token(supabase_user_id)
-            if not access_token:
-                logger.error(f"No access token found for user {supabase_user_id}")
-                return None
-
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
-            }
-
-            # Fetch email content from Microsoft Graph using Microsoft user ID
-            url = (
-                f"{self.graph_base_url}/users/{microsoft_user_id}/messages/{message_id}"
-            )
-            logger.info(f"Fetching email content from: {url}")
-
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=headers)
-
-                if response.status_code == 200:
-                    email_data = response.json()
-                    logger.info(
-                        f"Successfully fetched email content for message {message_id}"
-                    )
-                    return email_data
-                else:
-                    logger.error(
-                        f"Failed to fetch email content: {response.status_code} - {response.text}"
-                    )
-                    return None
-
-        except Exception as e:
-            logger.error(f"Error fetching email content: {str(e)}")
-            return None
-
     async def process_email_webhook(
         self, webhook_data: Dict[str, Any]
     ) -> Dict[str, Any]:
@@ -349,6 +337,10 @@ class MicrosoftWebhookManager:
             skipped_duplicates = []
             ai_processed_emails = []
 
+            # New message IDs per Supabase user, fetched together below
+            pending_messages: Dict[str, List[str]] = {}
+            stored_emails = []
+
             for notification in value:
                 resource = notification.get("resource", "")
                 subscription_id = notification.get("subscriptionId", "")
@@ -381,6 +373,14 @@ class MicrosoftWebhookManager:
                     )
                     continue
 
+                # Graph can deliver the same message more than once per payload
+                if message_id in pending_messages.get(supabase_user_id, []):
+                    logger.info(f"Duplicate notification for email {message_id}")
+                    skipped_duplicates.append(
+                        {"message_id": message_id, "reason": "duplicate_notification"}
+                    )
+                    continue
+
                 # Check if email already exists in database (use Supabase user ID)
                 if await self.email_exists_in_database(supabase_user_id, message_id):
                     logger.info(
@@ -400,151 +400,39 @@ class MicrosoftWebhookManager:
                     )
                     continue
 
-                # Fetch full email content from Microsoft Graph (use Microsoft user ID)
-                email_content = await self.fetch_email_content(
-                    supabase_user_id, message_id, microsoft_user_id
-                )
-                if not email_content:
-                    logger.error(f"Failed to fetch email content for {message_id}")
-                    continue
+                pending_messages.setdefault(supabase_user_id, []).append(message_id)
 
-                # Extract email metadata
-                subject = email_content.get("subject", "")
-                sender_email = (
-                    email_content.get("from", {})
-                    .get("emailAddress", {})
-                    .get("address", "")
-                )
-                recipient_emails = [
-                    r.get("emailAddress", {}).get("address", "")
-                    for r in email_content.get("toRecipients", [])
-                ]
-                sent_at = email_content.get("sentDateTime")
-                received_at = email_content.get("receivedDateTime")
-                body_content = email_content.get("body", {}).get("content", "")
-                body_content_type = email_content.get("body", {}).get("contentType", "")
-
-                # Store email metadata in database (use Supabase user ID)
-                email_record = {
-                    "user_id": supabase_user_id,
-                    "microsoft_email_id": message_id,
-                    "subject": subject,
-                    "sender_email": sender_email,
-                    "recipient_emails": recipient_emails,
-                    "sent_at": sent_at,
-                    "received_at": received_at,
-                    "body_content": body_content,
-                    "body_content_type": body_content_type,
-                    "webhook_received_at": datetime.now(timezone.utc).isoformat(),
-                    "processing_status": "stored",
-                    "content_retrieved": True,
-                    "ai_analyzed": False,
-                    "opportunity_detected": None,
-                }
-
-                try:
-                    result = (
-                        supabase_manager.client.table("emails")
-                        .insert(email_record)
-                        .execute()
-                    )
+            for supabase_user_id, message_ids in pending_messages.items():
+                # Fetch full email content with one Graph $batch call per user
+                emails = await self.fetch_emails(supabase_user_id, message_ids)
 
-                    if result.data:
-                        processed_emails.append(
-                            {
-                                "message_id": message_id,
-                                "subject": subject,
-                                "status": "stored",
-                            }
-                        )
-                        logger.info(
-                            f"Successfully stored email {message_id} for user {supabase_user_id}"
-                        )
-
-                        # Step 2: Trigger AI Agent Flow
-                        try:
-                            # Prepare email data for AI analysis
-                            ai_email_data = {
-                                "id": message_id,
-                                "subject": subject,
-                                "to": (
-                                    recipient_emails[0] if recipient_emails else ""
-                                ),  # Primary recipient
-                                "from": sender_email,
-                                "content": body_content,  # Use 'content' for AI analyzer compatibility
-                                "sent_at": sent_at,
-                                "user_id": supabase_user_id,
-                            }
-
-                            # Import and use AgentOrchestrator
-                            from app.agents.orchestrator import AgentOrchestrator
-
-                            logger.info(f"Starting AI analysis for email {message_id}")
-
-                            # Create orchestrator and process email
-                            orchestrator = AgentOrchestrator(supabase_user_id)
-                            ai_result = await orchestrator.process_email(ai_email_data)
-
-                            # Update email record with AI analysis results
-                            update_data = {
-                                "processing_status": "completed",
-                                "ai_analyzed": True,
-                                "opportunity_detected": ai_result.get(
-                                    "ai_result", {}
-                                ).get("is_sales_opportunity", False),
-                                "updated_at": datetime.now(timezone.utc).isoformat(),
-                            }
-
-                            # Update the email record in database
-                            supabase_manager.client.table("emails").update(
-                                update_data
-                            ).eq("microsoft_email_id", message_id).execute()
-
-                            ai_processed_emails.append(
-                                {
-                                    "message_id": message_id,
-                                    "subject": subject,
-                                    "ai_result": ai_result,
-                                    "status": "ai_processed",
-                                }
-                            )
-
-                            logger.info(
-                                f"AI analysis completed for email {message_id}: {ai_result.get('outcome', 'Unknown')}"
-                            )
-
-                        except Exception as ai_error:
-                            logger.error(
-                                f"AI analysis failed for email {message_id}: {str(ai_error)}"
-                            )
-
-                            # Update email record to mark AI analysis as failed
-                            update_data = {
-                                "processing_status": "ai_failed",
-                                "ai_analyzed": False,
-                                "updated_at": datetime.now(timezone.utc).isoformat(),
-                            }
-
-                            supabase_manager.client.table("emails").update(
-                                update_data
-                            ).eq("microsoft_email_id", message_id).execute()
-
-                            ai_processed_emails.append(
-                                {
-                                    "message_id": message_id,
-                                    "subject": subject,
-                                    "ai_error": str(ai_error),
-                                    "status": "ai_failed",
-                                }
-                            )
-                    else:
-                        logger.error(f"Failed to store email {message_id} in database")
-
-                except Exception as db_error:
-                    logger.error(
-                        f"Database error storing email {message_id}: {str(db_error)}"
+                for message_id, email in zip(message_ids, emails):
+                    if not email:
+                        logger.error(f"Failed to fetch email content for {message_id}")
+                        continue
+
+                    ai_email_data = await self.store_email(
+                        supabase_user_id, message_id, email
+                    )
+                    if not ai_email_data:
+                        continue
+
+                    processed_emails.append(
+                        {
+                            "message_id": message_id,
+                            "subject": ai_email_data["subject"],
+                            "status": "stored",
+                        }
+                    )
+                    stored_emails.append(ai_email_data)
+
+            # Step 2: Trigger AI Agent Flow
+            if stored_emails:
+                ai_results = await self.analyze_emails(stored_emails)
+                for ai_email_data, ai_result in zip(stored_emails, ai_results):
+                    ai_processed_emails.append(
+                        await self.process_stored_email(ai_email_data, ai_result)
                     )
-                    continue
 
             return {
                 "status": "success",
@@ -560,6 +448,162 @@ class MicrosoftWebhookManager:
             logger.error(f"Error processing email webhook: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    async def fetch_emails(
+        self, supabase_user_id: str, message_ids: List[str]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Fetch full email content for several messages from Microsoft Graph"""
+        try:
+            from app.agents.microsoft_manager import MicrosoftManager
+
+            # Loading the stored tokens queries Supabase synchronously
+            microsoft_manager = await asyncio.to_thread(
+                MicrosoftManager, supabase_user_id
+            )
+            return await microsoft_manager.get_emails_batch(message_ids)
+
+        except Exception as e:
+            logger.error(f"Error fetching emails for user {supabase_user_id}: {str(e)}")
+            return [None] * len(message_ids)
+
+    async def store_email(
+        self, supabase_user_id: str, message_id: str, email: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Store a fetched email and return it in the shape the AI agents expect"""
+        recipient_emails = email.get("to") or []
+
+        # Store email metadata in database (use Supabase user ID)
+        email_record = {
+            "user_id": supabase_user_id,
+            "microsoft_email_id": message_id,
+            "subject": email.get("subject") or "",
+            "sender_email": email.get("from") or "",
+            "recipient_emails": recipient_emails,
+            "sent_at": email.get("sent_at"),
+            "received_at": email.get("received_at"),
+            "body_content": email.get("body") or "",
+            "body_content_type": email.get("body_content_type") or "",
+            "webhook_received_at": datetime.now(timezone.utc).isoformat(),
+            "processing_status": "stored",
+            "content_retrieved": True,
+            "ai_analyzed": False,
+            "opportunity_detected": None,
+        }
+
+        try:
+            result = await asyncio.to_thread(
+                supabase_manager.client.table("emails").insert(email_record).execute
+            )
+        except Exception as db_error:
+            logger.error(f"Database error storing email {message_id}: {str(db_error)}")
+            return None
+
+        if not result.data:
+            logger.error(f"Failed to store email {message_id} in database")
+            return None
+
+        logger.info(
+            f"Successfully stored email {message_id} for user {supabase_user_id}"
+        )
+
+        # Prepare email data for AI analysis
+        return {
+            "id": message_id,
+            "subject": email_record["subject"],
+            "to": recipient_emails[0] if recipient_emails else "",  # Primary recipient
+            "from": email_record["sender_email"],
+            # Use 'content' for AI analyzer compatibility
+            "content": email_record["body_content"],
+            "sent_at": email_record["sent_at"],
+            "user_id": supabase_user_id,
+        }
+
+    async def analyze_emails(
+        self, emails: List[Dict[str, Any]]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Analyze stored emails with a single batched AI request"""
+        try:
+            from app.agents.analyze_email import EmailAnalyzer
+
+            logger.info(f"Starting batched AI analysis for {len(emails)} emails")
+            return await EmailAnalyzer().analyze_emails_batch(emails)
+
+        except Exception as e:
+            # Let the orchestrator analyze each email on its own instead
+            logger.error(f"Batched AI analysis failed: {str(e)}")
+            return [None] * len(emails)
+
+    async def process_stored_email(
+        self, ai_email_data: Dict[str, Any], ai_result: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Run a stored email through the AI agents and record the outcome"""
+        message_id = ai_email_data["id"]
+        subject = ai_email_data["subject"]
+
+        try:
+            # Import and use AgentOrchestrator
+            from app.agents.orchestrator import AgentOrchestrator
+
+            logger.info(f"Starting AI analysis for email {message_id}")
+
+            # Create orchestrator and process email
+            orchestrator = await asyncio.to_thread(
+                AgentOrchestrator, ai_email_data["user_id"]
+            )
+            ai_result = await orchestrator.process_email(ai_email_data, ai_result)
+
+            # Update email record with AI analysis results
+            update_data = {
+                "processing_status": "completed",
+                "ai_analyzed": True,
+                "opportunity_detected": ai_result.get("ai_result", {}).get(
+                    "is_sales_opportunity", False
+                ),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+
+            # Update the email record in database
+            await asyncio.to_thread(
+                supabase_manager.client.table("emails")
+                .update(update_data)
+                .eq("microsoft_email_id", message_id)
+                .execute
+            )
+
+            logger.info(
+                f"AI analysis completed for email {message_id}: {ai_result.get('outcome', 'Unknown')}"
+            )
+
+            return {
+                "message_id": message_id,
+                "subject": subject,
+                "ai_result": ai_result,
+                "status": "ai_processed",
+            }
+
+        except Exception as ai_error:
+            logger.error(f"AI analysis failed for email {message_id}: {str(ai_error)}")
+
+            # Update email record to mark AI analysis as failed
+            update_data = {
+                "processing_status": "ai_failed",
+                "ai_analyzed": False,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+
+            await asyncio.to_thread(
+                supabase_manager.client.table("emails")
+                .update(update_data)
+                .eq("microsoft_email_id", message_id)
+                .execute
+            )
+
+            return {
+                "message_id": message_id,
+                "subject": subject,
+                "ai_error": str(ai_error),
+                "status": "ai_failed",
+            }
+
 
 # Initialize webhook manager
 webhook_manager = MicrosoftWebhookManager()
@@ -571,10 +615,7 @@ async def validate_webhook(request: Request):
     validation_token = request.query_params.get("validationToken")
     if validation_token:
         return Response(content=validation_token, media_type="text/plain")
-    return JSONResponse(
-        status_code=400,
-        content={"status": "bad_request", "message": "Missing validation token"},
-    )
+    return JSONResponse(status_code=400, content=MISSING_VALIDATION_TOKEN_BODY)
 
 
 @router.post("/email")
@@ -593,37 +634,28 @@ async def handle_email_webhook(request: Request):
         # Check if body is empty (some validation requests have empty bodies)
         if not body:
             logger.warning("Received empty webhook body")
-            return Response(content="OK", media_type="text/plain")
+            return Response(content=OK_BODY, media_type="text/plain")
 
         try:
-            webhook_data = await request.json()
+            webhook_data = orjson.loads(body)
             logger.info(
-                f"Received Microsoft email webhook: {json.dumps(webhook_data, indent=2)}"
+                f"Received Microsoft email webhook: {orjson.dumps(webhook_data, option=orjson.OPT_INDENT_2).decode()}"
             )
         except Exception as json_error:
             logger.warning(f"Failed to parse webhook as JSON: {str(json_error)}")
             # Return 200 OK for non-JSON requests (validation requests)
-            return Response(content="OK", media_type="text/plain")
+            return Response(content=OK_BODY, media_type="text/plain")
 
         # Validate webhook signature (optional for development, required for production)
         if os.getenv("ENVIRONMENT") == "production":
             if not webhook_validator.validate_webhook_signature(request, body):
                 logger.warning("Webhook signature validation failed")
-                return JSONResponse(
-                    status_code=401,
-                    content={
-                        "status": "unauthorized",
-                        "message": "Invalid webhook signature",
-                    },
-                )
+                return JSONResponse(status_code=401, content=INVALID_SIGNATURE_BODY)
 
         # Validate webhook payload structure
         if not webhook_validator.validate_webhook_payload(webhook_data):
             logger.warning("Webhook payload validation failed")
-            return JSONResponse(
-                status_code=400,
-                content={"status": "bad_request", "message": "Invalid webhook payload"},
-            )
+            return JSONResponse(status_code=400, content=INVALID_PAYLOAD_BODY)
 
         # Extract and validate user ID
         client_state = webhook_data.get("value", [{}])[0].get("clientState", "")
@@ -631,21 +663,17 @@ async def handle_email_webhook(request: Request):
 
         if not user_id:
             logger.warning("Could not extract user ID from client state")
-            return JSONResponse(
-                status_code=400,
-                content={"status": "bad_request", "message": "Invalid client state"},
-            )
+            return JSONResponse(status_code=400, content=INVALID_CLIENT_STATE_BODY)
 
         # Validate subscription exists
         subscription_id = webhook_data.get("value", [{}])[0].get("subscriptionId")
-        if not webhook_validator.validate_subscription_exists(subscription_id, user_id):
+        if not await asyncio.to_thread(
+            webhook_validator.validate_subscription_exists, subscription_id, user_id
+        ):
             logger.warning(
                 f"Subscription {subscription_id} not found for user {user_id}"
             )
-            return JSONResponse(
-                status_code=404,
-                content={"status": "not_found", "message": "Subscription not found"},
-            )
+            return JSONResponse(status_code=404, content=SUBSCRIPTION_NOT_FOUND_BODY)
 
         # Process the webhook
         result = await webhook_manager.process_email_webhook(webhook_data)
@@ -658,7 +686,7 @@ async def handle_email_webhook(request: Request):
     except Exception as e:
         logger.error(f"Error handling email webhook: {str(e)}")
         # Return 200 OK for any unexpected errors during validation
-        return Response(content="OK", media_type="text/plain")
+        return Response(content=OK_BODY, media_type="text/plain")
 
 
 @router.post("/subscribe")
@@ -752,16 +780,7 @@ async def delete_subscription(user_id: str, subscription_id: str):
 @router.get("/test")
 async def test_webhook_endpoint():
     """Test endpoint to verify webhook infrastructure"""
-    return {
-        "status": "success",
-        "message": "Microsoft webhook infrastructure is working",
-        "endpoints": {
-            "email_webhook": "/api/webhooks/microsoft/email",
-            "create_subscription": "/api/webhooks/microsoft/subscribe",
-            "list_subscriptions": "/api/webhooks/microsoft/subscriptions/{user_id}",
-            "delete_subscription": "/api/webhooks/microsoft/subscriptions/{user_id}/{subscription_id}",
-        },
-    }
+    return WEBHOOK_TEST_BODY
 
 
 @router.get("/status/{user_id}")
@@ -769,22 +788,22 @@ async def get_webhook_processing_status(user_id: str):
     """Get webhook processing status and recent email processing results"""
     try:
         # Get recent emails processed via webhook
-        recent_emails = (
+        recent_emails = await asyncio.to_thread(
             supabase_manager.client.table("emails")
             .select("*")
             .eq("user_id", user_id)
             .order("webhook_received_at", desc=True)
             .limit(10)
-            .execute()
+            .execute
         )
 
         # Get webhook subscription status
-        subscriptions = (
+        subscriptions = await asyncio.to_thread(
             supabase_manager.client.table("webhook_subscriptions")
             .select("*")
             .eq("user_id", user_id)
             .eq("is_active", True)
-            .execute()
+            .execute
         )
 
         # Calculate processing statistics
@@ -8,28 +8,34 @@ This script tests the production modular agents with the same sample emails used
 import asyncio
 import os
 import sys
+from collections import Counter
 from datetime import datetime
+
 from dotenv import load_dotenv
 
+# Load environment variables before the agents read their module-level
+# settings (LLM_CACHE_DIR, OPENROUTER_MAX_RPM/TPM, AI_CONCURRENCY, ...)
+load_dotenv()
+
 # Add the app directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "app"))
 
 # Now we can import from the app package
+from agents.analyze_email import EmailAnalyzer
 from agents.orchestrator import AgentOrchestrator
 from monitoring.agent_logger import agent_logger
 
+# Runs with at least this many emails may use the Batch API (USE_BATCH_API=1)
+BATCH_API_MIN_EMAILS = 5
 
-def load_sample_emails():
-    """Load sample emails for testing."""
-    print("📧 Loading sample emails...")
-
-    sample_emails = [
-        {
-            "id": 1,
-            "from": "mathias@besafe.dk",
-            "to": "peter.hansen@microsoft.com",
-            "subject": "Tilbud på sikkerhedsløsninger - Microsoft Danmark",
-            "content": """Hej Peter,
+# Built once at import; the agents only read these
+_SAMPLE_EMAILS = (
+    {
+        "id": 1,
+        "from": "mathias@besafe.dk",
+        "to": "peter.hansen@microsoft.com",
+        "subject": "Tilbud på sikkerhedsløsninger - Microsoft Danmark",
+        "content": """Hej Peter,
 
 Jeg håber, du har haft en god uge. Som aftalt sender jeg dig et tilbud på vores sikkerhedsløsninger til Microsoft Danmark.
 
@@ -48,30 +54,30 @@ Mathias Jensen
 BeSafe Security Solutions
 Tlf: +45 70 12 34 56
 Email: mathias@besafe.dk""",
-            "received_at": "2024-01-15T10:30:00Z",
-            "conversation_id": "conv_001",
-            "email_thread": [
-                {
-                    "from": "peter.hansen@microsoft.com",
-                    "to": "mathias@besafe.dk",
-                    "subject": "Re: Sikkerhedsbehov - Microsoft Danmark",
-                    "content": """Hej Mathias, tak for mødet i går. Kan du sende mig et tilbud på jeres sikkerhedsløsninger?
+        "received_at": "2024-01-15T10:30:00Z",
+        "conversation_id": "conv_001",
+        "email_thread": [
+            {
+                "from": "peter.hansen@microsoft.com",
+                "to": "mathias@besafe.dk",
+                "subject": "Re: Sikkerhedsbehov - Microsoft Danmark",
+                "content": """Hej Mathias, tak for mødet i går. Kan du sende mig et tilbud på jeres sikkerhedsløsninger?
 
 Med venlig hilsen,
 Peter Hansen
 IT Security Manager
 Microsoft Danmark
 Tlf: +45 33 25 50 00""",
-                    "received_at": "2024-01-14T15:20:00Z",
-                }
-            ],
-        },
-        {
-            "id": 2,
-            "from": "mathias@besafe.dk",
-            "to": "anna.jensen@novonordisk.com",
-            "subject": "Forslag til sikkerhedsforbedringer - Novo Nordisk",
-            "content": """Kære Anna,
+                "received_at": "2024-01-14T15:20:00Z",
+            }
+        ],
+    },
+    {
+        "id": 2,
+        "from": "mathias@besafe.dk",
+        "to": "anna.jensen@novonordisk.com",
+        "subject": "Forslag til sikkerhedsforbedringer - Novo Nordisk",
+        "content": """Kære Anna,
 
 Tak for mødet i går. Som lovet sender jeg dig et forslag til sikkerhedsforbedringer for jeres nye kontor.
 
@@ -88,16 +94,16 @@ Kan du sende mig jeres feedback, så vi kan tilpasse løsningen?
 Bedste hilsner,
 Mathias
 BeSafe Security""",
-            "received_at": "2024-01-16T14:15:00Z",
-            "conversation_id": "conv_002",
-            "email_thread": [],
-        },
-        {
-            "id": 3,
-            "from": "mathias@besafe.dk",
-            "to": "mads.nielsen@maersk.com",
-            "subject": "Opfølgning på mødet - Maersk sikkerhedsprojekt",
-            "content": """Hej Mads,
+        "received_at": "2024-01-16T14:15:00Z",
+        "conversation_id": "conv_002",
+        "email_thread": [],
+    },
+    {
+        "id": 3,
+        "from": "mathias@besafe.dk",
+        "to": "mads.nielsen@maersk.com",
+        "subject": "Opfølgning på mødet - Maersk sikkerhedsprojekt",
+        "content": """Hej Mads,
 
 Tak for det gode møde i sidste uge om jeres sikkerhedsprojekt.
 
@@ -114,41 +120,41 @@ Med venlig hilsen,
 Mathias Jensen
 BeSafe Security Solutions
 Tlf: +45 70 12 34 56""",
-            "received_at": "2024-01-17T09:45:00Z",
-            "conversation_id": "conv_003",
-            "email_thread": [
-                {
-                    "from": "mads.nielsen@maersk.com",
-                    "to": "mathias@besafe.dk",
-                    "subject": "Re: Sikkerhedsprojekt - Maersk",
-                    "content": """Hej Mathias, tak for mødet. Kan du sende mig en detaljeret plan?
+        "received_at": "2024-01-17T09:45:00Z",
+        "conversation_id": "conv_003",
+        "email_thread": [
+            {
+                "from": "mads.nielsen@maersk.com",
+                "to": "mathias@besafe.dk",
+                "subject": "Re: Sikkerhedsprojekt - Maersk",
+                "content": """Hej Mathias, tak for mødet. Kan du sende mig en detaljeret plan?
 
 Med venlig hilsen,
 Mads Nielsen
 Head of IT Security
 Maersk Line
 Tlf: +45 33 63 33 63""",
-                    "received_at": "2024-01-16T11:30:00Z",
-                },
-                {
-                    "from": "mathias@besafe.dk",
-                    "to": "mads.nielsen@maersk.com",
-                    "subject": "Re: Sikkerhedsprojekt - Maersk",
-                    "content": """Hej Mads, jeg sender dig planen i morgen.
+                "received_at": "2024-01-16T11:30:00Z",
+            },
+            {
+                "from": "mathias@besafe.dk",
+                "to": "mads.nielsen@maersk.com",
+                "subject": "Re: Sikkerhedsprojekt - Maersk",
+                "content": """Hej Mads, jeg sender dig planen i morgen.
 
 Med venlig hilsen,
 Mathias Jensen
 BeSafe Security Solutions""",
-                    "received_at": "2024-01-16T16:45:00Z",
-                },
-            ],
-        },
-        {
-            "id": 4,
-            "from": "mathias@besafe.dk",
-            "to": "support@besafe.dk",
-            "subject": "IT Support - Printer problem",
-            "content": """Hej IT Support,
+                "received_at": "2024-01-16T16:45:00Z",
+            },
+        ],
+    },
+    {
+        "id": 4,
+        "from": "mathias@besafe.dk",
+        "to": "support@besafe.dk",
+        "subject": "IT Support - Printer problem",
+        "content": """Hej IT Support,
 
 Jeg har problemer med min printer. Den printer ikke korrekt og viser en fejlmeddelelse.
 
@@ -156,17 +162,17 @@ Kan I hjælpe mig med at løse dette?
 
 Tak,
 Mathias""",
-            "received_at": "2024-01-18T11:20:00Z",
-            "conversation_id": "conv_004",
-            "email_thread": [],
-        },
-        # DUPLICATE 1: Peter Hansen - same recipient, different subject
-        {
-            "id": 5,
-            "from": "mathias@besafe.dk",
-            "to": "peter.hansen@microsoft.com",
-            "subject": "Opfølgning på tilbud - Microsoft Danmark (DUPLICATE)",
-            "content": """Hej Peter,
+        "received_at": "2024-01-18T11:20:00Z",
+        "conversation_id": "conv_004",
+        "email_thread": [],
+    },
+    # DUPLICATE 1: Peter Hansen - same recipient, different subject
+    {
+        "id": 5,
+        "from": "mathias@besafe.dk",
+        "to": "peter.hansen@microsoft.com",
+        "subject": "Opfølgning på tilbud - Microsoft Danmark (DUPLICATE)",
+        "content": """Hej Peter,
 
 Jeg følger op på vores tidligere tilbud på sikkerhedsløsninger til Microsoft Danmark.
 
@@ -185,17 +191,17 @@ Mathias Jensen
 BeSafe Security Solutions
 Tlf: +45 70 12 34 56
 Email: mathias@besafe.dk""",
-            "received_at": "2024-01-20T10:30:00Z",
-            "conversation_id": "conv_001_dup",
-            "email_thread": [],
-        },
-        # DUPLICATE 2: Anna Jensen - same recipient, different subject
-        {
-            "id": 6,
-            "from": "mathias@besafe.dk",
-            "to": "anna.jensen@novonordisk.com",
-            "subject": "Opfølgning på sikkerhedsforbedringer - Novo Nordisk (DUPLICATE)",
-            "content": """Kære Anna,
+        "received_at": "2024-01-20T10:30:00Z",
+        "conversation_id": "conv_001_dup",
+        "email_thread": [],
+    },
+    # DUPLICATE 2: Anna Jensen - same recipient, different subject
+    {
+        "id": 6,
+        "from": "mathias@besafe.dk",
+        "to": "anna.jensen@novonordisk.com",
+        "subject": "Opfølgning på sikkerhedsforbedringer - Novo Nordisk (DUPLICATE)",
+        "content": """Kære Anna,
 
 Jeg følger op på vores tidligere forslag til sikkerhedsforbedringer for jeres nye kontor.
 
@@ -212,14 +218,85 @@ Det samlede budget er DKK 125.000 ekskl. moms.
 Bedste hilsner,
 Mathias
 BeSafe Security""",
-            "received_at": "2024-01-21T14:15:00Z",
-            "conversation_id": "conv_002_dup",
-            "email_thread": [],
-        },
-    ]
+        "received_at": "2024-01-21T14:15:00Z",
+        "conversation_id": "conv_002_dup",
+        "email_thread": [],
+    },
+)
+
+
+def load_sample_emails():
+    """Load sample emails for testing."""
+    print("📧 Loading sample emails...")
+
+    print(f"✅ Loaded {len(_SAMPLE_EMAILS)} sample emails")
+    return _SAMPLE_EMAILS
+
+
+async def _process_email(
+    i: int,
+    email_data: dict,
+    total: int,
+    user_id: str,
+    semaphore: asyncio.Semaphore,
+    ai_result: dict = None,
+) -> tuple:
+    """Process one sample email, returning its result and a printable report."""
+    lines = [f"\n📧 Email {i}/{total}: {email_data['to']} - {email_data['subject']}"]
+
+    async with semaphore:
+        try:
+            # Create orchestrator (loads tokens synchronously)
+            orchestrator = await asyncio.to_thread(AgentOrchestrator, user_id)
+
+            # Process email
+            result = await orchestrator.process_email(email_data, ai_result)
+
+            if result["success"]:
+                ai_result = result.get("ai_result")
+                pipedrive_result = result.get("pipedrive_result")
+                outcome = result.get("outcome")
+
+                lines.append(
+                    f"🤖 AI: {ai_result.get('is_sales_opportunity')} | {ai_result.get('confidence')} | {ai_result.get('person_name')} | {ai_result.get('organization_name')}"
+                )
+
+                if pipedrive_result:
+                    lines.append(
+                        f"📊 Pipedrive: Contact={pipedrive_result.get('contact_exists')} | Deals={len(pipedrive_result.get('deals', []))}"
+                    )
+
+                lines.append(f"🎯 Outcome: {outcome}")
+                lines.append(
+                    f"⏱️  Processing time: {result.get('processing_time', 0):.2f}s"
+                )
+
+                if pipedrive_result and pipedrive_result.get("deal_created"):
+                    lines.append(f"✅ New deal: {pipedrive_result['deal']['title']}")
+
+            else:
+                lines.append(f"❌ Processing failed: {result.get('error')}")
+
+        except Exception as e:
+            lines.append(f"❌ Error processing email: {str(e)}")
+            result = {"success": False, "error": str(e), "email_id": email_data["id"]}
+
+    lines.append("-" * 40)
+    return result, "\n".join(lines)
+
+
+async def _analyze_with_batch_api(emails) -> dict:
+    """Analyze the emails with one Batch API job, returning results by email id."""
+    analyzer = EmailAnalyzer()
+    batch_id = await analyzer.submit_batch_job(emails)
+    print(f"📦 Submitted batch job {batch_id}, waiting for results...")
+
+    job = await analyzer.wait_for_batch_job(batch_id)
+    results = job["results"] or {}
+    print(f"📦 Batch job {job['status']}: {len(results)}/{len(emails)} emails analyzed")
 
-    print(f"✅ Loaded {len(sample_emails)} sample emails")
-    return sample_emails
+    # Emails missing from the output fall back to individual analysis
+    return results
 
 
 async def test_production_agents():
@@ -227,9 +304,6 @@ async def test_production_agents():
     print("🚀 Testing Production Agents")
     print("=" * 60)
 
-    # Load environment variables
-    load_dotenv()
-
     # Check required environment variables
     required_vars = [
         "OPENROUTER_API_KEY",
@@ -249,52 +323,51 @@ async def test_production_agents():
     # Test user ID (you can change this to test with different users)
     test_user_id = "0babb68e-4bd5-4b2d-ac57-49826369178d"
 
-    results = []
+    # Larger runs can be analyzed up front through the discounted Batch API
+    ai_results = {}
+    if os.getenv("USE_BATCH_API") == "1" and len(sample_emails) >= BATCH_API_MIN_EMAILS:
+        ai_results = await _analyze_with_batch_api(sample_emails)
 
+    # Emails to the same recipient run in order, so the duplicate samples see
+    # the contact and deal created for the first one; recipients run in parallel
+    groups = {}
     for i, email_data in enumerate(sample_emails, 1):
-        print(
-            f"\n📧 Email {i}/{len(sample_emails)}: {email_data['to']} - {email_data['subject']}"
-        )
-
-        try:
-            # Create orchestrator
-            orchestrator = AgentOrchestrator(test_user_id)
-
-            # Process email
-            result = await orchestrator.process_email(email_data)
-
-            if result["success"]:
-                ai_result = result.get("ai_result")
-                pipedrive_result = result.get("pipedrive_result")
-                outcome = result.get("outcome")
-
-                print(
-                    f"🤖 AI: {ai_result.get('is_sales_opportunity')} | {ai_result.get('confidence')} | {ai_result.get('person_name')} | {ai_result.get('organization_name')}"
-                )
-
-                if pipedrive_result:
-                    print(
-                        f"📊 Pipedrive: Contact={pipedrive_result.get('contact_exists')} | Deals={len(pipedrive_result.get('deals', []))}"
-                    )
-
-                print(f"🎯 Outcome: {outcome}")
-                print(f"⏱️  Processing time: {result.get('processing_time', 0):.2f}s")
-
-                if pipedrive_result and pipedrive_result.get("deal_created"):
-                    print(f"✅ New deal: {pipedrive_result['deal']['title']}")
-
-            else:
-                print(f"❌ Processing failed: {result.get('error')}")
-
-            results.append(result)
-
-        except Exception as e:
-            print(f"❌ Error processing email: {str(e)}")
-            results.append(
-                {"success": False, "error": str(e), "email_id": email_data["id"]}
+        groups.setdefault(email_data["to"].lower(), []).append((i, email_data))
+
+    semaphore = asyncio.Semaphore(int(os.getenv("EMAIL_CONCURRENCY", "10")))
+
+    async def process_group(group):
+        return [
+            (
+                i,
+                await _process_email(
+                    i,
+                    email_data,
+                    len(sample_emails),
+                    test_user_id,
+                    semaphore,
+                    ai_results.get(str(email_data["id"])),
+                ),
             )
+            for i, email_data in group
+        ]
 
-        print("-" * 40)
+    group_results = await asyncio.gather(
+        *(process_group(group) for group in groups.values())
+    )
+    processed = [
+        outcome
+        for _, outcome in sorted(
+            (item for group in group_results for item in group),
+            key=lambda item: item[0],
+        )
+    ]
+
+    # Print the reports once processing is done, in email order
+    results = []
+    for result, report in processed:
+        print(report)
+        results.append(result)
 
     # Analyze results
     analyze_results(results)
@@ -306,58 +379,49 @@ def analyze_results(results: list):
     print("=" * 60)
 
     total_emails = len(results)
-    successful_processing = sum(
-        1 for r in results if r is not None and r.get("success")
-    )
-    sales_opportunities = sum(
-        1
-        for r in results
-        if r is not None
-        and r.get("success")
-        and r.get("ai_result", {}).get("is_sales_opportunity", False)
-    )
-    deals_created = sum(
-        1
-        for r in results
-        if r is not None
-        and r.get("success")
-        and r.get("pipedrive_result") is not None
-        and r.get("pipedrive_result", {}).get("deal_created", False)
-    )
-    contacts_created = sum(
-        1
-        for r in results
-        if r is not None
-        and r.get("success")
-        and r.get("pipedrive_result") is not None
-        and r.get("pipedrive_result", {}).get("contact_created", False)
-    )
-    deals_updated = sum(
-        1
-        for r in results
-        if r is not None
-        and r.get("success")
-        and r.get("pipedrive_result") is not None
-        and r.get("pipedrive_result", {}).get("deal_updated", False)
-    )
-
-    # Count outcomes
-    outcome_counts = {}
+    successful_processing = 0
+    sales_opportunities = 0
+    deals_created = 0
+    contacts_created = 0
+    deals_updated = 0
+    outcome_counts = Counter()
+
+    # Tally everything in one pass over the results
     for result in results:
-        if result is not None and result.get("success"):
-            outcome = result.get("outcome", "Unknown")
-            outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
+        if result is None or not result.get("success"):
+            continue
+
+        successful_processing += 1
+        sales_opportunities += bool(
+            result.get("ai_result", {}).get("is_sales_opportunity", False)
+        )
+        outcome_counts[result.get("outcome", "Unknown")] += 1
+
+        pipedrive_result = result.get("pipedrive_result")
+        if pipedrive_result is not None:
+            deals_created += bool(pipedrive_result.get("deal_created", False))
+            contacts_created += bool(pipedrive_result.get("contact_created", False))
+            deals_updated += bool(pipedrive_result.get("deal_updated", False))
 
     print(
         f"📈 {total_emails} emails | {successful_processing} processed | {sales_opportunities} opportunities | {deals_created} deals created | {contacts_created} contacts created | {deals_updated} deals updated"
     )
 
     print(f"\n🎯 OUTCOMES:")
-    for outcome, count in outcome_counts.items():
+    for outcome, count in outcome_counts.most_common():
         print(f"  {outcome}: {count}")
 
     print(f"\n✅ Production agents test completed!")
 
 
 if __name__ == "__main__":
-    asyncio.run(test_production_agents())
+    # uvloop ships with uvicorn[standard] on non-Windows platforms
+    try:
+        import uvloop
+
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(test_production_agents())
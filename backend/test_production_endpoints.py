@@ -15,13 +15,9 @@ import asyncio
 import os
 import sys
 import httpx
-import json
+import orjson
 from datetime import datetime
 from typing import Dict, Any, List
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 
 class ProductionEndpointTester:
@@ -33,15 +29,23 @@ class ProductionEndpointTester:
         self.results = []
         self.session = None
 
+        # Each result is appended here as soon as it is recorded
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.results_path = f"production_test_results_{self.timestamp}.jsonl"
+        self._results_file = None
+
     async def __aenter__(self):
         """Async context manager entry."""
         self.session = httpx.AsyncClient(timeout=30.0)
+        self._results_file = open(self.results_path, "ab")
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit."""
         if self.session:
             await self.session.aclose()
+        if self._results_file:
+            self._results_file.close()
 
     async def test_endpoint(
         self,
@@ -101,8 +105,15 @@ class ProductionEndpointTester:
             }
 
         self.results.append(result)
+        self._write_result(result)
         return result
 
+    def _write_result(self, result: Dict[str, Any]):
+        """Append a single result to the JSONL results file."""
+        if self._results_file:
+            self._results_file.write(orjson.dumps(result) + b"\n")
+            self._results_file.flush()
+
     async def test_health_endpoints(self):
         """Test all health check endpoints."""
         print("🏥 Testing health endpoints...")
@@ -280,32 +291,30 @@ class ProductionEndpointTester:
         print(f"\n" + "=" * 80)
 
     def save_results(self, filename: str = None):
-        """Save test results to a JSON file."""
+        """Save the test run summary next to the streamed JSONL results."""
         if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"production_test_results_{timestamp}.json"
-
-        with open(filename, "w") as f:
-            json.dump(
-                {
-                    "test_run": {
-                        "timestamp": datetime.now().isoformat(),
-                        "base_url": self.base_url,
-                        "total_tests": len(self.results),
-                        "successful_tests": sum(
-                            1 for r in self.results if r.get("success", False)
-                        ),
-                        "failed_tests": sum(
-                            1 for r in self.results if not r.get("success", False)
-                        ),
-                    },
-                    "results": self.results,
-                },
-                f,
-                indent=2,
-            )
+            filename = f"production_test_results_{self.timestamp}_summary.json"
+
+        results_data = {
+            "test_run": {
+                "timestamp": datetime.now().isoformat(),
+                "base_url": self.base_url,
+                "total_tests": len(self.results),
+                "successful_tests": sum(
+                    1 for r in self.results if r.get("success", False)
+                ),
+                "failed_tests": sum(
+                    1 for r in self.results if not r.get("success", False)
+                ),
+            },
+            "results_file": self.results_path,
+        }
+
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(results_data, option=orjson.OPT_INDENT_2))
 
-        print(f"\n💾 Test results saved to: {filename}")
+        print(f"\n💾 Test results saved to: {self.results_path}")
+        print(f"💾 Test summary saved to: {filename}")
 
 
 async def main():
@@ -313,6 +322,11 @@ async def main():
     print("🚀 Starting Production Backend Endpoint Tests")
     print("=" * 60)
 
+    # Load environment variables
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
     # Get production URL from environment or use default
     production_url = os.getenv("PRODUCTION_BACKEND_URL")
     if not production_url:
@@ -333,7 +347,8 @@ async def main():
 
         # Print and save results
         tester.print_results()
-        tester.save_results()
+        # Write the summary off the event loop
+        await asyncio.to_thread(tester.save_results)
 
     print("\n✨ Testing complete!")
 
@@ -9,10 +9,6 @@ import asyncio
 import os
 import sys
 import httpx
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
 
 
 async def test_user_tokens_endpoint(user_id: str, base_url: str = None):
@@ -96,6 +92,11 @@ async def main():
             "⚠️  Using default test user ID. Pass your user ID as argument to test with your tokens."
         )
 
+    # Load environment variables
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
     # Get production URL
     production_url = os.getenv("PRODUCTION_BACKEND_URL")
     if not production_url:
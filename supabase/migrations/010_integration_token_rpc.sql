@@ -0,0 +1,28 @@
+-- Migration 010: Single round-trip read/refresh of integration tokens
+-- Returns the integration row and, when new tokens are supplied, stores them in the same call
+
+CREATE OR REPLACE FUNCTION get_or_refresh_integration(
+    p_user_id uuid,
+    p_provider text,
+    p_new_access text DEFAULT NULL,
+    p_new_expires timestamptz DEFAULT NULL,
+    p_new_refresh text DEFAULT NULL
+)
+RETURNS SETOF "public"."integrations" AS $$
+BEGIN
+    IF p_new_access IS NULL THEN
+        RETURN QUERY
+        SELECT * FROM "public"."integrations"
+        WHERE "user_id" = p_user_id AND "provider" = p_provider;
+    ELSE
+        RETURN QUERY
+        UPDATE "public"."integrations"
+        SET "access_token" = p_new_access,
+            "refresh_token" = COALESCE(p_new_refresh, "refresh_token"),
+            "token_expires_at" = COALESCE(p_new_expires, "token_expires_at"),
+            "updated_at" = NOW()
+        WHERE "user_id" = p_user_id AND "provider" = p_provider
+        RETURNING *;
+    END IF;
+END;
+$$ language 'plpgsql';
@@ -352,6 +352,38 @@ CREATE TRIGGER update_webhook_subscriptions_updated_at BEFORE UPDATE ON webhook_
 CREATE TRIGGER update_rate_limit_windows_updated_at BEFORE UPDATE ON rate_limit_windows
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- =============================================================================
+-- FUNCTIONS
+-- RPC helpers called from the backend
+-- =============================================================================
+
+-- Read an integration and optionally store refreshed tokens in one round-trip
+CREATE OR REPLACE FUNCTION get_or_refresh_integration(
+    p_user_id uuid,
+    p_provider text,
+    p_new_access text DEFAULT NULL,
+    p_new_expires timestamptz DEFAULT NULL,
+    p_new_refresh text DEFAULT NULL
+)
+RETURNS SETOF "public"."integrations" AS $$
+BEGIN
+    IF p_new_access IS NULL THEN
+        RETURN QUERY
+        SELECT * FROM "public"."integrations"
+        WHERE "user_id" = p_user_id AND "provider" = p_provider;
+    ELSE
+        RETURN QUERY
+        UPDATE "public"."integrations"
+        SET "access_token" = p_new_access,
+            "refresh_token" = COALESCE(p_new_refresh, "refresh_token"),
+            "token_expires_at" = COALESCE(p_new_expires, "token_expires_at"),
+            "updated_at" = NOW()
+        WHERE "user_id" = p_user_id AND "provider" = p_provider
+        RETURNING *;
+    END IF;
+END;
+$$ language 'plpgsql';
+
 -- =============================================================================
 -- COMMENTS
 -- Documentation for columns and tables
@@ -420,4 +452,5 @@ MIGRATION HISTORY:
 - 007: Additional webhook subscription columns
 - 008: Webhook subscription column fixes
 - 009: Monitoring tables (cost_records, performance_metrics, system_metrics, rate_limit_records, rate_limit_windows)
+- 010: get_or_refresh_integration RPC for single round-trip token reads and refreshes
 */ 
\ No newline at end of file